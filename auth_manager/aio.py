@@ -0,0 +1,145 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .manager import OTPManager
+
+
+class AsyncOTPManager:
+    """
+    An asyncio front end to OTPManager that never blocks the event loop on disk.
+
+    Mutations and loading run on a single background thread, in the order they
+    were made, and the mutation coroutines return once their change is on disk.
+    Changes made while a write is in progress are merged into the next write, so
+    any number of concurrent mutations costs one write per round. Reading codes
+    only touches memory, so those methods run inline.
+
+    Example:
+        manager = await AsyncOTPManager.open("services.json")
+        await asyncio.gather(*(manager.add_service(n, u) for n, u in imported))
+        code = await manager.get_code("GitHub")
+        await manager.close()
+
+    Attributes:
+        manager (OTPManager): The wrapped manager. It must not be mutated directly
+            while this object is in use.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="async-otp-manager")
+        # An open batch keeps the manager from writing on its own; writes are
+        # issued here instead, from the executor.
+        self._hold = manager.batch()
+        self._hold.__enter__()
+        self._next_write = None
+        self._writer = None
+
+    @classmethod
+    async def open(cls, *args, **kwargs):
+        """
+        Creates the OTPManager, loading the vault in the executor.
+
+        Args:
+            *args: Passed to OTPManager.
+            **kwargs: Passed to OTPManager.
+
+        Returns:
+            AsyncOTPManager: The manager.
+        """
+        loop = asyncio.get_running_loop()
+        manager = await loop.run_in_executor(None, partial(OTPManager, *args, **kwargs))
+        return cls(manager)
+
+    @property
+    def services(self):
+        return self.manager.services
+
+    async def close(self):
+        """
+        Waits for pending writes, then closes the wrapped manager.
+        """
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+        await self._run(self._release)
+        self._executor.shutdown()
+
+    async def load_services(self):
+        await self._run(self.manager.load_services)
+
+    async def add_service(self, name, uri):
+        await self._run(self.manager.add_service, name, uri)
+        await self._persist()
+
+    async def add_services(self, services):
+        """
+        Adds or replaces many services; see OTPManager.add_services.
+        """
+        await self._run(self.manager.add_services, services)
+        await self._persist()
+
+    async def import_stream(self, source, format=None, processes=None):
+        """
+        Imports services in the executor; see OTPManager.import_stream.
+        """
+        report = await self._run(self.manager.import_stream, source, format, processes)
+        await self._persist()
+        return report
+
+    async def edit_service(self, old_name, new_name, new_uri):
+        await self._run(self.manager.edit_service, old_name, new_name, new_uri)
+        await self._persist()
+
+    async def delete_service(self, name):
+        await self._run(self.manager.delete_service, name)
+        await self._persist()
+
+    async def delete_services(self, names):
+        await self._run(self.manager.delete_services, list(names))
+        await self._persist()
+
+    async def get_code(self, name, at=None):
+        return self.manager.get_code(name, at=at)
+
+    async def get_next_code(self, name):
+        return self.manager.get_next_code(name)
+
+    async def verify(self, name, code, window=1, at=None):
+        return self.manager.verify(name, code, window=window, at=at)
+
+    async def search(self, query, limit=None):
+        return self.manager.search(query, limit)
+
+    def _run(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(function, *args)
+        )
+
+    async def _persist(self):
+        """
+        Waits until the changes made so far are written. Callers arriving while a
+        write is running share the write that follows it.
+        """
+        if self._next_write is None:
+            self._next_write = asyncio.get_running_loop().create_future()
+            if self._writer is None:
+                self._writer = asyncio.create_task(self._write_pending())
+        await asyncio.shield(self._next_write)
+
+    async def _write_pending(self):
+        try:
+            while self._next_write is not None:
+                done, self._next_write = self._next_write, None
+                try:
+                    await self._run(self.manager.flush)
+                except Exception as error:
+                    done.set_exception(error)
+                else:
+                    done.set_result(None)
+        finally:
+            self._writer = None
+
+    def _release(self):
+        self._hold.__exit__(None, None, None)
+        self.manager.close()
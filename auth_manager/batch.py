@@ -0,0 +1,93 @@
+import hmac
+from collections import defaultdict
+
+import numpy as np
+
+from .totp import STEAM_ALPHABET
+
+
+def generate_codes(generators, counters=None, times=None):
+    """
+    Generates codes for many generators over many time steps at once.
+
+    One HMAC is computed per (key, counter), with each key set up only once; dynamic
+    truncation, the modulo and the zero padding then run as vectorized NumPy
+    operations over each group of generators sharing the same algorithm, digits,
+    period and encoder.
+
+    Args:
+        generators (list): The CompiledTOTP generators, one per row.
+        counters (array-like, optional): The time step counters, one per column.
+        times (array-like, optional): Unix times, one per column, converted to
+            counters with each generator's own period. Exactly one of `counters`
+            and `times` must be given.
+
+    Returns:
+        numpy.ndarray: A (len(generators), len(columns)) array of code strings.
+    """
+    if (counters is None) == (times is None):
+        raise ValueError("Pass exactly one of counters or times")
+    columns = np.asarray(counters if times is None else times, dtype=np.int64)
+    if columns.ndim != 1:
+        raise ValueError("counters and times must be one-dimensional")
+    if (columns < 0).any():
+        raise ValueError("counters and times must not be negative")
+
+    groups = defaultdict(list)
+    for row, generator in enumerate(generators):
+        period = generator.period if times is not None else None
+        key = (generator.algorithm, generator.digits, period, generator.encoder)
+        groups[key].append(row)
+
+    width = max((generator.digits for generator in generators), default=6)
+    codes = np.empty((len(generators), len(columns)), dtype=f"<U{width}")
+    for (algorithm, digits, period, encoder), rows in groups.items():
+        steps = columns if period is None else columns // period
+        messages = [step.to_bytes(8, "big") for step in steps.tolist()]
+        digests = b"".join(
+            _digests(generators[row].key, algorithm, messages) for row in rows
+        )
+        codes[rows] = _truncate(digests, len(rows), len(messages), digits, encoder)
+    return codes
+
+
+def _digests(key, algorithm, messages):
+    """
+    Returns the concatenated HMACs of one key over all messages, keying it once.
+    """
+    keyed = hmac.new(key, digestmod=algorithm)
+    digests = []
+    for message in messages:
+        mac = keyed.copy()
+        mac.update(message)
+        digests.append(mac.digest())
+    return b"".join(digests)
+
+
+def _truncate(digests, rows, columns, digits, encoder=None):
+    """
+    Applies RFC 4226 dynamic truncation to a buffer of concatenated HMAC digests,
+    then encodes the values as decimal or Steam Guard codes.
+    """
+    hashes = np.frombuffer(digests, dtype=np.uint8).reshape(rows, columns, -1)
+    offsets = (hashes[..., -1] & 0xF).astype(np.intp)
+    window = np.take_along_axis(
+        hashes, offsets[..., None] + np.arange(4), axis=-1
+    ).astype(np.uint32)
+    values = (
+        (window[..., 0] & 0x7F) << 24
+        | window[..., 1] << 16
+        | window[..., 2] << 8
+        | window[..., 3]
+    )
+    # The characters as ASCII bytes, one fixed-width string per code: zero-padded
+    # decimal digits, or the value in base 26, least significant digit first.
+    if encoder == "steam":
+        alphabet = STEAM_ALPHABET
+        powers = 26 ** np.arange(digits, dtype=np.uint32)
+    else:
+        alphabet = "0123456789"
+        powers = 10 ** np.arange(digits - 1, -1, -1, dtype=np.uint32)
+    symbols = np.frombuffer(alphabet.encode(), dtype=np.uint8)
+    characters = symbols[(values[..., None] // powers) % len(alphabet)]
+    return characters.view(f"S{digits}")[..., 0].astype(f"<U{digits}")
@@ -0,0 +1,305 @@
+import argparse
+import getpass
+import os
+import sys
+
+from .manager import OTPManager
+from .metrics import registry, to_json, to_prometheus
+from .storage import ShardedStorage, SQLiteStorage
+
+# Vault files with these extensions are opened with the SQLite backend, those with
+# the encrypted extension as encrypted vaults, and directories with the sharded
+# extension as sharded vaults.
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+ENCRYPTED_EXTENSION = ".vault"
+SHARDED_EXTENSION = ".shards"
+
+
+def build_parser():
+    """
+    Returns the argument parser of the command line interface.
+    """
+    parser = argparse.ArgumentParser(
+        prog="auth-manager", description="Print and manage TOTP codes."
+    )
+    parser.add_argument(
+        "--vault",
+        help="The vault file; a .db or .sqlite file is opened as an SQLite vault, "
+        "a .shards directory as a sharded vault, and a .vault file as an encrypted "
+        "vault, whose passphrase is read from $AUTH_MANAGER_PASSPHRASE or prompted "
+        "for. Defaults to the vault used by the GUI.",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="Record timings and counters, and write them to FILE when the command "
+        "ends: as JSON for a .json file, in the Prometheus text format otherwise, or "
+        'to standard error for "-".',
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    code = commands.add_parser("code", help="Print the current code of a service.")
+    code.add_argument("name")
+    code.add_argument(
+        "--next", action="store_true", help="Print the code of the next time step."
+    )
+
+    listing = commands.add_parser("list", help="List the services.")
+    listing.add_argument(
+        "query", nargs="?", default="", help="Only list the services matching it."
+    )
+
+    add = commands.add_parser("add", help="Add or replace a service.")
+    add.add_argument("name")
+    add.add_argument("uri")
+
+    remove = commands.add_parser("rm", help="Delete services.")
+    remove.add_argument("names", nargs="+")
+
+    verify = commands.add_parser(
+        "verify", help="Check a code; the exit status is 0 if it is valid."
+    )
+    verify.add_argument("name")
+    verify.add_argument("code")
+    verify.add_argument(
+        "--window",
+        type=int,
+        default=1,
+        help="The number of time steps of clock drift accepted (default: 1).",
+    )
+
+    formats = ("uri", "ndjson", "json", "csv")
+    load = commands.add_parser(
+        "import", help="Import services from a file of URIs, NDJSON, JSON or CSV."
+    )
+    load.add_argument("file", help='The file to read, or "-" for standard input.')
+    load.add_argument(
+        "--format",
+        choices=formats,
+        help="The format of the file. Defaults to its extension or its first line.",
+    )
+
+    dump = commands.add_parser("export", help="Export the services to a file.")
+    dump.add_argument("file", help='The file to write, or "-" for standard output.')
+    dump.add_argument(
+        "--format",
+        choices=formats,
+        help="The format of the file. Defaults to its extension, or ndjson.",
+    )
+
+    serve = commands.add_parser(
+        "serve", help="Run the daemon serving codes over a Unix socket."
+    )
+    serve.add_argument(
+        "--socket", help="The socket path. Defaults to a per-user runtime socket."
+    )
+
+    sync = commands.add_parser(
+        "sync",
+        help="Exchange the services that differ with another vault, or with the "
+        "vault served by the daemon if none is given.",
+    )
+    sync.add_argument("other", nargs="?", help="The other vault file.")
+    sync.add_argument(
+        "--socket", help="The daemon's socket path, to sync with its vault."
+    )
+    sync.add_argument(
+        "--conflicts",
+        choices=("report", "ours", "theirs", "newest"),
+        default="report",
+        help="How to settle services whose URIs differ: list them and leave them "
+        "(the default), keep this vault's, the other's, or the last written one's.",
+    )
+    sync.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only list the differences: < for services only in this vault, > only "
+        "in the other, ~ in both with different URIs.",
+    )
+
+    metrics = commands.add_parser(
+        "metrics", help="Print the metrics of a daemon started with --metrics."
+    )
+    metrics.add_argument(
+        "--socket", help="The socket path. Defaults to a per-user runtime socket."
+    )
+    metrics.add_argument(
+        "--format", choices=("prometheus", "json"), default="prometheus"
+    )
+    return parser
+
+
+def open_manager(vault):
+    """
+    Opens the manager on the given vault file, or on the default vault.
+
+    Args:
+        vault (str): The path of the vault, or None.
+
+    Returns:
+        OTPManager: The manager.
+
+    Raises:
+        OSError: If the vault exists but cannot be read.
+        ValueError: If the passphrase of an encrypted vault is wrong.
+    """
+    if vault and vault.endswith(ENCRYPTED_EXTENSION):
+        from .encrypted import EncryptedStorage
+
+        passphrase = os.environ.get("AUTH_MANAGER_PASSPHRASE")
+        if passphrase is None:
+            passphrase = getpass.getpass("Vault passphrase: ")
+        return OTPManager(storage=EncryptedStorage(vault, passphrase))
+    if vault and vault.endswith(SQLITE_EXTENSIONS):
+        return OTPManager(storage=SQLiteStorage(vault))
+    if vault and vault.rstrip(os.sep).endswith(SHARDED_EXTENSION):
+        return OTPManager(storage=ShardedStorage(vault))
+    return OTPManager(data_file=vault)
+
+
+def main(argv=None):
+    """
+    Runs the ``auth-manager`` command, which prints codes and manages the vault from
+    a shell. It never imports tkinter, so a command costs little more than starting
+    the interpreter.
+
+    Example:
+        auth-manager add GitHub "otpauth://totp/GitHub?secret=JBSWY3DPEHPK3PXP"
+        auth-manager code GitHub
+
+    Args:
+        argv (list, optional): The arguments, without the program name. Defaults to
+            sys.argv[1:].
+
+    Returns:
+        int: The exit status: 0 on success, 1 if a service is missing or a code is
+            invalid or an import skipped entries or a sync left conflicts, 2 on
+            usage errors.
+    """
+    args = build_parser().parse_args(argv)
+    if args.command == "metrics":
+        return _print_metrics(args)
+    if args.metrics:
+        registry.enable()
+    try:
+        manager = open_manager(args.vault)
+    except (OSError, ValueError) as error:
+        print(f"auth-manager: {error}", file=sys.stderr)
+        return 2
+    try:
+        try:
+            return _run(manager, args)
+        finally:
+            # Closing retries a write that failed, so it can fail the same way.
+            manager.close()
+    except (OSError, ValueError) as error:
+        print(f"auth-manager: {error}", file=sys.stderr)
+        return 2
+    finally:
+        if args.metrics:
+            registry.dump(args.metrics)
+
+
+def _sync(manager, args):
+    if args.other:
+        other = open_manager(args.other)
+        peer = other
+    else:
+        from .client import Client
+        from .sync import SocketPeer
+
+        other = Client(args.socket)
+        peer = SocketPeer(other)
+    try:
+        if args.dry_run:
+            diff = manager.diff(peer)
+            for mark, names in (
+                ("<", diff.only_here),
+                (">", diff.only_there),
+                ("~", diff.different),
+            ):
+                for name in names:
+                    print(f"{mark} {name}")
+            return 0
+        report = manager.sync(peer, args.conflicts)
+    finally:
+        other.close()
+    for name in report.conflicts:
+        print(f"auth-manager: conflict on {name!r}", file=sys.stderr)
+    print(f"sent {len(report.sent)}, received {len(report.received)} services")
+    return 1 if report.conflicts else 0
+
+
+def _print_metrics(args):
+    from .client import Client
+
+    try:
+        with Client(args.socket) as client:
+            snapshot = client.metrics()
+    except OSError as error:
+        print(f"auth-manager: cannot reach the daemon: {error}", file=sys.stderr)
+        return 2
+    print(
+        to_json(snapshot) if args.format == "json" else to_prometheus(snapshot), end=""
+    )
+    return 0
+
+
+def _run(manager, args):
+    if args.command == "list":
+        for name in manager.search(args.query):
+            print(name)
+        return 0
+
+    if args.command == "serve":
+        from .daemon import serve
+
+        serve(manager, args.socket)
+        return 0
+
+    if args.command == "import":
+        source = sys.stdin if args.file == "-" else args.file
+        report = manager.import_stream(source, args.format)
+        for line, message in report.errors:
+            print(f"auth-manager: {args.file}:{line}: {message}", file=sys.stderr)
+        print(f"imported {report.imported} services")
+        return 1 if report.errors else 0
+
+    if args.command == "export":
+        target = sys.stdout if args.file == "-" else args.file
+        manager.export_stream(target, args.format)
+        return 0
+
+    if args.command == "sync":
+        return _sync(manager, args)
+
+    if args.command == "add":
+        manager.add_service(args.name, args.uri)
+        return 0
+
+    if args.command == "rm":
+        missing = [name for name in args.names if name not in manager.services]
+        manager.delete_services(args.names)
+        for name in missing:
+            print(f"auth-manager: no service named {name!r}", file=sys.stderr)
+        return 1 if missing else 0
+
+    if args.name not in manager.services:
+        print(f"auth-manager: no service named {args.name!r}", file=sys.stderr)
+        return 1
+
+    if args.command == "code":
+        if args.next:
+            print(manager.get_next_code(args.name))
+        else:
+            print(manager.get_code(args.name))
+        return 0
+
+    # verify
+    valid = manager.verify(args.name, args.code, window=args.window)
+    print("valid" if valid else "invalid")
+    return 0 if valid else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import asyncio
+import collections
+import json
+import os
+import socket
+import tempfile
+
+
+def default_socket_path():
+    """
+    Returns the Unix socket path the daemon listens on by default: the
+    AUTH_MANAGER_SOCKET environment variable if it is set, otherwise a per-user
+    socket in $XDG_RUNTIME_DIR or the temporary directory.
+    """
+    path = os.environ.get("AUTH_MANAGER_SOCKET")
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"auth-manager-{os.getuid()}.sock")
+
+
+def encode_request(*fields):
+    """
+    Encodes one request of the daemon's line protocol: the command and its
+    arguments, separated by tabs and terminated by a newline.
+
+    Raises:
+        ValueError: If a field contains a tab or a newline.
+    """
+    fields = [str(field) for field in fields]
+    for field in fields:
+        if "\t" in field or "\n" in field:
+            raise ValueError(f"Field {field!r} contains a tab or newline")
+    return ("\t".join(fields) + "\n").encode()
+
+
+def decode_reply(line):
+    """
+    Decodes one reply line: ``ok<TAB>value`` or ``err<TAB>message``.
+
+    Returns:
+        str: The value.
+
+    Raises:
+        ValueError: If the daemon answered with an error.
+        ConnectionError: If the connection was closed before the reply.
+    """
+    if not line.endswith(b"\n"):
+        raise ConnectionError("The daemon closed the connection")
+    status, _, value = line[:-1].decode().partition("\t")
+    if status != "ok":
+        raise ValueError(value)
+    return value
+
+
+class Client:
+    """
+    A blocking client for the auth-manager daemon.
+
+    Each method sends one request and waits for its reply; `pipeline` sends many
+    requests at once and then reads all the replies, in order.
+
+    Example:
+        with Client() as client:
+            code = client.code("GitHub")
+
+    Attributes:
+        path (str): The path of the daemon's socket.
+    """
+
+    def __init__(self, path=None, timeout=5.0):
+        self.path = path or default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(self.path)
+        self._reader = self._socket.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def request(self, *fields):
+        """
+        Sends one request and returns the raw value of its reply.
+        """
+        self._socket.sendall(encode_request(*fields))
+        return decode_reply(self._reader.readline())
+
+    def pipeline(self, requests):
+        """
+        Sends many requests in a single write, then reads their replies.
+
+        Args:
+            requests (iterable): The requests, each a tuple of fields such as
+                ("code", "GitHub").
+
+        Returns:
+            list: The raw value of each reply, in order.
+
+        Raises:
+            ValueError: If one of the requests failed; all replies are read first.
+        """
+        requests = [encode_request(*fields) for fields in requests]
+        self._socket.sendall(b"".join(requests))
+        lines = [self._reader.readline() for _ in requests]
+        return [decode_reply(line) for line in lines]
+
+    def code(self, name, at=None):
+        """
+        Returns the code of a service, or None if it does not exist.
+        """
+        fields = ("code", name) if at is None else ("code", name, at)
+        return self.request(*fields) or None
+
+    def next_code(self, name):
+        """
+        Returns the code of a service for the next time step, or None.
+        """
+        return self.request("next", name) or None
+
+    def verify(self, name, code, window=1):
+        """
+        Checks a code with the daemon's replay protection; see OTPManager.verify.
+        """
+        return self.request("verify", name, code, window) == "1"
+
+    def list(self, query=""):
+        """
+        Returns the names of the services matching the query, or of all services.
+        """
+        value = self.request("list", query)
+        return value.split("\t") if value else []
+
+    def metrics(self):
+        """
+        Returns the daemon's metrics, as from Registry.snapshot. They are only
+        recorded if the daemon was started with metrics enabled.
+        """
+        return json.loads(self.request("metrics"))
+
+
+class AsyncClient:
+    """
+    An asyncio client for the auth-manager daemon.
+
+    Requests from concurrent tasks are pipelined over the one connection: each is
+    written as soon as it is made, and a reader task hands the replies, which come
+    back in order, to the waiting requests.
+
+    Example:
+        client = await AsyncClient.connect()
+        codes = await asyncio.gather(*(client.code(name) for name in names))
+        await client.close()
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._waiting = collections.deque()
+        self._read_task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def connect(cls, path=None):
+        """
+        Connects to the daemon.
+
+        Args:
+            path (str, optional): The socket path. Defaults to default_socket_path().
+
+        Returns:
+            AsyncClient: The connected client.
+        """
+        reader, writer = await asyncio.open_unix_connection(
+            path or default_socket_path()
+        )
+        return cls(reader, writer)
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        await self._read_task
+
+    async def request(self, *fields):
+        """
+        Sends one request and returns the raw value of its reply.
+        """
+        data = encode_request(*fields)
+        if self._read_task.done():
+            raise ConnectionError("The daemon closed the connection")
+        reply = asyncio.get_running_loop().create_future()
+        self._waiting.append(reply)
+        self._writer.write(data)
+        await self._writer.drain()
+        return await reply
+
+    async def code(self, name, at=None):
+        fields = ("code", name) if at is None else ("code", name, at)
+        return await self.request(*fields) or None
+
+    async def next_code(self, name):
+        return await self.request("next", name) or None
+
+    async def verify(self, name, code, window=1):
+        return await self.request("verify", name, code, window) == "1"
+
+    async def list(self, query=""):
+        value = await self.request("list", query)
+        return value.split("\t") if value else []
+
+    async def metrics(self):
+        return json.loads(await self.request("metrics"))
+
+    async def _read_replies(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line.endswith(b"\n"):
+                    break
+                reply = self._waiting.popleft()
+                if reply.cancelled():
+                    continue
+                try:
+                    reply.set_result(decode_reply(line))
+                except ValueError as error:
+                    reply.set_exception(error)
+        except ConnectionError:
+            pass
+        finally:
+            while self._waiting:
+                reply = self._waiting.popleft()
+                if not reply.cancelled():
+                    reply.set_exception(
+                        ConnectionError("The daemon closed the connection")
+                    )
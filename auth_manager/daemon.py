@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+
+from .client import default_socket_path
+from .metrics import registry
+from .sync import LocalPeer
+
+# How much a connection reads at once. Every complete request in a read is
+# answered with a single write, so pipelined requests cost one syscall per batch.
+READ_SIZE = 64 * 1024
+
+# A connection whose unterminated request grows beyond this is dropped.
+MAX_LINE = 64 * 1024
+
+# How often the vault is checked for changes made by other processes, in seconds.
+RELOAD_INTERVAL = 1.0
+
+# The commands that write the vault, answered on the default executor.
+WRITE_COMMANDS = {b"sync-put"}
+
+# The errors of a bad request, replied to with ``err`` instead of dropping the
+# connection. OSError is a failed write; the changes stay pending then.
+REQUEST_ERRORS = (TypeError, ValueError, IndexError, KeyError, OSError)
+
+
+class CodeServer:
+    """
+    Serves codes from an in-memory OTPManager over a Unix domain socket.
+
+    The protocol is line based. A request is a command and its arguments separated
+    by tabs, ended by a newline; the reply is ``ok<TAB>value`` or ``err<TAB>message``
+    on one line. Replies come back in request order, so a client may pipeline any
+    number of requests before reading. The commands are:
+
+        code NAME [TIME]          The code of a service, empty if it does not exist.
+        next NAME                 The code for the next time step.
+        verify NAME CODE [WINDOW] 1 if the code is valid and unused, 0 otherwise.
+        list [QUERY]              The names of the services matching the query.
+        metrics                   The daemon's metrics, as one line of JSON.
+        ping                      pong
+
+    and, for sync.SocketPeer, which syncs another vault with the served one:
+
+        sync-size                 The number of services.
+        sync-nodes DEPTH LEVEL I,J,...  The hashes of nodes of the hash tree.
+        sync-leaves DEPTH I,J,... The names and content hashes in the leaves.
+        sync-get NAME...          The names and URIs of the services.
+        sync-put NAME URI...      Adds or replaces services, in one write.
+        sync-modified             The time the vault was last written.
+
+    Requests that read are answered synchronously on the event loop: the vault is
+    compiled once, and the manager's prefetch thread keeps the current and next codes
+    cached, so a warm request is a dictionary lookup. The requests that write the
+    vault (`WRITE_COMMANDS`) run on the default executor, so the disk never stalls
+    the loop. Changes other processes make to the vault, such as ``auth-manager add``,
+    are picked up within `RELOAD_INTERVAL`, also off the loop.
+
+    Attributes:
+        manager (OTPManager): The manager answering the requests.
+        path (str): The path of the socket.
+    """
+
+    def __init__(self, manager, path=None):
+        self.manager = manager
+        self.path = path or default_socket_path()
+        self._server = None
+        self._watcher = None
+        self._peer = LocalPeer(manager)
+        # The handler of each command and the least and most arguments it takes,
+        # where None is any number.
+        self._commands = {
+            "code": (self._code, 1, 2),
+            "next": (self._next, 1, 1),
+            "verify": (self._verify, 2, 3),
+            "list": (self._list, 0, 1),
+            "metrics": (lambda: json.dumps(registry.snapshot()), 0, 0),
+            "ping": (lambda: "pong", 0, 0),
+            "sync-size": (self._peer.size, 0, 0),
+            "sync-nodes": (self._sync_nodes, 3, 3),
+            "sync-leaves": (self._sync_leaves, 2, 2),
+            "sync-get": (self._sync_get, 0, None),
+            "sync-put": (self._sync_put, 0, None),
+            "sync-modified": (self._peer.modified, 0, 0),
+        }
+
+    async def start(self):
+        """
+        Starts listening. The socket is only accessible to the current user.
+
+        Raises:
+            OSError: If another daemon is already listening on the socket.
+        """
+        if os.path.exists(self.path):
+            if _is_listening(self.path):
+                raise OSError(f"A daemon is already listening on {self.path}")
+            os.remove(self.path)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._serve_connection, path=self.path
+            )
+        finally:
+            os.umask(old_umask)
+        self._watcher = asyncio.create_task(self._watch_vault())
+
+    async def serve_forever(self):
+        """
+        Serves until cancelled, then closes the server.
+        """
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        Stops listening and removes the socket file.
+        """
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def respond(self, request):
+        """
+        Answers one request.
+
+        Args:
+            request (bytes): The request line, without its newline.
+
+        Returns:
+            bytes: The reply line.
+        """
+        command, *arguments = request.decode(errors="replace").split("\t")
+        if registry.enabled:
+            registry.count("daemon.requests")
+        if command not in self._commands:
+            return f"err\tunknown command {command!r}\n".encode()
+        handler, least, most = self._commands[command]
+        if len(arguments) < least or most is not None and len(arguments) > most:
+            return f"err\twrong number of arguments for {command}\n".encode()
+        try:
+            value = handler(*arguments)
+        except REQUEST_ERRORS as error:
+            # The message must stay on the one line of the reply.
+            message = " ".join(str(error).split()) or type(error).__name__
+            return f"err\t{message}\n".encode()
+        return f"ok\t{value}\n".encode()
+
+    async def _respond_all(self, requests):
+        """
+        Answers the requests of one read, in order.
+
+        Args:
+            requests (list): The request lines, without their newlines.
+
+        Returns:
+            bytes: The reply lines.
+        """
+        loop = asyncio.get_running_loop()
+        replies = []
+        for request in requests:
+            if request.partition(b"\t")[0] in WRITE_COMMANDS:
+                replies.append(await loop.run_in_executor(None, self.respond, request))
+            else:
+                replies.append(self.respond(request))
+        return b"".join(replies)
+
+    async def _serve_connection(self, reader, writer):
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                *requests, buffer = (buffer + data).split(b"\n")
+                if len(buffer) > MAX_LINE:
+                    break
+                if requests:
+                    writer.write(await self._respond_all(requests))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _watch_vault(self):
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.manager.reload_if_changed
+            )
+
+    def _code(self, name, at=None):
+        if at is not None:
+            at = float(at)
+        return self.manager.get_code(name, at=at) or ""
+
+    def _next(self, name):
+        return self.manager.get_next_code(name) or ""
+
+    def _verify(self, name, code, window="1"):
+        return "1" if self.manager.verify(name, code, window=int(window)) else "0"
+
+    def _list(self, query=""):
+        return "\t".join(self.manager.search(query))
+
+    def _sync_nodes(self, depth, level, indices):
+        indices = [int(index) for index in indices.split(",")]
+        return "\t".join(self._peer.node_hashes(int(depth), int(level), indices))
+
+    def _sync_leaves(self, depth, indices):
+        indices = [int(index) for index in indices.split(",")]
+        entries = self._peer.leaf_entries(int(depth), indices)
+        return "\t".join(field for item in entries.items() for field in item)
+
+    def _sync_get(self, *names):
+        entries = self._peer.get_entries(
+            [name for name in names if name in self.manager.services]
+        )
+        return "\t".join(field for item in entries.items() for field in item)
+
+    def _sync_put(self, *fields):
+        if len(fields) % 2:
+            raise ValueError("sync-put takes name and URI pairs")
+        self._peer.put_entries(dict(zip(fields[::2], fields[1::2])))
+        return len(fields) // 2
+
+
+def _is_listening(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def serve(manager, path=None):
+    """
+    Runs the daemon until SIGINT or SIGTERM, prefetching codes in the background.
+
+    Args:
+        manager (OTPManager): The manager whose vault is served.
+        path (str, optional): The socket path. Defaults to default_socket_path().
+    """
+
+    async def run():
+        server = CodeServer(manager, path)
+        await server.start()
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, task.cancel)
+        await server.serve_forever()
+
+    manager.start_prefetch()
+    asyncio.run(run())
@@ -0,0 +1,147 @@
+import hashlib
+import hmac
+import os
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .storage import SQLiteStorage
+
+# The scrypt cost of new vaults: 32 MiB of memory and about a tenth of a second.
+# Existing vaults keep the parameters they were created with.
+SCRYPT_N = 2**15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+NONCE_SIZE = 12
+
+# Sealed with the vault key when the vault is created, to tell a wrong passphrase
+# from a corrupt record.
+_VERIFIER = b"auth-manager vault"
+
+_session_keys = {}
+_session_lock = threading.Lock()
+
+
+def derive_key(passphrase, salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """
+    Derives a 256-bit vault key from a passphrase with scrypt.
+
+    Keys are kept in memory for the rest of the process, so opening the vault
+    again, from another manager or after a reload, does not run the KDF again.
+
+    Args:
+        passphrase (str or bytes): The passphrase.
+        salt (bytes): The salt of the vault.
+        n (int): The scrypt CPU/memory cost.
+        r (int): The scrypt block size.
+        p (int): The scrypt parallelization.
+
+    Returns:
+        bytes: The key.
+    """
+    if isinstance(passphrase, str):
+        passphrase = passphrase.encode()
+    # Looked up by a keyed digest, so the cache does not hold the passphrase.
+    lookup = (salt, n, r, p, hmac.digest(salt, passphrase, "sha256"))
+    with _session_lock:
+        key = _session_keys.get(lookup)
+        if key is None:
+            key = _session_keys[lookup] = hashlib.scrypt(
+                passphrase, salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32
+            )
+    return key
+
+
+def forget_keys():
+    """
+    Drops the keys derived so far, for example when the session is locked.
+    """
+    with _session_lock:
+        _session_keys.clear()
+
+
+class EncryptedStorage(SQLiteStorage):
+    """
+    An SQLite vault whose URIs are each sealed with AES-256-GCM.
+
+    The key is derived from a passphrase with scrypt, once per process, and every
+    record is sealed on its own, under a fresh nonce and with the service name as
+    associated data, so a record cannot be moved to another name. Editing a service
+    re-seals that one record; and as with SQLiteStorage, `load` reads nothing, so
+    only the records the manager actually uses are decrypted.
+
+    The names stay in clear, for lookups and search; the URIs, with their secrets,
+    labels and issuers, never reach the disk unsealed. Requires the cryptography
+    package (``pip install auth_manager[encryption]``).
+
+    Attributes:
+        path (str): The path of the database file.
+
+    Raises:
+        ValueError: If the passphrase is wrong, or the database is an unencrypted
+            vault.
+    """
+
+    def __init__(self, path, passphrase):
+        super().__init__(path)
+        try:
+            meta = self._read_meta()
+            key = derive_key(passphrase, meta["salt"], meta["n"], meta["r"], meta["p"])
+            self._aead = AESGCM(key)
+            if "verifier" not in meta:
+                self._write_meta({"verifier": self._seal(_VERIFIER, b"")})
+                meta = self._read_meta()
+            try:
+                self._open(meta["verifier"], b"")
+            except InvalidTag:
+                raise ValueError(f"Wrong passphrase for {path}") from None
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_meta(self):
+        """
+        Returns the parameters of the vault, creating them for a new vault. Racing
+        creators agree on the first parameters written.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+            )
+            meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        if not meta:
+            if self.execute("SELECT 1 FROM services LIMIT 1"):
+                raise ValueError(f"{self.path} is not an encrypted vault")
+            self._write_meta(
+                {"salt": os.urandom(16), "n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P}
+            )
+            meta = dict(self.execute("SELECT key, value FROM meta"))
+        return meta
+
+    def _write_meta(self, values):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", values.items()
+            )
+
+    def _encode(self, name, uri):
+        return self._seal(uri.encode(), name.encode())
+
+    def _decode(self, name, value):
+        try:
+            return self._open(value, name.encode()).decode()
+        except InvalidTag:
+            raise ValueError(
+                f"The record of {name!r} is corrupt or was tampered with"
+            ) from None
+
+    def _seal(self, data, associated_data):
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, data, associated_data)
+
+    def _open(self, sealed, associated_data):
+        return self._aead.decrypt(
+            sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], associated_data
+        )
@@ -1,19 +1,188 @@
-import subprocess
+import queue
 import sys
+import time
 import tkinter as tk
+from functools import partial
 from tkinter import Button, Entry, Label, Menu, Toplevel, messagebox
 from tkinter.font import Font
 
 from .manager import OTPManager
+from .metrics import registry, timed
+from .search import matches
+from .totp import CompiledTOTP
+from .worker import Worker
+
+# How often the worker's results are drained while jobs are outstanding, in ms.
+DRAIN_INTERVAL = 15
+
+# How often the vault is checked for changes made by other processes, in ms.
+RELOAD_INTERVAL = 1000
+
+# Height in pixels of one row of the service list, including the gap below the card.
+# Rows have a fixed height so the visible range follows from the scroll offset alone.
+CARD_HEIGHT = 86
+CARD_GAP = 10
+
+
+def count_widgets(widget):
+    """
+    Returns the number of widgets in the tree rooted at `widget`, itself included.
+    """
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class ServiceCard:
+    """
+    The widgets of one row of the service list.
+
+    Only as many cards as fit in the window are ever created; as the list scrolls,
+    each card is rebound to whichever service now occupies its row.
+
+    Attributes:
+        name (str): The name of the service the card shows, or None if it is hidden.
+        counter (int): The time step of the code shown, or None if it must be redrawn.
+        period (int): The period of the service, or None until its code arrives.
+        frame (tk.Frame): The card's outer frame.
+        name_label (tk.Label): The label showing the service name.
+        code_label (tk.Label): The label showing the OTP code.
+        countdown_label (tk.Label): The label showing the seconds left.
+        canvas (tk.Canvas): The button opening the service's options menu.
+    """
+
+    def __init__(self, app):
+        self.name = None
+        self.code = None
+        self.counter = None
+        self.period = None
+        self.remaining = None
+        self.y = None
+
+        self.frame = tk.Frame(
+            app.services_frame,
+            bd=1,
+            relief="solid",
+            padx=10,
+            pady=5,
+            bg=app.card_bg_color,
+        )
+
+        self.text_frame = tk.Frame(self.frame, bg=app.card_bg_color)
+        self.text_frame.pack(side="left", fill="x", expand=True)
+
+        self.name_label = tk.Label(
+            self.text_frame,
+            font=app.service_name_font,
+            anchor="w",
+            fg=app.card_fg_color,
+            bg=app.card_bg_color,
+        )
+        self.name_label.pack(side="top", anchor="w")
+
+        self.code_frame = tk.Frame(self.text_frame, bg=app.card_bg_color)
+        self.code_frame.pack(side="top", anchor="w")
+
+        self.code_label = tk.Label(
+            self.code_frame,
+            font=app.code_font,
+            fg=app.code_color,
+            bg=app.card_bg_color,
+        )
+        self.code_label.pack(side="left", anchor="w")
+        self.code_label.bind("<Button-1>", lambda e: app.copy_to_clipboard(self))
+
+        self.countdown_label = tk.Label(
+            self.code_frame,
+            text="30",
+            font=app.service_name_font,
+            fg="red",
+            bg=app.card_bg_color,
+        )
+        self.countdown_label.pack(side="left", padx=10)
+
+        self.canvas = canvas = tk.Canvas(
+            self.frame,
+            width=30,
+            height=30,
+            highlightthickness=0,
+            bg=app.card_bg_color,
+            cursor="hand2",
+        )
+        canvas.pack(side="right", anchor="e", padx=5)
+        self.oval = canvas.create_oval(5, 5, 25, 25, outline=app.card_fg_color, width=2)
+        self.dots = canvas.create_text(
+            15,
+            15,
+            text="⋯",
+            font=app.service_name_font,
+            fill=app.card_fg_color,
+            width=2,
+            anchor="center",
+        )
+        canvas.bind("<Button-1>", lambda e: app.show_options_menu(self.name, canvas))
+
+    def apply_theme(self, app):
+        """
+        Recolors the card's widgets with the app's current theme.
+
+        Args:
+            app (OTPApp): The app whose colors are used.
+        """
+        for widget in (self.frame, self.text_frame, self.code_frame, self.canvas):
+            widget.config(bg=app.card_bg_color)
+        self.name_label.config(fg=app.card_fg_color, bg=app.card_bg_color)
+        self.code_label.config(fg=app.code_color, bg=app.card_bg_color)
+        self.countdown_label.config(bg=app.card_bg_color)
+        self.canvas.itemconfig(self.oval, outline=app.card_fg_color)
+        self.canvas.itemconfig(self.dots, fill=app.card_fg_color)
+
+    def show(self, name, y):
+        """
+        Binds the card to a service and places it at the given height, only touching
+        the widgets whose content changed. The code and countdown are filled in by
+        OTPApp.refresh_cards.
+
+        Args:
+            name (str): The name of the service.
+            y (int): The vertical position of the card in the list viewport.
+        """
+        if name != self.name:
+            self.name = name
+            self.counter = self.period = None
+            self.name_label.config(text=name)
+        if y != self.y:
+            self.y = y
+            self.frame.place(x=0, y=y, relwidth=1, height=CARD_HEIGHT - CARD_GAP)
+
+    def set_code(self, code):
+        if code != self.code:
+            self.code = code
+            self.code_label.config(text=code)
+
+    def set_remaining(self, remaining):
+        if remaining != self.remaining:
+            self.remaining = remaining
+            self.countdown_label.config(text=f"{remaining}")
+
+    def hide(self):
+        if self.name is not None:
+            self.name = self.code = self.counter = self.period = None
+            self.remaining = self.y = None
+            self.frame.place_forget()
 
 
 class OTPApp(tk.Tk):
     """
     A class representing the OTPApp, which is a GUI application for managing 2FA codes.
 
+    Args:
+        manager (OTPManager, optional): The manager to display. Defaults to one on
+            the default vault, prefetching codes and saving changes after a delay.
+
     Attributes:
         manager (OTPManager): An instance of the OTPManager class for managing OTP codes.
         is_dark_mode (bool): A flag indicating whether the application is in dark mode.
+            It starts False and is updated once the system theme has been detected
+            in the background.
         bg_color (str): The background color of the application.
         fg_color (str): The text color of the application.
         card_bg_color (str): The background color of the service cards.
@@ -23,22 +192,47 @@ class OTPApp(tk.Tk):
         service_name_font (Font): The font for the service names.
         code_font (Font): The font for the OTP codes.
         plus_font (Font): The font for the plus sign button.
-        services_frame (tk.Frame): The frame that holds all the service cards.
-        countdown_id (int): The ID of the countdown timer.
-        service_cards (list): A list of tuples containing the service name, code label,
-            and countdown label for each service card.
+        services_frame (tk.Frame): The viewport in which the service cards are placed.
+        scrollbar (tk.Scrollbar): The scrollbar of the service list.
+        scroll_offset (int): How many pixels the service list is scrolled down.
+        search_var (tk.StringVar): The text of the search box.
+        search_query (str): The search the list is filtered by, or "" for none.
+        service_names (list): The names of the services in the list, in order.
+        countdown_id (int): The ID of the next scheduled tick, or None when no card
+            is visible.
+        service_cards (list): The pool of ServiceCard widgets, sized to the viewport
+            and recycled as the list scrolls.
+        card_index (dict): The visible cards, keyed by the name of their service.
+        worker (Worker): The background thread computing codes and applying
+            changes to the vault.
+        versions (dict): A counter per service name, bumped on every edit, used to
+            drop worker results computed before the edit.
 
     Methods:
         detect_dark_mode(): Detects whether the system is in dark mode.
+        set_dark_mode(is_dark_mode): Switches the theme of the existing widgets.
         apply_theme(): Applies the theme (dark or light) to the application.
         refresh_service_list(): Refreshes the list of services and displays them.
-        create_service_card(name): Creates a service card for the given service name.
-        copy_to_clipboard(label): Copies the text of the given label to the clipboard.
-        update_code(service_name, code_label): Updates the OTP code for the given
-            service name.
-        start_countdown(remaining): Starts the countdown timer for refreshing the
-            OTP codes.
-        refresh_all_codes(): Refreshes the OTP codes for all services.
+        apply_search(): Filters the list to the services matching the search box.
+        create_service_card(): Adds a card to the pool of recyclable service cards.
+        layout_cards(): Binds the pooled cards to the services in view.
+        insert_service_card(name): Adds a service to the list.
+        update_service_card(old_name, new_name): Updates a renamed or edited service.
+        remove_service_card(name): Removes a service from the list.
+        poll_vault(): Periodically checks the vault for changes by other processes.
+        apply_external_changes(names): Updates the rows of services changed by
+            another process.
+        on_scroll(*args): Scrolls the list in response to the scrollbar.
+        on_mouse_wheel(event): Scrolls the list in response to the mouse wheel.
+        copy_to_clipboard(card): Copies the code shown on a card to the clipboard.
+        update_code(card): Updates the OTP code shown on the given card.
+        refresh_cards(cards, now, cached): Updates the codes and countdowns of cards.
+        request_codes(names, now): Computes codes on the worker thread.
+        show_codes(results, versions, now): Shows codes computed by the worker.
+        submit_job(job, callback, error_callback): Runs a job on the worker thread.
+        drain_results(): Hands finished worker jobs back to the main loop.
+        tick(): Updates the visible cards and schedules the next tick.
+        refresh_all_codes(): Redraws the OTP codes of the visible services.
         show_options_menu(service_name, button): Shows the options menu for the given
             service name.
         add_service(): Shows the dialog for adding a new service.
@@ -50,16 +244,30 @@ class OTPApp(tk.Tk):
             field is focused.
         save_service(dialog, name, uri, original_name): Saves the service with the given
         name and URI.
+        on_close(): Releases the manager and closes the window.
     """
 
-    def __init__(self):
+    def __init__(self, manager=None):
         super().__init__()
         self.title("2FA Manager")
         self.geometry("400x500")
-        self.manager = OTPManager()
-
-        # Detect and apply the system theme
-        self.is_dark_mode = self.detect_dark_mode()
+        if manager is None:
+            manager = OTPManager(prefetch=True, autosave_delay=1.0)
+        self.manager = manager
+        # Delayed writes fail on the autosave thread; the errors are shown by
+        # poll_vault on the main loop.
+        self.save_errors = queue.SimpleQueue()
+        manager.on_save_error = self.save_errors.put
+
+        # Codes and vault changes are computed off the main loop
+        self.worker = Worker()
+        self.versions = {}
+        self.code_requests = set()
+        self.drain_id = None
+
+        # Start with the light theme; the system theme is detected on the worker
+        # once the list is drawn, so startup never waits for it.
+        self.is_dark_mode = False
         self.apply_theme()
 
         # Fonts
@@ -67,12 +275,33 @@ class OTPApp(tk.Tk):
         self.code_font = Font(family="Helvetica", size=20, weight="bold")
         self.plus_font = Font(family="Helvetica", size=28, weight="bold")
 
-        # Frame to hold all services
+        # Search box filtering the list as you type
+        self.search_query = ""
+        self.search_var = tk.StringVar(self)
+        self.search_var.trace_add("write", lambda *args: self.apply_search())
+        search_entry = Entry(self, textvariable=self.search_var)
+        search_entry.pack(side="top", fill="x", padx=10, pady=(10, 0))
+        search_entry.bind("<Escape>", lambda e: self.search_var.set(""))
+
+        # Scrollable viewport for the service cards. Only the cards in view exist;
+        # they are repositioned and rebound as the list scrolls.
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
         self.services_frame = tk.Frame(self, bg=self.bg_color)
         self.services_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        self.services_frame.bind("<Configure>", lambda e: self.layout_cards())
+        self.bind_all("<MouseWheel>", self.on_mouse_wheel)
+        self.bind_all("<Button-4>", self.on_mouse_wheel)
+        self.bind_all("<Button-5>", self.on_mouse_wheel)
+        # Fires for every widget of the main window that is destroyed
+        self.bind("<Destroy>", self.on_widget_destroyed, add="+")
+        self.service_names = []
+        self.service_cards = []
+        self.card_index = {}
+        self.scroll_offset = 0
 
         # Plus button to add new service (without a circle around it)
-        plus_button = tk.Label(
+        self.plus_button = plus_button = tk.Label(
             self,
             text="+",
             font=self.plus_font,
@@ -88,6 +317,23 @@ class OTPApp(tk.Tk):
 
         # Load and display existing services
         self.refresh_service_list()
+        self.submit_job(self.detect_dark_mode, self.set_dark_mode)
+        self.after(RELOAD_INTERVAL, self.poll_vault)
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_widget_destroyed(self, event):
+        if registry.enabled:
+            registry.count("gui.widgets_destroyed")
+
+    def on_close(self):
+        """
+        Waits for queued changes, releases the manager's background work and
+        storage, then closes the window.
+        """
+        self.worker.stop()
+        self.manager.close()
+        self.destroy()
 
     def detect_dark_mode(self):
         """
@@ -97,6 +343,8 @@ class OTPApp(tk.Tk):
             bool: True if the operating system is in dark mode, False otherwise.
         """
         if sys.platform == "darwin":
+            import subprocess
+
             try:
                 result = subprocess.run(
                     ["defaults", "read", "-g", "AppleInterfaceStyle"],
@@ -109,6 +357,21 @@ class OTPApp(tk.Tk):
         else:
             return False
 
+    def set_dark_mode(self, is_dark_mode):
+        """
+        Switches the theme, recoloring the widgets that already exist.
+
+        Args:
+            is_dark_mode (bool): Whether to use the dark theme.
+        """
+        if is_dark_mode == self.is_dark_mode:
+            return
+        self.is_dark_mode = is_dark_mode
+        self.apply_theme()
+        self.plus_button.config(fg=self.plus_color, bg=self.bg_color)
+        for card in self.service_cards:
+            card.apply_theme(self)
+
     def apply_theme(self):
         """
         Applies the selected theme to the GUI.
@@ -137,13 +400,16 @@ class OTPApp(tk.Tk):
 
         self.configure(bg=self.bg_color)
 
+    @timed("gui.refresh_service_list")
     def refresh_service_list(self):
         """
         Refreshes the service list in the GUI.
 
-        This method cancels any ongoing countdown, destroys existing service cards,
-        creates new service cards based on the services in the manager, and starts
-        a countdown for all services.
+        This method reloads the list of service names from the manager, filtered by
+        the search box, and rebinds the visible cards, which starts the countdown if
+        it is not running yet. Single changes go through insert_service_card,
+        update_service_card and remove_service_card instead, which leave the rest of
+        the list alone.
 
         Args:
             None
@@ -151,158 +417,389 @@ class OTPApp(tk.Tk):
         Returns:
             None
         """
-        # Cancel any ongoing countdown
-        if self.countdown_id:
-            self.after_cancel(self.countdown_id)
+        if self.search_query:
+            self.service_names = self.manager.search(self.search_query)
+        else:
+            self.service_names = list(self.manager.services)
+        self.layout_cards()
 
-        for widget in self.services_frame.winfo_children():
-            widget.destroy()
+    def apply_search(self):
+        """
+        Filters the list to the services matching the search box, best matches
+        first, and scrolls back to the top.
 
-        self.service_cards = []
-        for name in self.manager.services:
-            self.create_service_card(name)
+        The matches come from the manager's search index, and the pooled cards are
+        rebound to them, so no widget is created or destroyed while typing.
+        """
+        self.search_query = self.search_var.get().strip()
+        self.scroll_offset = 0
+        self.refresh_service_list()
+
+    def create_service_card(self):
+        """
+        Creates a service card widget and adds it to the pool of recyclable cards.
+
+        Returns:
+            ServiceCard: The new, not yet placed card.
+        """
+        card = ServiceCard(self)
+        if registry.enabled:
+            registry.count("gui.widgets_created", count_widgets(card.frame))
+        self.service_cards.append(card)
+        return card
+
+    @timed("gui.layout_cards")
+    def layout_cards(self):
+        """
+        Binds the pooled cards to the services currently in view.
+
+        The pool grows to the number of cards that fit in the viewport and never
+        beyond, so the number of widgets does not depend on the number of services.
+        """
+        height = self.services_frame.winfo_height()
+        total = len(self.service_names) * CARD_HEIGHT
+        self.scroll_offset = max(0, min(self.scroll_offset, total - height))
+        first = self.scroll_offset // CARD_HEIGHT
+        visible = min(len(self.service_names) - first, height // CARD_HEIGHT + 2)
+
+        while len(self.service_cards) < visible:
+            self.create_service_card()
+
+        now = time.time()
+        self.card_index = {}
+        for slot, card in enumerate(self.service_cards):
+            index = first + slot
+            if slot < visible:
+                name = self.service_names[index]
+                card.show(name, index * CARD_HEIGHT - self.scroll_offset)
+                self.card_index[name] = card
+            else:
+                card.hide()
+        self.refresh_cards(self.card_index.values(), now)
 
-        # Start the countdown for all services
-        self.start_countdown(30)
+        if self.countdown_id is None and self.card_index:
+            self.countdown_id = self.after(self.next_tick_delay(now), self.tick)
 
-    def create_service_card(self, name):
+        if total > height:
+            self.scrollbar.set(
+                self.scroll_offset / total, (self.scroll_offset + height) / total
+            )
+        else:
+            self.scrollbar.set(0, 1)
+
+    def insert_service_card(self, name):
         """
-        Creates a service card widget for the given service name.
+        Adds a newly added service at the end of the list, unless it does not match
+        the search. Only cards whose row actually changes are touched.
 
         Args:
             name (str): The name of the service.
-
-        Returns:
-            None
         """
+        if self.search_query and not matches(name, self.search_query):
+            return
+        if name in self.service_names:
+            self.update_service_card(name, name)
+            return
+        self.service_names.append(name)
+        self.layout_cards()
+
+    def update_service_card(self, old_name, new_name):
+        """
+        Updates the row of an edited service in place, refreshing its name and code.
 
-        card_frame = tk.Frame(
-            self.services_frame,
-            bd=1,
-            relief="solid",
-            padx=10,
-            pady=5,
-            bg=self.card_bg_color,
-        )
-        card_frame.pack(fill="x", pady=5)
+        Args:
+            old_name (str): The name of the service before the edit.
+            new_name (str): The name of the service after the edit.
+        """
+        if self.search_query and not matches(new_name, self.search_query):
+            # The new name no longer matches the search; the row goes away.
+            self.remove_service_card(old_name)
+            return
+        if old_name not in self.service_names:
+            self.insert_service_card(new_name)
+            return
+        if new_name != old_name and new_name in self.service_names:
+            # The edit replaced another service; its row goes away.
+            self.service_names.remove(new_name)
+            self.service_names[self.service_names.index(old_name)] = new_name
+            self.layout_cards()
+            return
+        self.service_names[self.service_names.index(old_name)] = new_name
+        card = self.card_index.pop(old_name, None)
+        if card is not None:
+            card.show(new_name, card.y)
+            card.counter = None
+            self.card_index[new_name] = card
+            # The edit is still queued on the worker, so the cached code is stale.
+            self.refresh_cards([card], time.time(), cached=False)
+
+    def poll_vault(self):
+        """
+        Checks, on the worker, whether another process changed the vault, shows
+        the errors of failed autosaves and schedules the next check.
+        """
+        while not self.save_errors.empty():
+            self.show_save_error(self.save_errors.get())
+        self.submit_job(self.manager.reload_if_changed, self.apply_external_changes)
+        self.after(RELOAD_INTERVAL, self.poll_vault)
 
-        text_frame = tk.Frame(card_frame, bg=self.card_bg_color)
-        text_frame.pack(side="left", fill="x", expand=True)
+    def apply_external_changes(self, names):
+        """
+        Updates the rows of the services another process added, edited or deleted,
+        leaving the rest of the list alone.
 
-        service_name_label = tk.Label(
-            text_frame,
-            text=name,
-            font=self.service_name_font,
-            anchor="w",
-            fg=self.card_fg_color,
-            bg=self.card_bg_color,
-        )
-        service_name_label.pack(side="top", anchor="w")
+        Args:
+            names (set): The names of the changed services.
+        """
+        for name in names:
+            self.versions[name] = self.versions.get(name, 0) + 1
+            self.code_requests.discard(name)
+            if name in self.manager.services:
+                self.insert_service_card(name)
+            else:
+                self.remove_service_card(name)
 
-        code_frame = tk.Frame(text_frame, bg=self.card_bg_color)
-        code_frame.pack(side="top", anchor="w")
+    def remove_service_card(self, name):
+        """
+        Removes a deleted service from the list; the rows below it move up.
 
-        code_label = tk.Label(
-            code_frame,
-            text=self.manager.get_code(name),
-            font=self.code_font,
-            fg=self.code_color,
-            bg=self.card_bg_color,
-        )
-        code_label.pack(side="left", anchor="w")
-        code_label.bind("<Button-1>", lambda e: self.copy_to_clipboard(code_label))
+        Args:
+            name (str): The name of the service.
+        """
+        if name in self.service_names:
+            self.service_names.remove(name)
+            self.layout_cards()
 
-        countdown_label = tk.Label(
-            code_frame,
-            text="30",
-            font=self.service_name_font,
-            fg="red",
-            bg=self.card_bg_color,
-        )
-        countdown_label.pack(side="left", padx=10)
+    def on_scroll(self, action, amount, unit=None):
+        """
+        Scrolls the service list in response to the scrollbar.
 
-        self.service_cards.append((name, code_label, countdown_label))
+        Args:
+            action (str): "moveto" or "scroll".
+            amount (str): The fraction to move to, or the number of units or pages
+                to scroll by.
+            unit (str, optional): "units" or "pages" when scrolling.
+        """
+        total = len(self.service_names) * CARD_HEIGHT
+        if action == "moveto":
+            self.scroll_offset = int(float(amount) * total)
+        elif unit == "pages":
+            self.scroll_offset += int(amount) * self.services_frame.winfo_height()
+        else:
+            self.scroll_offset += int(amount) * CARD_HEIGHT
+        self.layout_cards()
 
-        canvas = tk.Canvas(
-            card_frame,
-            width=30,
-            height=30,
-            highlightthickness=0,
-            bg=self.card_bg_color,
-            cursor="hand2",
-        )
-        canvas.pack(side="right", anchor="e", padx=5)
-        canvas.create_oval(5, 5, 25, 25, outline=self.card_fg_color, width=2)
-        canvas.create_text(
-            15,
-            15,
-            text="⋯",
-            font=self.service_name_font,
-            fill=self.card_fg_color,
-            width=2,
-            anchor="center",
-        )
-        canvas.bind("<Button-1>", lambda e, n=name: self.show_options_menu(n, canvas))
+    def on_mouse_wheel(self, event):
+        """
+        Scrolls the service list by half a card per wheel notch.
+        """
+        if event.num == 4 or event.delta > 0:
+            self.scroll_offset -= CARD_HEIGHT // 2
+        else:
+            self.scroll_offset += CARD_HEIGHT // 2
+        self.layout_cards()
 
-    def copy_to_clipboard(self, label):
+    def copy_to_clipboard(self, card):
         """
-        Copies the text from the given label to the clipboard and updates
-        the label's text temporarily.
+        Copies the code shown on the given card to the clipboard and replaces it
+        with a confirmation for a second.
 
         Args:
-            label: The label from which the text will be copied.
+            card (ServiceCard): The card whose code will be copied.
 
         Returns:
             None
         """
+        if card.code is None:
+            return
         self.clipboard_clear()
-        self.clipboard_append(label.cget("text"))
+        self.clipboard_append(card.code)
 
-        original_text = label.cget("text")
-        original_color = label.cget("fg")
+        # Forget the shown code so that the card's next update redraws it.
+        card.code = None
+        card.code_label.config(text="Copied!", fg="green")
+        self.after(1000, lambda: self.update_code(card))
 
-        label.config(text="Copied!", fg="green")
-        self.after(1000, lambda: label.config(text=original_text, fg=original_color))
+    def update_code(self, card):
+        """
+        Redraws the code label of the given card with its service's current code.
 
-    def update_code(self, service_name, code_label):
+        Args:
+            card (ServiceCard): The card to update.
         """
-        Updates the code label with the code for the specified service.
+        card.code_label.config(fg=self.code_color)
+        if card.name is not None:
+            card.counter = None
+            self.refresh_cards([card], time.time())
+
+    def refresh_cards(self, cards, now, cached=True):
+        """
+        Updates the code, if its service's time step changed, and the countdown of
+        each card.
+
+        Codes already in the manager's cache (normally all of them, thanks to the
+        prefetch thread) are shown right away; the rest are computed on the worker
+        thread and shown when they arrive.
 
         Args:
-            service_name (str): The name of the service.
-            code_label (tkinter.Label): The label to update with the code.
+            cards (iterable): The cards to update.
+            now (float): The current Unix time.
+            cached (bool): Whether cached codes may be used. False after an edit
+                that the worker has not applied yet.
+        """
+        missing = []
+        for card in cards:
+            peeked = self.manager.peek_code(card.name, at=now) if cached else None
+            if peeked is None:
+                missing.append(card.name)
+                continue
+            generator, code = peeked
+            card.period = generator.period
+            card.counter = int(now) // card.period
+            card.set_code(code)
+            card.set_remaining(card.period - int(now) % card.period)
+        if missing:
+            self.request_codes(missing, now)
+
+    def request_codes(self, names, now):
+        """
+        Computes the codes of the given services on the worker thread.
+
+        Args:
+            names (list): The names of the services.
+            now (float): The time to compute the codes for.
         """
-        code = self.manager.get_code(service_name)
-        code_label.config(text=code)
+        names = [name for name in names if name not in self.code_requests]
+        if not names:
+            return
+        self.code_requests.update(names)
+        versions = {name: self.versions.get(name, 0) for name in names}
+
+        def compute():
+            results = {}
+            for name in names:
+                try:
+                    generator = self.manager.get_generator(name)
+                except ValueError:
+                    results[name] = None
+                    continue
+                if generator is not None:
+                    code = self.manager.get_code(name, at=now)
+                    results[name] = (generator.period, code)
+            return results
+
+        self.submit_job(
+            compute, lambda results: self.show_codes(results, versions, now)
+        )
 
-    def start_countdown(self, remaining):
+    def show_codes(self, results, versions, now):
         """
-        Starts a countdown timer.
+        Shows codes computed by the worker, dropping those of services that were
+        scrolled out of view or edited since they were requested.
 
         Args:
-            remaining (int): The remaining time in seconds.
+            results (dict): (period, code) pairs keyed by service name, or None for
+                services whose URI is invalid.
+            versions (dict): The version of each service when it was requested.
+            now (float): The time the codes were computed for.
+        """
+        self.code_requests.difference_update(versions)
+        for name, result in results.items():
+            card = self.card_index.get(name)
+            if card is None or self.versions.get(name, 0) != versions[name]:
+                continue
+            if result is None:
+                card.set_code("Invalid URI")
+                continue
+            card.period, code = result
+            card.counter = int(now) // card.period
+            card.set_code(code)
+            card.set_remaining(card.period - int(time.time()) % card.period)
+
+    def submit_job(self, job, callback=None, error_callback=None):
+        """
+        Runs a job on the worker thread and makes sure its result is drained.
 
-        Returns:
-            None
+        Args:
+            job (callable): The function to run.
+            callback (callable, optional): Called on the main loop with the result.
+            error_callback (callable, optional): Called on the main loop with the
+                exception, if the job raised one.
         """
-        if remaining >= 0:
-            for _, code_label, countdown_label in self.service_cards:
-                countdown_label.config(text=f"{remaining}")
-            remaining -= 1
-            self.countdown_id = self.after(1000, self.start_countdown, remaining)
-        else:
-            self.refresh_all_codes()
-            self.start_countdown(30)
+        self.worker.submit(job, callback, error_callback)
+        if self.drain_id is None:
+            self.drain_id = self.after(DRAIN_INTERVAL, self.drain_results)
+
+    def drain_results(self):
+        """
+        Hands finished worker jobs back to the main loop, polling again only while
+        jobs are outstanding.
+        """
+        self.drain_id = None
+        self.worker.drain()
+        if self.worker.pending:
+            self.drain_id = self.after(DRAIN_INTERVAL, self.drain_results)
 
+    def next_tick_delay(self, now):
+        """
+        Returns the delay in milliseconds until just after the next whole second,
+        when every visible countdown changes and any period boundary falls.
+        """
+        return 1000 - int(now * 1000) % 1000 + 5
+
+    def tick(self):
+        """
+        Updates the visible cards for the current time and schedules the next tick.
+
+        The visible cards are grouped by period, so the time step and the seconds
+        left are computed once per period, and only the labels whose text changed
+        are touched. Codes that are not cached yet are computed on the worker. When
+        no card is visible, no tick is scheduled until the list shows one again.
+        The next tick is scheduled even if updating a card fails, so the countdowns
+        never freeze.
+        """
+        now = time.time()
+        try:
+            by_period = {}
+            missing = []
+            for card in self.card_index.values():
+                if card.period is None:
+                    missing.append(card)
+                else:
+                    by_period.setdefault(card.period, []).append(card)
+
+            for period, cards in by_period.items():
+                counter = int(now) // period
+                remaining = period - int(now) % period
+                for card in cards:
+                    if counter != card.counter:
+                        peeked = self.manager.peek_code(card.name, at=now)
+                        if peeked is None or peeked[0].period != period:
+                            missing.append(card)
+                            continue
+                        card.counter = counter
+                        card.set_code(peeked[1])
+                    card.set_remaining(remaining)
+
+            if missing:
+                self.refresh_cards(missing, now, cached=False)
+        finally:
+            if self.card_index:
+                self.countdown_id = self.after(self.next_tick_delay(now), self.tick)
+            else:
+                self.countdown_id = None
+
+    @timed("gui.refresh_all_codes")
     def refresh_all_codes(self):
         """
-        Refreshes all the codes for the service cards.
+        Redraws the codes of the visible service cards.
 
-        This method iterates over each service card and calls the
-        `update_code` method to update the code for that service.
+        Cards scrolled out of view are hidden and get their code when they are bound
+        again, so only the visible ones need updating.
         """
-        for name, code_label, _ in self.service_cards:
-            self.update_code(name, code_label)
+        for card in self.card_index.values():
+            card.counter = None
+        self.refresh_cards(self.card_index.values(), time.time())
 
     def show_options_menu(self, service_name, button):
         """
@@ -316,6 +813,8 @@ class OTPApp(tk.Tk):
             None
         """
         menu = Menu(self, tearoff=0)
+        if registry.enabled:
+            registry.count("gui.widgets_created")
         menu.add_command(label="Edit", command=lambda: self.edit_service(service_name))
         menu.add_command(
             label="Delete", command=lambda: self.delete_service(service_name)
@@ -403,6 +902,9 @@ class OTPApp(tk.Tk):
         )
         save_button.pack(pady=10)
 
+        if registry.enabled:
+            registry.count("gui.widgets_created", count_widgets(dialog))
+        dialog.bind("<Destroy>", self.on_widget_destroyed, add="+")
         dialog.update_idletasks()
         dialog.minsize(400, dialog.winfo_height())
 
@@ -421,11 +923,25 @@ class OTPApp(tk.Tk):
 
     def save_service(self, dialog, new_name, new_uri, old_name=""):
         if new_name and new_uri:
+            # Validate here, so the dialog can stay open on errors; the change
+            # itself is applied and persisted on the worker thread.
+            try:
+                CompiledTOTP.from_uri(new_uri)
+            except ValueError as error:
+                messagebox.showerror("Invalid URI", str(error), parent=dialog)
+                return
+            for name in {old_name, new_name} - {""}:
+                self.versions[name] = self.versions.get(name, 0) + 1
+                self.code_requests.discard(name)
             if old_name:
-                self.manager.edit_service(old_name, new_name, new_uri)
+                job = partial(self.manager.edit_service, old_name, new_name, new_uri)
             else:
-                self.manager.add_service(new_name, new_uri)
-            self.refresh_service_list()
+                job = partial(self.manager.add_service, new_name, new_uri)
+            self.submit_job(job, error_callback=self.show_save_error)
+            if old_name:
+                self.update_service_card(old_name, new_name)
+            else:
+                self.insert_service_card(new_name)
             dialog.destroy()
 
     def delete_service(self, service_name):
@@ -433,5 +949,21 @@ class OTPApp(tk.Tk):
             "Delete Service", f"Are you sure you want to delete '{service_name}'?"
         )
         if confirm:
-            self.manager.delete_service(service_name)
-            self.refresh_service_list()
+            self.versions[service_name] = self.versions.get(service_name, 0) + 1
+            self.code_requests.discard(service_name)
+            self.submit_job(
+                partial(self.manager.delete_service, service_name),
+                error_callback=self.show_save_error,
+            )
+            self.remove_service_card(service_name)
+
+    def show_save_error(self, error):
+        messagebox.showerror("Could not save the change", str(error))
+
+
+def main():
+    """
+    Starts the GUI.
+    """
+    app = OTPApp()
+    app.mainloop()
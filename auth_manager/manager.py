@@ -1,47 +1,858 @@
-import json
+import atexit
+import hmac
 import os
+import threading
+import time
+from contextlib import contextmanager
 
-import pyotp
+from .metrics import registry, timed
+from .search import NameIndex
+from .service import Service, ServiceURIs
+from .storage import JSONStorage
+from .totp import CodeCache, ReplayCache
+
+# Cached time steps per service: previous, current and the prefetched next one,
+# plus one spare so a refresh at the boundary never evicts what it is about to read.
+CACHE_STEPS_PER_SERVICE = 4
 
 
 class OTPManager:
-    def __init__(self, data_file=None):
-        self.services = {}
-        self.data_file = data_file or os.path.join(
-            os.path.dirname(__file__), "../data/services.json"
-        )
+    """
+    Manages the services of a vault and computes their codes.
+
+    The manager is safe to share between threads. The services and their compiled
+    generators form an immutable snapshot that readers use without taking a lock:
+    a writer copies the snapshot, changes the copy and publishes it with a single
+    reference swap, so readers see either the old or the new state of an edit,
+    never a service half removed. Writers are serialized among themselves, and
+    persistence runs after the writer lock is released, so a slow disk delays
+    neither readers nor other writers.
+
+    Services are held as Service records, parsed once when they are loaded or
+    added: the secret is decoded to bytes and the parameters are plain attributes,
+    so computing a code never touches a URI. The URIs are rebuilt from the records
+    when they are read through `services` or saved.
+
+    Attributes:
+        services (Mapping): The {name: uri} view of the current snapshot. Treat it
+            as read-only; use the methods below to change it.
+        generators (dict): The {name: Service} records of the current snapshot.
+            With a lazy storage, only the services used so far are there.
+        on_save_error (callable): Called with the exception when a delayed write
+            fails, on the autosave thread. The changes stay pending and are written
+            by the next flush. If None, the error is only stored in `save_error`.
+        save_error (Exception): The error of the last delayed write, or None if it
+            succeeded or was followed by a successful flush.
+    """
+
+    def __init__(
+        self,
+        data_file=None,
+        cache_size=1024,
+        prefetch=False,
+        storage=None,
+        autosave_delay=None,
+        on_save_error=None,
+    ):
+        self._snapshot = (ServiceURIs(), {})
+        self.cache_size = cache_size
+        self.code_cache = CodeCache(cache_size)
+        self.replay_cache = ReplayCache()
+        self.search_index = None
+        if storage is not None:
+            self.data_file = storage.path
+        else:
+            self.data_file = data_file or os.path.join(
+                os.path.dirname(__file__), "../data/services.json"
+            )
+            storage = JSONStorage(self.data_file)
+        self.storage = storage
+        self.autosave_delay = autosave_delay
+        self.on_save_error = on_save_error
+        self.save_error = None
+        self.writes = 0
+        self._pending = []
+        self._external_changes = set()
+        self._batch_depth = 0
+        self._autosave_timer = None
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._prefetch_thread = None
+        self._prefetch_stop = threading.Event()
+        self._merkle_tree = None
         self.load_services()
+        if prefetch:
+            self.start_prefetch()
+        if autosave_delay is not None:
+            atexit.register(self.flush)
+
+    @property
+    def services(self):
+        return self._snapshot[0]
 
+    @property
+    def generators(self):
+        return self._snapshot[1]
+
+    @timed("manager.load_services")
     def load_services(self):
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, "r") as file:
-                    self.services = json.load(file)
-            except json.JSONDecodeError:
-                self.services = {}
+        with self._lock:
+            services = self.storage.load()
+            # Lazy backends only compile the services that are actually used. URIs
+            # that do not parse are kept as they are; get_code reports the error
+            # when asked for.
+            if self.storage.lazy:
+                generators = {}
+            else:
+                if not isinstance(services, ServiceURIs):
+                    services = ServiceURIs(services)
+                generators = services.records
+            self._snapshot = (services, generators)
+            self.code_cache.clear()
+            self.replay_cache.clear()
+            # Reading every name of a lazy vault is what lazy loading avoids, so
+            # its index is only built by the first search.
+            self.search_index = None if self.storage.lazy else NameIndex(services)
+            self._resize_cache()
 
+    @timed("manager.save_services")
     def save_services(self):
-        with open(self.data_file, "w") as file:
-            json.dump(self.services, file, indent=4)
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    self._cancel_autosave()
+                    if self.storage.changed():
+                        self._merge_external_changes(self.storage.load())
+                    pending, self._pending = self._pending, []
+                    services = self.services
+                try:
+                    with self.storage.lock():
+                        if not self.storage.changed():
+                            self.storage.save(services)
+                            self.writes += 1
+                            self.save_error = None
+                            return
+                except BaseException:
+                    with self._lock:
+                        self._pending[:0] = pending
+                    raise
+                with self._lock:
+                    self._pending[:0] = pending
+
+    def reload_if_changed(self):
+        """
+        Picks up the changes another process made to the vault.
+
+        Detecting that nothing changed costs a `stat` call (a query for SQLite), so
+        this can be polled. When something did change, only the services whose URI
+        differs are recompiled and have their cached codes dropped. Changes made
+        here but not written yet are kept on top of the other process's.
+
+        Returns:
+            set: The names of the services that were added, edited or deleted by
+                another process since the last call.
+        """
+        with self._lock:
+            if self.storage.changed():
+                self._merge_external_changes(self.storage.load())
+            changed, self._external_changes = self._external_changes, set()
+            return changed
+
+    def close(self):
+        """
+        Flushes pending changes, stops background work and releases the storage
+        backend.
+        """
+        try:
+            self.flush()
+        finally:
+            if self.autosave_delay is not None:
+                atexit.unregister(self.flush)
+            self.stop_prefetch()
+            self.storage.close()
 
     def add_service(self, name, uri):
-        self.services[name] = uri
-        self.save_services()
+        generator = Service.from_uri(uri, name)
+        with self._write() as (services, generators):
+            self._put(services, generators, name, uri, generator)
+            self._pending.append((name, uri))
+        self._write_if_due()
+
+    def add_services(self, services):
+        """
+        Adds or replaces many services and persists them in a single write.
+
+        Args:
+            services (dict): The {name: uri} pairs to add.
+
+        Raises:
+            ValueError: If one of the URIs is invalid; nothing is added then.
+        """
+        compiled = {}
+        for name, uri in services.items():
+            try:
+                compiled[name] = Service.from_uri(uri, name)
+            except ValueError as error:
+                raise ValueError(f"{name}: {error}") from error
+        self._add_records(compiled)
+
+    def import_stream(self, source, format=None, processes=None):
+        """
+        Imports services from a file or a stream of lines, in a single write.
+
+        The input is read and validated as a pipeline, in chunks spread over a
+        process pool when it is large, so it is never held in memory as a whole
+        (except for JSON documents). Valid entries are added or replace existing
+        services of the same name, and a later entry wins over an earlier one.
+        Invalid entries are skipped and reported with their line number.
+
+        Example:
+            report = manager.import_stream("export.csv")
+            for line, message in report.errors:
+                print(f"line {line}: {message}")
+
+        Args:
+            source (str or iterable): A file path, or an iterable of lines such as
+                an open file.
+            format (str, optional): "uri", "ndjson", "json" or "csv". Defaults to
+                the format given by the file extension, or else guessed from the
+                first entry. See transfer.read_entries.
+            processes (int, optional): The size of the process pool. Defaults to
+                the number of CPUs; 1 validates in this process.
+
+        Returns:
+            ImportReport: The number of services imported and the rejected lines.
+
+        Raises:
+            ValueError: If the format is unknown or a JSON document is malformed;
+                nothing is imported then.
+        """
+        from .transfer import ImportReport, parse_entries, read_entries
+
+        report = ImportReport()
+        records = {}
+        entries = read_entries(source, format)
+        for line, name, service, error in parse_entries(entries, processes):
+            if error is None:
+                records[name] = service
+            else:
+                report.errors.append((line, error))
+        self._add_records(records)
+        report.imported = len(records)
+        return report
+
+    def export_stream(self, target, format=None):
+        """
+        Exports the services to a file, written atomically, or to an open file.
+
+        Args:
+            target (str or file): The path or the text file.
+            format (str, optional): "uri", "ndjson", "json" or "csv". Defaults to
+                the format given by the file extension, or ndjson. The uri format
+                does not keep the names of services whose label differs.
+
+        Returns:
+            int: The number of services exported.
+        """
+        from .transfer import write_entries
+
+        services = self.services
+        write_entries(((name, services[name]) for name in services), target, format)
+        return len(services)
+
+    def merkle_tree(self, depth):
+        """
+        Returns the hash tree of the current snapshot, used by `diff` and `sync`.
+        It is built on first use and kept until the snapshot changes.
+
+        Args:
+            depth (int): The number of levels below the root.
+
+        Returns:
+            sync.MerkleTree: The tree.
+        """
+        from .sync import MerkleTree
+
+        snapshot = self._snapshot
+        cached = self._merkle_tree
+        if cached is None or cached[0] is not snapshot or cached[1].depth != depth:
+            cached = self._merkle_tree = (snapshot, MerkleTree(snapshot[0], depth))
+        return cached[1]
+
+    def diff(self, other):
+        """
+        Compares this vault with another by their hash trees, so only the parts of
+        the trees holding a difference are visited.
+
+        Args:
+            other (OTPManager, str or peer): Another manager, the path of a JSON
+                vault, or a peer such as sync.SocketPeer.
+
+        Returns:
+            sync.VaultDiff: The names only here, only there, and with different URIs.
+        """
+        from .sync import compare
+
+        with self._peer(other) as peer:
+            return compare(self._peer_of(self), peer)
+
+    def sync(self, peer, conflicts="report"):
+        """
+        Exchanges the entries that differ with another vault, in both directions.
+
+        Only the differing entries are read and written, each side in a single
+        write. Entries missing on one side are copied to it, so a deletion is not
+        propagated; entries with different URIs on each side are settled by the
+        conflict policy.
+
+        Example:
+            report = manager.sync("laptop.json", conflicts="newest")
+
+        Args:
+            peer (OTPManager, str or peer): Another manager, the path of a JSON
+                vault, or a peer such as sync.SocketPeer.
+            conflicts (str): "report" (the default) leaves conflicting entries
+                unchanged and lists them; "ours" or "theirs" keeps one side's URI;
+                "newest" keeps the URI of the vault written last, since entries
+                carry no timestamps of their own.
+
+        Returns:
+            sync.SyncReport: The names sent, received and left in conflict.
+
+        Raises:
+            ValueError: If the conflict policy is unknown.
+        """
+        from .sync import sync
+
+        with self._peer(peer) as other:
+            return sync(self._peer_of(self), other, conflicts)
+
+    @staticmethod
+    def _peer_of(manager):
+        from .sync import LocalPeer
+
+        manager.reload_if_changed()
+        return LocalPeer(manager)
+
+    @contextmanager
+    def _peer(self, other):
+        """
+        Yields the sync peer of a manager, a path or a peer. A vault opened from a
+        path is closed, and so written, on the way out.
+        """
+        if isinstance(other, OTPManager):
+            yield self._peer_of(other)
+        elif isinstance(other, (str, os.PathLike)):
+            manager = OTPManager(data_file=os.fspath(other))
+            try:
+                yield self._peer_of(manager)
+            finally:
+                manager.close()
+        else:
+            yield other
 
     def edit_service(self, old_name, new_name, new_uri):
-        if old_name in self.services:
-            del self.services[old_name]
-        self.services[new_name] = new_uri
-        self.save_services()
+        generator = Service.from_uri(new_uri, new_name)
+        with self._write() as (services, generators):
+            changes = [(new_name, new_uri)]
+            if old_name != new_name:
+                changes.insert(0, (old_name, None))
+                if old_name in services:
+                    self._remove(services, generators, old_name)
+            self._put(services, generators, new_name, new_uri, generator)
+            self._pending.extend(changes)
+        self._write_if_due()
 
     def delete_service(self, name):
-        if name in self.services:
-            del self.services[name]
-            self.save_services()
-
-    def get_code(self, name):
-        uri = self.services.get(name)
-        if uri:
-            totp = pyotp.parse_uri(uri)
-            return totp.now()
+        self.delete_services([name])
+
+    def delete_services(self, names):
+        """
+        Deletes many services and persists the deletion in a single write. Names
+        that do not exist are ignored.
+
+        Args:
+            names (iterable): The names of the services to delete.
+        """
+        with self._write() as (services, generators):
+            for name in names:
+                if name in services:
+                    self._remove(services, generators, name)
+                    self._pending.append((name, None))
+        self._write_if_due()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups mutations so that they are persisted once, when the outermost batch
+        exits. Batches may be nested.
+
+        Example:
+            with manager.batch():
+                manager.add_service("A", uri_a)
+                manager.delete_service("B")
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+            self._write_if_due()
+
+    @timed("manager.flush")
+    def flush(self):
+        """
+        Writes pending changes to storage, if there are any.
+
+        The changes and the snapshot to write are taken under the writer lock, but
+        written after releasing it. The write itself happens under the storage
+        lock and only if nobody else wrote in between; otherwise the other writer's
+        changes are merged first and the write is retried, so they are never
+        overwritten. If the write fails, the changes stay pending for the next
+        flush and the exception is raised.
+        """
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    self._cancel_autosave()
+                    if not self._pending:
+                        return
+                    if self.storage.changed():
+                        self._merge_external_changes(self.storage.load())
+                    changes, self._pending = self._pending, []
+                    services = self.services
+                try:
+                    with self.storage.lock():
+                        if not self.storage.changed():
+                            self.storage.apply(services, changes)
+                            self.writes += 1
+                            self.save_error = None
+                            return
+                except BaseException:
+                    # The changes are put back in front of any made meanwhile, so
+                    # a failed write loses none of them and the next flush retries.
+                    with self._lock:
+                        self._pending[:0] = changes
+                    raise
+                with self._lock:
+                    self._pending[:0] = changes
+
+    @contextmanager
+    def _write(self):
+        """
+        Holds the writer lock and yields a private copy of the (services,
+        generators) snapshot to change, which is published when the block exits.
+        Lazy storages write through their mapping view, so only the generators are
+        copied for them; otherwise the generators are the records of the services.
+        """
+        with self._lock:
+            services, generators = self._snapshot
+            if self.storage.lazy:
+                generators = dict(generators)
+            else:
+                services = services.copy()
+                generators = services.records
+            yield services, generators
+            self._snapshot = (services, generators)
+            self._resize_cache()
+
+    def _merge_external_changes(self, loaded):
+        """
+        Publishes a vault reloaded after another process changed it, keeping the
+        pending changes, and updates the services that differ. Must be called with
+        the writer lock held.
+        """
+        current, generators = self._snapshot
+        if self.storage.lazy:
+            # Pending writes already went through the view. Only the compiled
+            # services are compared, plus the names once a search has read them,
+            # so the vault is never fully read.
+            services, generators = loaded, dict(generators)
+            changed = set()
+            if self.search_index is not None:
+                names = set(loaded)
+                for name in names.symmetric_difference(self.search_index):
+                    changed.add(name)
+                    if name in names:
+                        self.search_index.add(name)
+                    else:
+                        self.search_index.remove(name)
+            for name, generator in list(generators.items()):
+                try:
+                    if Service.from_uri(loaded[name], name) == generator:
+                        continue
+                except (KeyError, ValueError):
+                    pass
+                changed.add(name)
+        else:
+            for name, uri in self._pending:
+                if uri is None:
+                    loaded.pop(name, None)
+                else:
+                    loaded[name] = uri
+            changed = {
+                name
+                for name in current.keys() | loaded.keys()
+                if current.get(name) != loaded.get(name)
+            }
+            services = current.copy()
+            generators = services.records
+        for name in changed:
+            self._forget(generators, name)
+            if self.storage.lazy:
+                continue
+            if name in loaded:
+                services[name] = loaded[name]
+                self.search_index.add(name)
+            else:
+                services.pop(name, None)
+                self.search_index.remove(name)
+        self._snapshot = (services, generators)
+        self._resize_cache()
+        self._external_changes |= changed
+
+    def _add_records(self, records):
+        """
+        Adds or replaces compiled services and persists them in a single write.
+
+        Args:
+            records (dict): The {name: Service} records to add.
+        """
+        if not records:
+            return
+        with self._write() as (services, generators):
+            for name, record in records.items():
+                uri = record.uri
+                self._put(services, generators, name, uri, record)
+                self._pending.append((name, uri))
+        self._write_if_due()
+
+    def _put(self, services, generators, name, uri, generator):
+        self._forget(generators, name)
+        if self.storage.lazy:
+            services[name] = uri
+        else:
+            # The generators are the records of the services, so only a broken URI
+            # previously stored under the name is left to drop.
+            services.invalid.pop(name, None)
+        generators[name] = generator
+        if self.search_index is not None:
+            self.search_index.add(name)
+
+    def _remove(self, services, generators, name):
+        del services[name]
+        self._forget(generators, name)
+        if self.search_index is not None:
+            self.search_index.remove(name)
+
+    def _write_if_due(self):
+        """
+        Writes the pending changes right away or after the autosave delay, unless
+        a batch is open. Called after the writer lock is released.
+        """
+        with self._lock:
+            if self._batch_depth or not self._pending:
+                return
+            if self.autosave_delay is not None:
+                self._cancel_autosave()
+                self._autosave_timer = threading.Timer(
+                    self.autosave_delay, self._autosave
+                )
+                self._autosave_timer.daemon = True
+                self._autosave_timer.start()
+                return
+        self.flush()
+
+    def _autosave(self):
+        """
+        Runs a delayed write on the autosave thread. Nobody would see an exception
+        raised there, so a failure is stored and handed to `on_save_error` instead.
+        """
+        try:
+            self.flush()
+        except Exception as error:
+            self.save_error = error
+            if self.on_save_error is not None:
+                self.on_save_error(error)
+
+    def _cancel_autosave(self):
+        if self._autosave_timer is not None:
+            self._autosave_timer.cancel()
+            self._autosave_timer = None
+
+    def _forget(self, generators, name):
+        """
+        Drops the compiled generator and all cached state of a service.
+        """
+        generators.pop(name, None)
+        self.code_cache.discard(name)
+        self.replay_cache.discard(name)
+
+    def search(self, query, limit=None):
+        """
+        Finds the services whose names match a type-ahead query.
+
+        Names containing the query as a case-insensitive prefix rank first, then
+        those containing it as a substring, then those containing its characters in
+        order (fuzzy matches). The index is updated on every add, edit and delete,
+        never rebuilt. For a lazy storage it is built by the first search.
+
+        Args:
+            query (str): The text typed so far. An empty query matches every service.
+            limit (int, optional): The maximum number of names to return.
+
+        Returns:
+            list: The matching service names, best matches first.
+        """
+        index = self.search_index
+        if index is None:
+            with self._lock:
+                if self.search_index is None:
+                    self.search_index = NameIndex(self.services)
+                index = self.search_index
+        return index.search(query, limit)
+
+    def get_generator(self, name):
+        """
+        Returns the record of a service, which is also its code generator. With a
+        lazy storage, it is compiled on first use.
+
+        Args:
+            name (str): The name of the service.
+
+        Returns:
+            Service: The record, or None if the service does not exist.
+
+        Raises:
+            ValueError: If the URI of the service is invalid.
+        """
+        services, generators = self._snapshot
+        generator = generators.get(name)
+        if generator is None:
+            uri = services.get(name)
+            if not uri:
+                return None
+            # The snapshot's generators double as a cache of compiled URIs; the
+            # URI of a name never changes within a snapshot.
+            if registry.enabled:
+                start = time.perf_counter()
+                generator = Service.from_uri(uri, name)
+                registry.observe("manager.parse_uri", time.perf_counter() - start)
+            else:
+                generator = Service.from_uri(uri, name)
+            generators[name] = generator
+            self._resize_cache()
+        return generator
+
+    def get_code(self, name, at=None):
+        """
+        Returns the code of a service for the time step containing `at`.
+
+        Codes are memoized per (service, counter), so repeated calls within the same
+        time step only cost a cache lookup.
+
+        Args:
+            name (str): The name of the service.
+            at (float or datetime.datetime, optional): The time to generate the code
+                for. Defaults to now.
+
+        Returns:
+            str: The code, or None if the service does not exist.
+        """
+        if registry.enabled:
+            registry.count("manager.get_code")
+        generator = self.get_generator(name)
+        if generator:
+            return self._code(name, generator, generator.counter(at))
         return None
+
+    def peek_code(self, name, at=None):
+        """
+        Returns the code of a service only if it is already compiled and cached, so
+        the call never parses a URI or computes an HMAC.
+
+        The generator is returned with the code, both read from the same snapshot,
+        so its period matches the code even if the service is edited meanwhile.
+
+        Args:
+            name (str): The name of the service.
+            at (float or datetime.datetime, optional): The time of the code.
+                Defaults to now.
+
+        Returns:
+            tuple: The (generator, code) pair, or None if the code is not cached.
+        """
+        generator = self.generators.get(name)
+        if generator is None:
+            return None
+        entry = self.code_cache.get((name, generator.counter(at)))
+        if entry is not None and entry[0] is generator:
+            return generator, entry[1]
+        return None
+
+    def get_next_code(self, name):
+        """
+        Returns the code of a service for the time step after the current one.
+
+        Args:
+            name (str): The name of the service.
+
+        Returns:
+            str: The code, or None if the service does not exist.
+        """
+        generator = self.get_generator(name)
+        if generator:
+            return self._code(name, generator, generator.counter() + 1)
+        return None
+
+    def verify(self, name, code, window=1, at=None):
+        """
+        Checks a code received for a service.
+
+        The code is compared in constant time against every time step within
+        `window` steps of `at`, and a code whose time step has already been used is
+        rejected as a replay.
+
+        Args:
+            name (str): The name of the service.
+            code (str): The code to check. Spaces are ignored.
+            window (int): The number of time steps of clock drift accepted on either
+                side of the current one.
+            at (float or datetime.datetime, optional): The time to check against.
+                Defaults to now.
+
+        Returns:
+            bool: True if the code is valid and has not been used before.
+        """
+        generator = self.get_generator(name)
+        # compare_digest only takes ASCII strings, and no code has other characters.
+        if generator is None or not isinstance(code, str) or not code.isascii():
+            return False
+        code = code.replace(" ", "")
+        current = generator.counter(at)
+        matched = None
+        # Every candidate is compared, so the timing does not reveal which one hit.
+        for counter in range(max(current - window, 0), current + window + 1):
+            if hmac.compare_digest(self._code(name, generator, counter), code):
+                matched = counter
+        if matched is None:
+            return False
+        return self.replay_cache.use(name, matched, current - window)
+
+    def verify_many(self, attempts, window=1, at=None):
+        """
+        Checks a batch of (name, code) pairs against the same point in time.
+
+        Args:
+            attempts (iterable): The (name, code) pairs to check.
+            window (int): See `verify`.
+            at (float or datetime.datetime, optional): The time to check against.
+                Defaults to now.
+
+        Returns:
+            list: One bool per pair, in order.
+        """
+        if at is None:
+            at = time.time()
+        return [self.verify(name, code, window, at) for name, code in attempts]
+
+    def generate_batch(self, names, counters=None, times=None):
+        """
+        Generates codes for many services over many time steps at once.
+
+        Requires NumPy (``pip install auth_manager[batch]``).
+
+        Args:
+            names (list): The service names, one per row.
+            counters (array-like, optional): The time step counters, one per column.
+            times (array-like, optional): Unix times, one per column, converted with
+                each service's own period. Exactly one of `counters` and `times`
+                must be given.
+
+        Returns:
+            numpy.ndarray: A (len(names), len(columns)) array of code strings.
+
+        Raises:
+            KeyError: If one of the services does not exist.
+        """
+        from .batch import generate_codes
+
+        generators = []
+        for name in names:
+            generator = self.get_generator(name)
+            if generator is None:
+                raise KeyError(name)
+            generators.append(generator)
+        return generate_codes(generators, counters=counters, times=times)
+
+    def _code(self, name, generator, counter):
+        key = (name, counter)
+        entry = self.code_cache.get(key)
+        # Entries remember the generator that produced them, so a code computed by
+        # the prefetch thread just before an edit is never served for the new URI.
+        if entry is None or entry[0] is not generator:
+            if registry.enabled:
+                registry.count("manager.code_cache_misses")
+            entry = (generator, generator.code(counter))
+            self.code_cache.put(key, entry)
+        return entry[1]
+
+    def _resize_cache(self):
+        self.code_cache.maxsize = max(
+            self.cache_size, CACHE_STEPS_PER_SERVICE * len(self.generators)
+        )
+
+    def prefetch_next(self, for_time=None):
+        """
+        Computes and caches the codes of every service for the next time step.
+
+        Args:
+            for_time (float, optional): The reference time. Defaults to now.
+
+        Returns:
+            int: The number of codes that had to be computed.
+        """
+        computed = 0
+        for name, generator in list(self.generators.items()):
+            counter = generator.counter(for_time) + 1
+            entry = self.code_cache.get((name, counter))
+            if entry is None or entry[0] is not generator:
+                self.code_cache.put(
+                    (name, counter), (generator, generator.code(counter))
+                )
+                computed += 1
+        return computed
+
+    def start_prefetch(self):
+        """
+        Starts a background thread that prefetches the next time step's codes right
+        after every period boundary, so the switch at the boundary is a lookup.
+        """
+        if self._prefetch_thread and self._prefetch_thread.is_alive():
+            return
+        self._prefetch_stop.clear()
+        self._prefetch_thread = threading.Thread(
+            target=self._prefetch_loop, name="otp-prefetch", daemon=True
+        )
+        self._prefetch_thread.start()
+
+    def stop_prefetch(self):
+        """
+        Stops the background prefetch thread, if it is running.
+        """
+        self._prefetch_stop.set()
+        if self._prefetch_thread:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+
+    def _prefetch_loop(self):
+        while not self._prefetch_stop.is_set():
+            self.prefetch_next()
+            now = time.time()
+            generators = list(self.generators.values())
+            periods = {generator.period for generator in generators}
+            delay = min((period - now % period for period in periods), default=30)
+            # Wake just after the boundary so the step after it is ready in advance.
+            self._prefetch_stop.wait(delay + 0.05)
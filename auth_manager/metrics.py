@@ -0,0 +1,214 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# The upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (
+    0.000001,
+    0.000005,
+    0.00001,
+    0.00005,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+)
+
+# Setting this to a file path records metrics and writes them there at exit, as
+# JSON for a .json file and in the Prometheus text format otherwise; "-" writes
+# them to standard error.
+ENVIRONMENT_VARIABLE = "AUTH_MANAGER_METRICS"
+
+
+class Registry:
+    """
+    Collects counters and latency histograms about the manager, its storage and
+    the GUI.
+
+    Recording is off by default, and every instrumented call site checks
+    `enabled` before doing anything else, so it costs one attribute lookup when
+    disabled. Hooks are called with the name and duration of every timed
+    operation, for example to log the slow ones.
+
+    Example:
+        registry.enable()
+        registry.add_hook(lambda name, seconds: seconds > 0.1 and print(name))
+        ...
+        registry.dump("metrics.prom")
+
+    Attributes:
+        enabled (bool): Whether metrics are being recorded.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._hooks = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def add_hook(self, hook):
+        """
+        Registers a function called as hook(name, seconds) after each timed
+        operation, on the thread that ran it.
+        """
+        self._hooks = self._hooks + [hook]
+
+    def remove_hook(self, hook):
+        self._hooks = [other for other in self._hooks if other is not hook]
+
+    def count(self, name, value=1):
+        """
+        Adds to a counter, if recording is enabled.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """
+        Records the duration of an operation in its histogram, if recording is
+        enabled, and calls the hooks.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = [0, 0.0, [0] * (len(BUCKETS) + 1)]
+            histogram[0] += 1
+            histogram[1] += seconds
+            histogram[2][bisect.bisect_left(BUCKETS, seconds)] += 1
+        for hook in self._hooks:
+            hook(name, seconds)
+
+    def snapshot(self):
+        """
+        Returns the metrics recorded so far.
+
+        Returns:
+            dict: {"counters": {name: value}, "histograms": {name: {"count",
+                "sum", "buckets"}}}, where buckets maps each upper bound, as a
+                string, to the number of operations that took at most that long.
+        """
+        with self._lock:
+            histograms = {}
+            for name, (count, total, buckets) in sorted(self._histograms.items()):
+                cumulative = 0
+                bounds = {}
+                for bound, hits in zip(BUCKETS + (float("inf"),), buckets):
+                    cumulative += hits
+                    bounds["+Inf" if bound == float("inf") else repr(bound)] = (
+                        cumulative
+                    )
+                histograms[name] = {"count": count, "sum": total, "buckets": bounds}
+            return {
+                "counters": dict(sorted(self._counters.items())),
+                "histograms": histograms,
+            }
+
+    def dump(self, target, format=None):
+        """
+        Writes a snapshot to a file, atomically, or to an open text file.
+
+        Args:
+            target (str or file): The path, "-" for standard error, or the file.
+            format (str, optional): "json" or "prometheus". Defaults to json for a
+                path ending in .json, and prometheus otherwise.
+        """
+        if format is None:
+            is_json = isinstance(target, str) and target.endswith(".json")
+            format = "json" if is_json else "prometheus"
+        text = (
+            to_json(self.snapshot())
+            if format == "json"
+            else to_prometheus(self.snapshot())
+        )
+        if target == "-":
+            target = sys.stderr
+        if isinstance(target, str):
+            from .storage import write_atomic
+
+            write_atomic(target, text)
+        else:
+            target.write(text)
+
+
+def to_json(snapshot):
+    return json.dumps(snapshot, indent=4) + "\n"
+
+
+def to_prometheus(snapshot):
+    """
+    Formats a snapshot in the Prometheus text exposition format, for example for
+    node_exporter's textfile collector. Names are prefixed with ``auth_manager_``;
+    counters get a ``_total`` suffix and histograms a ``_seconds`` one.
+    """
+    lines = []
+    for name, value in snapshot["counters"].items():
+        metric = f"auth_manager_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, histogram in snapshot["histograms"].items():
+        metric = f"auth_manager_{_metric_name(name)}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{metric}_sum {histogram['sum']!r}")
+        lines.append(f"{metric}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "".join(char if char.isalnum() else "_" for char in name)
+
+
+def timed(name):
+    """
+    Decorates a function so that, while recording is enabled, each call is timed
+    into the histogram `name`. When disabled, the call costs one extra check.
+    """
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+registry = Registry()
+
+if os.environ.get(ENVIRONMENT_VARIABLE):
+    registry.enable()
+    atexit.register(registry.dump, os.environ[ENVIRONMENT_VARIABLE])
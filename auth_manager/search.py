@@ -0,0 +1,200 @@
+import operator
+import re
+import threading
+from itertools import compress, islice, repeat
+
+# The most characters whose masks are kept; each takes a byte per name.
+MAX_MASKS = 32
+
+# Swaps the 0 and 1 bytes of a mask.
+_NOT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+def subsequence_pattern(query):
+    """
+    Returns a regex matching strings that contain the case-folded query as a
+    subsequence. Each character is found with a possessive negated class, which
+    takes its leftmost occurrence without ever backtracking.
+    """
+    return re.compile(
+        "".join(f"[^{re.escape(char)}]*+{re.escape(char)}" for char in query.casefold())
+    )
+
+
+def matches(name, query):
+    """
+    Returns True if the name contains the query as a case-insensitive subsequence,
+    which includes prefixes and substrings.
+    """
+    return subsequence_pattern(query).match(name.casefold()) is not None
+
+
+class _Keep(dict):
+    """
+    A str.translate table keeping its own characters and deleting all others.
+    """
+
+    def __missing__(self, key):
+        return None
+
+
+def _subsequence_hits(folded, folded_query, text):
+    """
+    Tells which of the folded names contain the folded query as a subsequence.
+
+    Whether a name matches only depends on the characters it shares with the
+    query, and many names share the same ones in the same order, so each name is
+    reduced to those and the regex runs once per distinct reduced name. Reducing is
+    a single str.translate over `text`, the names joined by newlines, which is only
+    fast for ASCII text.
+    """
+    pattern = subsequence_pattern(folded_query)
+    if not text.isascii() or text.count("\n") != len(folded) - 1:
+        return map(pattern.match, folded)
+    keep = _Keep({ord(char): char for char in folded_query + "\n"})
+    reduced = text.translate(keep).split("\n")
+    verdicts = {line: pattern.match(line) is not None for line in set(reduced)}
+    return map(verdicts.__getitem__, reduced)
+
+
+class NameIndex:
+    """
+    An incrementally maintained index for type-ahead search over service names.
+
+    Names and their case-folded forms are kept in parallel lists, so a query runs as
+    `map`/`compress` pipelines whose per-name loop stays in C. Adding a name appends
+    to the lists; removing one leaves a blank slot that never matches, and the lists
+    are compacted once half of them is blank.
+
+    A query matches names containing it as a subsequence: prefix matches rank first,
+    then substring matches, then the remaining subsequence matches. Each pass only
+    looks at the names the previous ones left over, and all of them only at the
+    names containing the characters of the query, found from a byte mask per
+    character. A query computes the mask of its last character, the one just typed,
+    and the masks are kept up to date as names are added.
+    """
+
+    def __init__(self, names=()):
+        self._names = []
+        self._folded = []
+        self._slots = {}
+        self._masks = {}
+        self._lock = threading.Lock()
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, name):
+        return name in self._slots
+
+    def __iter__(self):
+        return iter(list(self._slots))
+
+    def add(self, name):
+        with self._lock:
+            if name in self._slots:
+                return
+            # The leading NUL turns a prefix test into a substring test, which is
+            # much cheaper to map over every name than str.startswith.
+            folded = "\0" + name.casefold()
+            self._slots[name] = len(self._names)
+            self._names.append(name)
+            self._folded.append(folded)
+            for char, mask in self._masks.items():
+                mask.append(char in folded)
+
+    def remove(self, name):
+        with self._lock:
+            self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            self._names, self._folded, self._slots = [], [], {}
+            self._masks = {}
+
+    def search(self, query, limit=None):
+        """
+        Finds the names matching a query.
+
+        Args:
+            query (str): The text typed so far.
+            limit (int, optional): The maximum number of names to return.
+
+        Returns:
+            list: The matching names, best matches first.
+        """
+        folded_query = query.casefold()
+        with self._lock:
+            if not folded_query:
+                # Blank slots are the only empty folded strings.
+                return list(islice(compress(self._names, self._folded), limit))
+            if len(folded_query) == 1:
+                # The masks of the character and of the character at the start
+                # are exactly the substring and prefix matches.
+                contains = self._mask(folded_query)
+                starts = self._mask("\0" + folded_query)
+                results = list(compress(self._names, self._bytes(starts)))
+                results += compress(self._names, self._bytes(contains & ~starts))
+                return results[:limit]
+
+            candidates = self._mask(folded_query[-1])
+            for char in set(folded_query):
+                if char in self._masks:
+                    candidates &= self._mask(char)
+            names, folded = self._names, self._folded
+            selected = self._bytes(candidates)
+            if 0 in selected:
+                names = list(compress(names, selected))
+                folded = list(compress(folded, selected))
+            results = []
+            text = "\n".join(folded)
+            # Prefixes, then substrings, are cheap to find and rank ahead of looser
+            # matches, so each pass only runs on the names left by the previous one
+            # and the subsequence test runs last. Searching all the names at once
+            # skips a pass that would find nothing.
+            for pattern in ("\0" + folded_query, folded_query):
+                if pattern not in text:
+                    continue
+                matched = bytes(map(operator.contains, folded, repeat(pattern)))
+                results += compress(names, matched)
+                if 0 not in matched:
+                    return results[:limit]
+                rest = matched.translate(_NOT)
+                names = list(compress(names, rest))
+                folded = list(compress(folded, rest))
+                text = "\n".join(folded)
+            results += compress(names, _subsequence_hits(folded, folded_query, text))
+            return results[:limit]
+
+    def _mask(self, key):
+        """
+        Returns, as an int with a byte per slot, which folded names contain the
+        key, computing it on first use. Must be called with the lock held.
+        """
+        mask = self._masks.get(key)
+        if mask is None:
+            if len(self._masks) >= MAX_MASKS:
+                del self._masks[next(iter(self._masks))]
+            mask = bytearray(map(operator.contains, self._folded, repeat(key)))
+            self._masks[key] = mask
+        return int.from_bytes(mask, "little")
+
+    def _bytes(self, mask):
+        return mask.to_bytes(len(self._names), "little")
+
+    def _remove(self, name):
+        slot = self._slots.pop(name, None)
+        if slot is None:
+            return
+        # The blank folded string never matches a non-empty query.
+        self._names[slot] = None
+        self._folded[slot] = ""
+        for mask in self._masks.values():
+            mask[slot] = 0
+        if len(self._slots) * 2 < len(self._names):
+            self._names = [name for name in self._names if name is not None]
+            self._folded = ["\0" + name.casefold() for name in self._names]
+            self._slots = {name: slot for slot, name in enumerate(self._names)}
+            self._masks = {}
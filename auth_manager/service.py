@@ -0,0 +1,161 @@
+import base64
+import re
+import sys
+from collections.abc import MutableMapping
+from urllib.parse import quote
+
+from .totp import Algorithm, CompiledTOTP, parse_uri
+
+# Labels and issuers made only of these characters are the same quoted, which
+# spares most of them a call to quote.
+_UNRESERVED = re.compile(r"[\w.~@:-]*", re.ASCII).fullmatch
+
+
+class Service(CompiledTOTP):
+    """
+    A service of the vault: a compiled generator that also remembers what its URI
+    says about the account, so the URI itself need not be kept.
+
+    Records are parsed once, when the vault is loaded or a service is added, and
+    turned back into a URI only when asked for one. A URI that `to_uri` would not
+    reproduce exactly (a lowercase secret, an `image` parameter, ...) is kept
+    verbatim, so the vault is always saved exactly as it was read.
+
+    Attributes:
+        label (str): The label of the URI path, usually "Issuer:account".
+        issuer (str): The issuer parameter, or None.
+        uri (str): The otpauth URI of the service.
+    """
+
+    __slots__ = ("label", "issuer", "_uri")
+
+    def __init__(
+        self,
+        key,
+        algorithm=Algorithm.SHA1,
+        digits=6,
+        period=30,
+        label="",
+        issuer=None,
+        uri=None,
+        encoder=None,
+    ):
+        super().__init__(key, algorithm, digits, period, encoder)
+        self.label = label
+        self.issuer = issuer
+        self._uri = uri
+
+    @classmethod
+    def from_uri(cls, uri, name=None):
+        """
+        Parses an otpauth URI into a record.
+
+        Args:
+            uri (str): The otpauth://totp/ URI.
+            name (str, optional): The name the service is stored under. A label
+                equal to it shares the name's string instead of holding a copy.
+
+        Returns:
+            Service: The record.
+
+        Raises:
+            ValueError: If the URI is malformed or not a TOTP URI.
+        """
+        label, issuer, key, algorithm, digits, period, encoder = parse_uri(uri)
+        if label == name:
+            label = name
+        # Issuers repeat across a vault, so each distinct one is stored once.
+        if issuer is not None:
+            issuer = sys.intern(issuer)
+        service = cls(key, algorithm, digits, period, label, issuer, encoder=encoder)
+        if service.to_uri() != uri:
+            service._uri = uri
+        return service
+
+    @property
+    def uri(self):
+        return self._uri or self.to_uri()
+
+    def to_uri(self):
+        """
+        Returns the canonical URI of the record: the label, the secret in unpadded
+        uppercase base32, then the issuer and any non-default parameters.
+        """
+        secret = base64.b32encode(self.key).decode().rstrip("=")
+        uri = f"otpauth://totp/{_quote(self.label)}?secret={secret}"
+        if self.issuer is not None:
+            uri += f"&issuer={_quote(self.issuer)}"
+        if self.algorithm is not Algorithm.SHA1:
+            uri += f"&algorithm={self.algorithm.name}"
+        if self.digits != 6 and self.encoder is None:
+            uri += f"&digits={self.digits}"
+        if self.period != 30:
+            uri += f"&period={self.period}"
+        if self.encoder is not None:
+            uri += f"&encoder={self.encoder}"
+        return uri
+
+    def _parameters(self):
+        return super()._parameters() + (self.uri,)
+
+
+def _quote(text):
+    return text if _UNRESERVED(text) else quote(text, safe="@:")
+
+
+class ServiceURIs(MutableMapping):
+    """
+    The {name: uri} mapping of a vault, stored as Service records.
+
+    Reading a URI builds it from its record; setting one parses it. URIs that do
+    not parse are kept as strings, so a vault with a broken entry still saves it
+    unchanged.
+
+    Attributes:
+        records (dict): The {name: Service} records of the valid URIs.
+        invalid (dict): The {name: uri} pairs whose URI could not be parsed.
+    """
+
+    def __init__(self, uris=(), records=None, invalid=None):
+        self.records = {} if records is None else records
+        self.invalid = {} if invalid is None else invalid
+        self.update(uris)
+
+    def __getitem__(self, name):
+        record = self.records.get(name)
+        if record is None:
+            return self.invalid[name]
+        return record.uri
+
+    def __setitem__(self, name, uri):
+        try:
+            record = Service.from_uri(uri, name)
+        except ValueError:
+            self.records.pop(name, None)
+            self.invalid[name] = uri
+        else:
+            self.invalid.pop(name, None)
+            self.records[name] = record
+
+    def __delitem__(self, name):
+        if self.records.pop(name, None) is None:
+            del self.invalid[name]
+
+    def __contains__(self, name):
+        return name in self.records or name in self.invalid
+
+    def __iter__(self):
+        yield from self.records
+        yield from self.invalid
+
+    def __len__(self):
+        return len(self.records) + len(self.invalid)
+
+    def __repr__(self):
+        return f"<ServiceURIs of {len(self)} services>"
+
+    def copy(self):
+        """
+        Returns a shallow copy; the records themselves are immutable and shared.
+        """
+        return ServiceURIs(records=dict(self.records), invalid=dict(self.invalid))
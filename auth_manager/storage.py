@@ -0,0 +1,741 @@
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import MutableMapping
+
+from .metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is only enforced within the process.
+    fcntl = None
+
+# The number of shards of a new ShardedStorage vault.
+SHARDS = 16
+
+# A sharded vault is loaded in a process pool once its shards add up to this many
+# bytes, about 10,000 services; below it, starting the processes costs more than
+# they save.
+PARALLEL_LOAD_SIZE = 1 << 20
+
+
+def write_atomic(path, data):
+    """
+    Writes a file atomically: the data goes to a temporary file in the same directory,
+    which is flushed to disk and then renamed over the target. A crash mid-write
+    leaves the previous version intact.
+
+    Args:
+        path (str): The file to write.
+        data (str or iterable): The new contents, or an iterable of strings whose
+            concatenation is the contents, written as they are produced.
+    """
+    start = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.writelines([data] if isinstance(data, str) else data)
+            file.flush()
+            os.fsync(file.fileno())
+            if registry.enabled:
+                registry.count("storage.bytes_written", os.fstat(fd).st_size)
+        os.replace(tmp_path, path)
+        if registry.enabled:
+            registry.observe("storage.write", time.perf_counter() - start)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileLock:
+    """
+    A reentrant lock that is also held across processes, with an advisory
+    ``flock`` on a lock file next to the vault.
+
+    The lock file is separate from the vault because the vault is replaced on every
+    atomic write, which would silently drop a lock held on the old file.
+
+    Attributes:
+        path (str): The path of the lock file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self, blocking=True):
+        """
+        Acquires the lock.
+
+        Args:
+            blocking (bool): Whether to wait for the lock.
+
+        Returns:
+            bool: True if the lock was acquired, which is always the case when
+                blocking.
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0 and fcntl is not None:
+            file = self._open()
+        else:
+            file = None
+        if file is not None:
+            try:
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(file.fileno(), flags)
+            except BaseException as error:
+                file.close()
+                self._lock.release()
+                if isinstance(error, BlockingIOError):
+                    return False
+                raise
+            self._file = file
+        self._depth += 1
+        return True
+
+    def _open(self):
+        """
+        Opens the lock file, creating it if needed. If the directory is missing or
+        read-only, an existing lock file is opened for reading, which `flock`
+        accepts as well; without one, None is returned and only the threads of this
+        process are locked out. Nobody can write the vault there either, so there is
+        no writer to wait for.
+        """
+        try:
+            return open(self.path, "a")
+        except OSError:
+            try:
+                return open(self.path, "r")
+            except OSError:
+                return None
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class JSONStorage:
+    """
+    Stores the vault as a single JSON object mapping service names to URIs.
+
+    Every change rewrites the whole file, atomically. Processes sharing the file
+    serialize their read-modify-write cycles with `lock`, and `changed` tells
+    whether another process wrote to it since it was last loaded, from a `stat`
+    call alone.
+
+    Attributes:
+        path (str): The path of the JSON file.
+        lazy (bool): Whether `load` returns a view that fetches services on demand
+            rather than a fully loaded dict.
+    """
+
+    lazy = False
+
+    def __init__(self, path):
+        self.path = path
+        self._file_lock = FileLock(path + ".lock")
+        self._fingerprint = None
+
+    def lock(self):
+        """
+        Returns the lock serializing access to the vault across threads and
+        processes. It is reentrant, and every method below takes it.
+        """
+        return self._file_lock
+
+    def changed(self):
+        """
+        Tells whether the vault was modified since it was last loaded or written
+        through this object, by comparing the modification time, size and inode of
+        its files.
+
+        Returns:
+            bool: True if it was modified by someone else.
+        """
+        return self._stat() != self._fingerprint
+
+    def load(self):
+        """
+        Reads the vault.
+
+        Returns:
+            dict: The services, or an empty dict if the file is missing or corrupt.
+        """
+        with self.lock():
+            self._fingerprint = self._stat()
+            return self._read_snapshot()
+
+    def save(self, services):
+        """
+        Writes the whole vault.
+
+        Args:
+            services (Mapping): The {name: uri} services to write.
+        """
+        with self.lock():
+            write_atomic(self.path, json.dumps(dict(services), indent=4))
+            self._fingerprint = self._stat()
+
+    def apply(self, services, changes):
+        """
+        Persists a list of changes.
+
+        Args:
+            services (Mapping): The full vault after the changes.
+            changes (list): (name, uri) pairs, where a uri of None is a deletion.
+        """
+        self.save(services)
+
+    def close(self):
+        pass
+
+    def _stat(self):
+        return _stat(self.path)
+
+    def _read_snapshot(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as file:
+                    return json.load(file)
+            except json.JSONDecodeError:
+                return {}
+        return {}
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class JournalStorage(JSONStorage):
+    """
+    Stores the vault as a JSON snapshot plus an append-only journal of changes.
+
+    Each change is appended to ``<path>.journal`` as one small JSON record instead of
+    rewriting the vault. Once the journal holds `compact_every` records, it is
+    rotated aside and a background thread folds it into a new snapshot, written
+    atomically. Loading replays any journals on top of the snapshot; a torn record
+    at the tail from a crash is ignored.
+
+    The snapshot has the same format as a plain JSON vault, so an existing
+    services.json is loaded as-is.
+
+    Attributes:
+        path (str): The path of the snapshot file.
+        journal_path (str): The path of the active journal.
+        compact_every (int): The number of journal records that triggers compaction.
+        fsync (bool): Whether each record is flushed to disk before returning.
+    """
+
+    def __init__(self, path, compact_every=1000, fsync=True):
+        super().__init__(path)
+        self.journal_path = path + ".journal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._journal = None
+        self._records = 0
+        self._compaction = None
+
+    def load(self):
+        with self.lock():
+            self._fingerprint = self._stat()
+            services = self._read_snapshot()
+            self._records = 0
+            for journal_path in self._rotated_journals() + [self.journal_path]:
+                self._records += self._replay(journal_path, services)
+            return services
+
+    def save(self, services):
+        with self.lock():
+            self._rotate()
+            rotated = self._rotated_journals()
+            write_atomic(self.path, json.dumps(dict(services), indent=4))
+            for journal_path in rotated:
+                os.remove(journal_path)
+            self._fingerprint = self._stat()
+
+    def apply(self, services, changes):
+        with self.lock():
+            if self._journal is not None and not self._journal_is_current():
+                # Another process rotated the journal; appending to the old file
+                # would put the records where nobody replays them.
+                self._journal.close()
+                self._journal = None
+            if self._journal is None:
+                self._journal = self._open_journal()
+            records = "".join(
+                json.dumps({"name": name, "uri": uri}) + "\n" for name, uri in changes
+            )
+            start = time.perf_counter()
+            self._journal.write(records)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            if registry.enabled:
+                registry.observe("storage.append", time.perf_counter() - start)
+                registry.count("storage.bytes_written", len(records.encode()))
+            self._fingerprint = self._stat()
+            self._records += len(changes)
+            if self._records >= self.compact_every and self._compaction is None:
+                self._rotate()
+                self._fingerprint = self._stat()
+                self._compaction = threading.Thread(
+                    target=self._compact, name="journal-compaction", daemon=True
+                )
+                self._compaction.start()
+
+    def close(self):
+        self.wait_for_compaction()
+        with self.lock():
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def wait_for_compaction(self):
+        """
+        Blocks until a running background compaction has finished.
+        """
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def _compact(self):
+        """
+        Folds the rotated journals into a new snapshot. The snapshot is rebuilt
+        from the files under the lock rather than from memory, so records that
+        other processes appended are kept.
+        """
+        self._file_lock.acquire()
+        try:
+            # The contents do not change, so unless another process wrote in the
+            # meantime the rewritten snapshot is not a change to reload.
+            current = self._stat() == self._fingerprint
+            rotated = self._rotated_journals()
+            snapshot = self._read_snapshot()
+            for journal_path in rotated:
+                self._replay(journal_path, snapshot)
+            write_atomic(self.path, json.dumps(snapshot, indent=4))
+            for journal_path in rotated:
+                os.remove(journal_path)
+            if current:
+                self._fingerprint = self._stat()
+        finally:
+            self._compaction = None
+            self._file_lock.release()
+
+    def _stat(self):
+        return (_stat(self.path), _stat(self.journal_path))
+
+    def _journal_is_current(self):
+        try:
+            return (
+                os.stat(self.journal_path).st_ino
+                == os.fstat(self._journal.fileno()).st_ino
+            )
+        except FileNotFoundError:
+            return False
+
+    def _open_journal(self):
+        journal = open(self.journal_path, "a+")
+        if journal.tell() > 0:
+            journal.seek(journal.tell() - 1)
+            if journal.read(1) != "\n":
+                # Terminate a torn record so the next one starts on its own line.
+                journal.write("\n")
+        return journal
+
+    def _rotate(self):
+        """
+        Moves the active journal aside as the next numbered generation. Must be
+        called with the lock held.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            rotated = self._rotated_journals()
+            generation = int(rotated[-1].rsplit(".", 1)[1]) + 1 if rotated else 0
+            os.replace(self.journal_path, f"{self.journal_path}.{generation}")
+        self._records = 0
+
+    def _rotated_journals(self):
+        paths = glob.glob(glob.escape(self.journal_path) + ".*")
+        generations = [path for path in paths if path.rsplit(".", 1)[1].isdigit()]
+        return sorted(generations, key=lambda path: int(path.rsplit(".", 1)[1]))
+
+    @staticmethod
+    def _replay(journal_path, services):
+        if not os.path.exists(journal_path):
+            return 0
+        replayed = 0
+        with open(journal_path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn write at the tail of the journal; the change never
+                    # completed, so it is skipped.
+                    continue
+                if record["uri"] is None:
+                    services.pop(record["name"], None)
+                else:
+                    services[record["name"]] = record["uri"]
+                replayed += 1
+        return replayed
+
+
+class ShardedStorage:
+    """
+    Stores the vault as a directory of JSON shards, with services spread across
+    them by a hash of their name.
+
+    A small ``manifest.json`` records the number of shards, fixed when the vault is
+    created; each ``shard-NNN.json`` has the format of a plain JSON vault. Loading
+    reads and compiles the shards in a process pool, so the cold start of a large
+    vault scales down with the number of CPUs, and `apply` rewrites only the shards
+    holding the changed services, so an edit writes 1/N of the vault. As a result,
+    `load` returns services grouped by shard rather than in insertion order.
+
+    Attributes:
+        path (str): The path of the vault directory.
+        shards (int): The number of shards.
+        processes (int): The size of the process pool used by `load`.
+    """
+
+    lazy = False
+
+    def __init__(self, path, shards=SHARDS, processes=None):
+        self.path = path
+        self.processes = processes or os.cpu_count() or 1
+        os.makedirs(path, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(path, "vault.lock"))
+        manifest_path = os.path.join(path, "manifest.json")
+        with self._file_lock:
+            if not os.path.exists(manifest_path):
+                write_atomic(
+                    manifest_path, json.dumps({"version": 1, "shards": shards})
+                )
+            with open(manifest_path) as file:
+                manifest = json.load(file)
+        if manifest.get("version") != 1:
+            raise ValueError(f"{path} has an unsupported manifest version")
+        self.shards = manifest["shards"]
+        self._paths = [
+            os.path.join(path, f"shard-{index:03d}.json")
+            for index in range(self.shards)
+        ]
+        # The names in each shard, as of the last load or write through this object
+        self._names = [set() for _ in self._paths]
+        self._fingerprint = None
+
+    def shard_of(self, name):
+        """
+        Returns the index of the shard holding a service; the hash is stable across
+        processes and Python versions.
+        """
+        return zlib.crc32(name.encode()) % self.shards
+
+    def lock(self):
+        """
+        Returns the lock serializing access to the vault across threads and
+        processes, one for all the shards.
+        """
+        return self._file_lock
+
+    def changed(self):
+        return self._stat() != self._fingerprint
+
+    def load(self):
+        """
+        Reads and compiles the shards, in parallel if the vault is large enough to
+        make up for starting the processes.
+
+        Returns:
+            ServiceURIs: The services.
+        """
+        from .service import ServiceURIs
+
+        with self.lock():
+            self._fingerprint = self._stat()
+            size = sum(stat[1] for stat in self._fingerprint if stat is not None)
+            processes = min(self.processes, self.shards)
+            if processes > 1 and size >= PARALLEL_LOAD_SIZE:
+                # Imported here, as it pulls in multiprocessing, which would slow
+                # down every CLI command.
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(processes) as pool:
+                    shards = list(pool.map(_load_shard, self._paths))
+            else:
+                shards = [_load_shard(path) for path in self._paths]
+        services = ServiceURIs()
+        for index, (records, invalid) in enumerate(shards):
+            services.records.update(records)
+            services.invalid.update(invalid)
+            self._names[index] = set(records).union(invalid)
+        return services
+
+    def save(self, services):
+        """
+        Writes every shard.
+
+        Args:
+            services (Mapping): The {name: uri} services to write.
+        """
+        names = [set() for _ in self._paths]
+        for name in services:
+            names[self.shard_of(name)].add(name)
+        with self.lock():
+            self._names = names
+            for index in range(self.shards):
+                self._write_shard(services, index)
+            self._fingerprint = self._stat()
+
+    def apply(self, services, changes):
+        """
+        Rewrites the shards holding the changed services.
+
+        Args:
+            services (Mapping): The full vault after the changes.
+            changes (list): (name, uri) pairs, where a uri of None is a deletion.
+        """
+        dirty = set()
+        with self.lock():
+            for name, uri in changes:
+                index = self.shard_of(name)
+                if uri is None:
+                    self._names[index].discard(name)
+                else:
+                    self._names[index].add(name)
+                dirty.add(index)
+            for index in dirty:
+                self._write_shard(services, index)
+            self._fingerprint = self._stat()
+
+    def close(self):
+        pass
+
+    def _write_shard(self, services, index):
+        shard = {name: services[name] for name in self._names[index]}
+        write_atomic(self._paths[index], json.dumps(shard, indent=4))
+
+    def _stat(self):
+        return tuple(_stat(path) for path in self._paths)
+
+
+def _load_shard(path):
+    """
+    Reads and compiles one shard. Runs in the worker processes of
+    ShardedStorage.load.
+
+    Returns:
+        tuple: The {name: Service} records and the {name: uri} invalid URIs.
+    """
+    from .service import ServiceURIs
+
+    try:
+        with open(path) as file:
+            services = ServiceURIs(json.load(file))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}, {}
+    return services.records, services.invalid
+
+
+class SQLiteStorage:
+    """
+    Stores the vault in an SQLite database, one row per service.
+
+    `load` does not read the vault: it returns a `SQLiteServices` mapping that looks
+    services up by name on demand through the unique index on the name column, so
+    startup time and memory do not depend on the vault size. Writes made through
+    the mapping join an open transaction that `apply` commits. The database runs in
+    WAL mode, so readers in other processes are not blocked by a writer. SQLite
+    serializes writers across processes itself, and `changed` relies on its
+    ``data_version``, which only moves when another connection commits.
+
+    Attributes:
+        path (str): The path of the database file.
+    """
+
+    lazy = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS services ("
+                "id INTEGER PRIMARY KEY, name TEXT NOT NULL, uri TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS services_name ON services (name)"
+            )
+        self._data_version = None
+
+    def lock(self):
+        """
+        Returns the lock serializing the use of the connection within the process.
+        """
+        return self._lock
+
+    def changed(self):
+        """
+        Tells whether another connection committed changes since the last `load`.
+        """
+        return self.execute("PRAGMA data_version")[0][0] != self._data_version
+
+    def load(self):
+        """
+        Returns a lazy mapping view of the vault.
+
+        Returns:
+            SQLiteServices: The view.
+        """
+        self._data_version = self.execute("PRAGMA data_version")[0][0]
+        return SQLiteServices(self)
+
+    def save(self, services):
+        """
+        Replaces the whole vault with the given services.
+
+        Args:
+            services (Mapping): The services to write.
+        """
+        with self._lock:
+            if not isinstance(services, SQLiteServices):
+                items = [
+                    (name, self._encode(name, uri)) for name, uri in services.items()
+                ]
+                self._connection.execute("DELETE FROM services")
+                self._connection.executemany(_UPSERT, items)
+            self._commit()
+
+    def apply(self, services, changes):
+        """
+        Commits the changes already written through the mapping view, or writes
+        them if they were made on a different mapping.
+
+        Args:
+            services (Mapping): The full vault after the changes.
+            changes (list): (name, uri) pairs, where a uri of None is a deletion.
+        """
+        with self._lock:
+            if not isinstance(services, SQLiteServices):
+                for name, uri in changes:
+                    if uri is None:
+                        self._connection.execute(_DELETE, (name,))
+                    else:
+                        self._connection.execute(
+                            _UPSERT, (name, self._encode(name, uri))
+                        )
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
+
+    def _commit(self):
+        if not registry.enabled:
+            self._connection.commit()
+            return
+        start = time.perf_counter()
+        self._connection.commit()
+        registry.observe("storage.commit", time.perf_counter() - start)
+
+    def _encode(self, name, uri):
+        """
+        Returns the value stored in the uri column for a service. Subclasses
+        override this and `_decode` to transform what is written to disk.
+        """
+        return uri
+
+    def _decode(self, name, value):
+        return value
+
+    def execute(self, sql, parameters=()):
+        """
+        Runs one statement on the shared connection. The sqlite3 module keeps a
+        per-connection cache of prepared statements, so the fixed SQL strings used
+        here are only compiled once.
+        """
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+
+_SELECT = "SELECT uri FROM services WHERE name = ?"
+_UPSERT = (
+    "INSERT INTO services (name, uri) VALUES (?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET uri = excluded.uri"
+)
+_DELETE = "DELETE FROM services WHERE name = ?"
+
+
+class SQLiteServices(MutableMapping):
+    """
+    A lazy {name: uri} mapping over an SQLiteStorage.
+
+    Lookups, membership checks and iteration run indexed queries instead of holding
+    the vault in memory. Iteration yields names in insertion order.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getitem__(self, name):
+        rows = self.storage.execute(_SELECT, (name,))
+        if not rows:
+            raise KeyError(name)
+        return self.storage._decode(name, rows[0][0])
+
+    def __setitem__(self, name, uri):
+        self.storage.execute(_UPSERT, (name, self.storage._encode(name, uri)))
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.storage.execute(_DELETE, (name,))
+
+    def __contains__(self, name):
+        return bool(
+            self.storage.execute("SELECT 1 FROM services WHERE name = ?", (name,))
+        )
+
+    def __iter__(self):
+        rows = self.storage.execute("SELECT name FROM services ORDER BY id")
+        return (row[0] for row in rows)
+
+    def __len__(self):
+        return self.storage.execute("SELECT COUNT(*) FROM services")[0][0]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.storage.path!r})"
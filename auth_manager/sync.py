@@ -0,0 +1,341 @@
+import hashlib
+import os
+
+# Each node of the hash tree has this many children.
+FANOUT = 16
+
+# The tree is made deep enough for a leaf to hold about this many entries.
+LEAF_SIZE = 16
+
+# The conflict policies of `sync`.
+POLICIES = ("report", "ours", "theirs", "newest")
+
+# The number of indices or entries a SocketPeer sends per request, so a request
+# stays well under the daemon's line limit.
+BATCH_SIZE = 100
+
+_EMPTY = hashlib.blake2b(b"", digest_size=16).digest()
+
+
+def tree_depth(size):
+    """
+    Returns the depth of the tree for a vault of `size` entries, so that two vaults
+    of similar sizes agree on it.
+    """
+    depth = 1
+    while FANOUT**depth * LEAF_SIZE < size:
+        depth += 1
+    return depth
+
+
+def entry_digest(name, uri):
+    """
+    Returns the content hash of one entry: any change to its name or URI changes it.
+    """
+    return hashlib.blake2b(
+        name.encode() + b"\0" + uri.encode(), digest_size=16
+    ).digest()
+
+
+class MerkleTree:
+    """
+    A hash tree summarizing the entries of a vault.
+
+    Entries are placed in the leaves by a hash of their name, so an entry lands in
+    the same leaf in every vault whatever else the vault holds. A leaf hashes the
+    content hashes of its entries and each node the hashes of its `FANOUT`
+    children; two vaults agree on a subtree exactly when its hashes are equal, so
+    comparing them from the root down only visits the subtrees holding a
+    difference.
+
+    Attributes:
+        depth (int): The number of levels below the root.
+        levels (list): The node hashes of each level, the root first and the
+            leaves last; level l has FANOUT**l nodes.
+        leaves (list): The {name: content hash} entries of each leaf.
+    """
+
+    def __init__(self, services, depth):
+        self.depth = depth
+        self.leaves = [{} for _ in range(FANOUT**depth)]
+        shift = 64 - 4 * depth
+        for name, uri in services.items():
+            placement = hashlib.blake2b(name.encode(), digest_size=8).digest()
+            leaf = int.from_bytes(placement, "big") >> shift
+            self.leaves[leaf][name] = entry_digest(name, uri)
+        level = [
+            (
+                hashlib.blake2b(
+                    b"".join(sorted(leaf.values())), digest_size=16
+                ).digest()
+                if leaf
+                else _EMPTY
+            )
+            for leaf in self.leaves
+        ]
+        self.levels = [level]
+        while len(level) > 1:
+            level = [
+                hashlib.blake2b(
+                    b"".join(level[index : index + FANOUT]), digest_size=16
+                ).digest()
+                for index in range(0, len(level), FANOUT)
+            ]
+            self.levels.insert(0, level)
+
+
+class VaultDiff:
+    """
+    The differences between two vaults.
+
+    Attributes:
+        only_here (list): The names only in this vault.
+        only_there (list): The names only in the other vault.
+        different (list): The names in both vaults with different URIs.
+    """
+
+    def __init__(self, only_here, only_there, different):
+        self.only_here = only_here
+        self.only_there = only_there
+        self.different = different
+
+    def __bool__(self):
+        return bool(self.only_here or self.only_there or self.different)
+
+    def __repr__(self):
+        return (
+            f"<VaultDiff only_here={len(self.only_here)} "
+            f"only_there={len(self.only_there)} different={len(self.different)}>"
+        )
+
+
+class SyncReport:
+    """
+    The outcome of a sync.
+
+    Attributes:
+        sent (list): The names written to the peer.
+        received (list): The names written to this vault.
+        conflicts (list): The names whose URIs differ and were left as they are,
+            with the "report" policy.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.received = []
+        self.conflicts = []
+
+    @property
+    def transferred(self):
+        """
+        The number of records that crossed over, in either direction.
+        """
+        return len(self.sent) + len(self.received)
+
+    def __repr__(self):
+        return (
+            f"<SyncReport sent={len(self.sent)} received={len(self.received)} "
+            f"conflicts={len(self.conflicts)}>"
+        )
+
+
+class LocalPeer:
+    """
+    The sync interface of a manager in this process.
+
+    A peer answers the queries of `compare` and `sync`; SocketPeer answers the same
+    ones from a daemon. Hashes are exchanged as hex strings.
+
+    Attributes:
+        manager (OTPManager): The manager of the vault.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def size(self):
+        return len(self.manager.services)
+
+    def node_hashes(self, depth, level, indices):
+        level = self.manager.merkle_tree(depth).levels[level]
+        return [level[index].hex() for index in indices]
+
+    def leaf_entries(self, depth, indices):
+        leaves = self.manager.merkle_tree(depth).leaves
+        return {
+            name: digest.hex()
+            for index in indices
+            for name, digest in leaves[index].items()
+        }
+
+    def get_entries(self, names):
+        services = self.manager.services
+        return {name: services[name] for name in names}
+
+    def put_entries(self, entries):
+        self.manager.add_services(entries)
+
+    def modified(self):
+        return vault_modified(self.manager.storage)
+
+
+class SocketPeer:
+    """
+    The sync interface of a vault served by the daemon, see daemon.CodeServer.
+
+    Example:
+        with Client() as client:
+            report = manager.sync(SocketPeer(client))
+
+    Attributes:
+        client (Client): The connection to the daemon.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def size(self):
+        return int(self.client.request("sync-size"))
+
+    def node_hashes(self, depth, level, indices):
+        requests = [
+            ("sync-nodes", depth, level, ",".join(map(str, batch)))
+            for batch in _batches(indices)
+        ]
+        return [
+            digest
+            for value in self.client.pipeline(requests)
+            for digest in value.split("\t")
+        ]
+
+    def leaf_entries(self, depth, indices):
+        requests = [
+            ("sync-leaves", depth, ",".join(map(str, batch)))
+            for batch in _batches(indices)
+        ]
+        return _pairs(self.client.pipeline(requests))
+
+    def get_entries(self, names):
+        requests = [("sync-get", *batch) for batch in _batches(names)]
+        return _pairs(self.client.pipeline(requests))
+
+    def put_entries(self, entries):
+        items = [field for item in entries.items() for field in item]
+        self.client.pipeline(
+            [("sync-put", *batch) for batch in _batches(items, 2 * BATCH_SIZE)]
+        )
+
+    def modified(self):
+        return float(self.client.request("sync-modified"))
+
+
+def _batches(items, size=BATCH_SIZE):
+    items = list(items)
+    return [items[index : index + size] for index in range(0, len(items), size)]
+
+
+def _pairs(values):
+    pairs = {}
+    for value in values:
+        fields = value.split("\t") if value else []
+        pairs.update(zip(fields[::2], fields[1::2]))
+    return pairs
+
+
+def vault_modified(storage):
+    """
+    Returns the time the vault of a storage was last written, from its files. The
+    vault format has no per-entry timestamps, so this is what "newest" compares.
+    """
+    path = storage.path
+    paths = [path, path + "-wal", path + ".journal"]
+    if os.path.isdir(path):
+        paths += [os.path.join(path, name) for name in os.listdir(path)]
+    return max(
+        (os.stat(path).st_mtime for path in paths if os.path.exists(path)),
+        default=0.0,
+    )
+
+
+def compare(here, there):
+    """
+    Finds the entries that differ between two peers by walking their hash trees
+    down from the root, only into the subtrees whose hashes differ. For c
+    differences among n entries, this exchanges O(c · log n) hashes in one round
+    trip per level, plus the entries of the c differing leaves.
+
+    Args:
+        here (LocalPeer or SocketPeer): This vault.
+        there (LocalPeer or SocketPeer): The other vault.
+
+    Returns:
+        VaultDiff: The differences, from the point of view of `here`.
+    """
+    depth = tree_depth(max(here.size(), there.size()))
+    indices = [0]
+    for level in range(depth + 1):
+        differing = [
+            index
+            for index, mine, theirs in zip(
+                indices,
+                here.node_hashes(depth, level, indices),
+                there.node_hashes(depth, level, indices),
+            )
+            if mine != theirs
+        ]
+        if level == depth or not differing:
+            break
+        indices = [
+            index * FANOUT + child for index in differing for child in range(FANOUT)
+        ]
+    if not differing:
+        return VaultDiff([], [], [])
+    mine = here.leaf_entries(depth, differing)
+    theirs = there.leaf_entries(depth, differing)
+    return VaultDiff(
+        sorted(mine.keys() - theirs.keys()),
+        sorted(theirs.keys() - mine.keys()),
+        sorted(
+            name for name in mine.keys() & theirs.keys() if mine[name] != theirs[name]
+        ),
+    )
+
+
+def sync(here, there, conflicts="report"):
+    """
+    Makes two peers hold the same entries, moving only the entries that differ.
+
+    Entries missing on one side are copied over, so deleting a service only sticks
+    once it is deleted from both vaults. Entries present on both sides with
+    different URIs are conflicts, settled by the policy.
+
+    Args:
+        here (LocalPeer or SocketPeer): This vault.
+        there (LocalPeer or SocketPeer): The other vault.
+        conflicts (str): "report" leaves conflicting entries as they are and lists
+            them, "ours" and "theirs" pick one side, and "newest" picks the vault
+            written last.
+
+    Returns:
+        SyncReport: What was sent, received and left in conflict.
+
+    Raises:
+        ValueError: If the policy is unknown.
+    """
+    if conflicts not in POLICIES:
+        raise ValueError(f"Unknown conflict policy {conflicts!r}")
+    diff = compare(here, there)
+    report = SyncReport()
+    if conflicts == "newest":
+        conflicts = "ours" if here.modified() >= there.modified() else "theirs"
+    report.sent = diff.only_here + (diff.different if conflicts == "ours" else [])
+    report.received = diff.only_there + (
+        diff.different if conflicts == "theirs" else []
+    )
+    if conflicts == "report":
+        report.conflicts = diff.different
+    if report.sent:
+        there.put_entries(here.get_entries(report.sent))
+    if report.received:
+        here.put_entries(there.get_entries(report.received))
+    return report
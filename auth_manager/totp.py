@@ -0,0 +1,311 @@
+import base64
+import datetime
+import enum
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, unquote, urlparse
+
+
+class Algorithm(str, enum.Enum):
+    """
+    The HMAC digests of TOTP. The values are hashlib names, and members are
+    strings, so they can be passed wherever a digest name is expected.
+    """
+
+    SHA1 = "sha1"
+    SHA256 = "sha256"
+    SHA512 = "sha512"
+
+    def __str__(self):
+        return self.value
+
+
+# The URI parameters understood by otpauth parsers, and the algorithms by their
+# URI names.
+ALGORITHMS = {algorithm.name: algorithm for algorithm in Algorithm}
+URI_PARAMETERS = {"secret", "issuer", "algorithm", "digits", "period", "image"}
+
+# Steam Guard codes, selected by the `encoder=steam` URI parameter, are five
+# characters of this alphabet, whatever the digits parameter says.
+STEAM_ALPHABET = "23456789BCDFGHJKMNPQRTVWXY"
+STEAM_DIGITS = 5
+
+
+def decode_secret(secret):
+    """
+    Decodes a base32 secret, which may be lowercase and lack its padding.
+
+    Raises:
+        ValueError: If the secret is not valid base32.
+    """
+    return base64.b32decode(secret + "=" * (-len(secret) % 8), casefold=True)
+
+
+def parse_uri(uri):
+    """
+    Parses an otpauth://totp/ URI, with the same rules as pyotp.parse_uri, so
+    that reading a URI does not pay for importing pyotp. Steam URIs
+    (`encoder=steam`) are TOTP URIs too and are accepted; HOTP URIs are not.
+
+    Args:
+        uri (str): The URI.
+
+    Returns:
+        tuple: (label, issuer, key, algorithm, digits, period, encoder), where
+            issuer is None when the URI has no issuer parameter and encoder is
+            "steam" for Steam URIs, None otherwise.
+
+    Raises:
+        ValueError: If the URI is malformed or not a TOTP URI.
+    """
+    parsed = urlparse(unquote(uri))
+    if parsed.scheme != "otpauth":
+        raise ValueError("Not an otpauth URI")
+    parameters = {}
+    for key, value in parse_qsl(parsed.query):
+        if key not in URI_PARAMETERS and key not in ("counter", "encoder"):
+            raise ValueError(f"{key} is not a valid parameter")
+        parameters[key] = value
+    if parsed.netloc != "totp":
+        raise ValueError("Only otpauth://totp/ URIs are supported")
+    encoder = parameters.get("encoder")
+    if encoder not in (None, "steam"):
+        raise ValueError(f"Unsupported encoder {encoder!r}")
+    label = parsed.path[1:]
+    issuer = parameters.get("issuer")
+    prefix, colon, _ = label.partition(":")
+    if colon and issuer is not None and prefix != issuer:
+        raise ValueError(
+            "If issuer is specified in both label and parameters, it should be equal."
+        )
+
+    secret = parameters.get("secret")
+    if not secret:
+        raise ValueError("No secret found in URI")
+    algorithm = parameters.get("algorithm", "SHA1")
+    if algorithm not in ALGORITHMS:
+        raise ValueError("Invalid value for algorithm, must be SHA1, SHA256 or SHA512")
+    if encoder == "steam":
+        digits = STEAM_DIGITS
+    else:
+        digits = int(parameters.get("digits", 6))
+        if digits not in (6, 7, 8):
+            raise ValueError("Digits may only be 6, 7, or 8")
+    period = int(parameters.get("period", 30))
+    if period <= 0:
+        raise ValueError("Period must be positive")
+    return (
+        label,
+        issuer,
+        decode_secret(secret),
+        ALGORITHMS[algorithm],
+        digits,
+        period,
+        encoder,
+    )
+
+
+class CompiledTOTP:
+    """
+    A TOTP generator compiled once from an otpauth URI.
+
+    Holds the decoded key and parameters so that computing a code only costs a
+    single HMAC, instead of re-parsing the URI and re-decoding the base32 secret.
+
+    Attributes:
+        key (bytes): The decoded shared secret.
+        algorithm (Algorithm): The HMAC digest.
+        digits (int): The number of digits in a code.
+        period (int): The length of a time step in seconds.
+        encoder (str): "steam" for Steam Guard codes, or None for decimal ones.
+    """
+
+    __slots__ = ("key", "algorithm", "digits", "period", "encoder")
+
+    def __init__(
+        self, key, algorithm=Algorithm.SHA1, digits=6, period=30, encoder=None
+    ):
+        self.key = key
+        self.algorithm = algorithm
+        self.digits = digits
+        self.period = period
+        self.encoder = encoder
+
+    def __eq__(self, other):
+        if not isinstance(other, CompiledTOTP):
+            return NotImplemented
+        return self._parameters() == other._parameters()
+
+    def __hash__(self):
+        return hash(self._parameters())
+
+    def _parameters(self):
+        return (self.key, self.algorithm, self.digits, self.period, self.encoder)
+
+    @classmethod
+    def from_uri(cls, uri):
+        """
+        Compiles an otpauth URI into a generator.
+
+        Args:
+            uri (str): The otpauth://totp/ URI.
+
+        Returns:
+            CompiledTOTP: The compiled generator.
+
+        Raises:
+            ValueError: If the URI is malformed or not a TOTP URI.
+        """
+        _, _, key, algorithm, digits, period, encoder = parse_uri(uri)
+        return cls(key, algorithm, digits, period, encoder)
+
+    def counter(self, for_time=None):
+        """
+        Returns the time step counter for the given time (defaults to now).
+
+        Args:
+            for_time (float or datetime.datetime, optional): A Unix timestamp or a
+                datetime.
+
+        Returns:
+            int: The time step counter.
+        """
+        if for_time is None:
+            for_time = time.time()
+        elif isinstance(for_time, datetime.datetime):
+            for_time = for_time.timestamp()
+        return int(for_time) // self.period
+
+    def code(self, counter):
+        """
+        Computes the code for the given time step counter.
+
+        Args:
+            counter (int): The time step counter.
+
+        Returns:
+            str: The zero-padded code, or the Steam Guard code.
+        """
+        digest = hmac.digest(self.key, counter.to_bytes(8, "big"), self.algorithm)
+        offset = digest[-1] & 0xF
+        value = int.from_bytes(digest[offset : offset + 4], "big") & 0x7FFFFFFF
+        if self.encoder == "steam":
+            # The value in base 26, least significant digit first.
+            characters = []
+            for _ in range(self.digits):
+                value, index = divmod(value, len(STEAM_ALPHABET))
+                characters.append(STEAM_ALPHABET[index])
+            return "".join(characters)
+        return str(value % 10**self.digits).zfill(self.digits)
+
+    def now(self):
+        """
+        Returns the code for the current time step.
+        """
+        return self.code(self.counter())
+
+
+class CodeCache:
+    """
+    A bounded, thread-safe LRU cache keyed by (service name, counter).
+
+    Attributes:
+        maxsize (int): The maximum number of entries kept before the least recently
+            used ones are evicted.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # The cached counters of each service, so discarding a service only visits
+        # its own entries.
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._counters.setdefault(key[0], set()).add(key[1])
+            while len(self._entries) > self.maxsize:
+                (name, counter), _ = self._entries.popitem(last=False)
+                counters = self._counters[name]
+                counters.discard(counter)
+                if not counters:
+                    del self._counters[name]
+
+    def discard(self, name):
+        """
+        Drops every cached entry belonging to the given service.
+        """
+        with self._lock:
+            for counter in self._counters.pop(name, ()):
+                del self._entries[(name, counter)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class ReplayCache:
+    """
+    Remembers which time steps of each service have already been used to verify a
+    code, so the same code cannot be accepted twice.
+
+    Entries expire together with their time step: whenever a service is checked,
+    counters that have fallen out of the accepted window are dropped, which keeps
+    each service's set bounded by the window size.
+    """
+
+    def __init__(self):
+        self._used = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(counters) for counters in self._used.values())
+
+    def use(self, name, counter, oldest):
+        """
+        Marks a time step of a service as used.
+
+        Args:
+            name (str): The name of the service.
+            counter (int): The time step counter the code matched.
+            oldest (int): The oldest counter still inside the accepted window;
+                anything older is expired.
+
+        Returns:
+            bool: True if the step was unused, False if it is a replay.
+        """
+        with self._lock:
+            used = self._used.setdefault(name, set())
+            if counter in used:
+                return False
+            expired = [step for step in used if step < oldest]
+            used.difference_update(expired)
+            used.add(counter)
+            return True
+
+    def discard(self, name):
+        with self._lock:
+            self._used.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._used.clear()
@@ -0,0 +1,317 @@
+import csv
+import itertools
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .service import Service
+from .storage import write_atomic
+
+# Entries are validated in chunks of this many. An input of more than one chunk is
+# spread over a process pool, with a bounded number of chunks in flight.
+CHUNK_SIZE = 5000
+
+FORMATS = ("uri", "ndjson", "json", "csv")
+EXTENSIONS = {
+    ".txt": "uri",
+    ".uri": "uri",
+    ".uris": "uri",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".json": "json",
+    ".csv": "csv",
+}
+
+
+class ImportReport:
+    """
+    The outcome of an import.
+
+    Attributes:
+        imported (int): The number of services added or replaced.
+        errors (list): (line, message) pairs for the rejected entries. The line is
+            1-based; for a JSON document it is the position of the entry instead.
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+
+    def __repr__(self):
+        return f"<ImportReport imported={self.imported} errors={len(self.errors)}>"
+
+
+def detect_format(path):
+    """
+    Returns the format of a file from its extension, or None if it is unknown.
+    """
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def read_entries(source, format=None):
+    """
+    Reads the raw entries of an import, one at a time.
+
+    The formats are:
+
+        uri     One otpauth URI per line, named after its label.
+        ndjson  One {"name": ..., "uri": ...} object per line; the name is optional.
+        json    A {name: uri} object, such as a vault file, or a list of URIs or of
+                {"name": ..., "uri": ...} objects. It is read as a whole.
+        csv     Rows of name and uri, after an optional header naming the columns.
+
+    Blank lines and, in the line based formats, lines starting with "#" are skipped.
+
+    Args:
+        source (str or iterable): A file path, or an iterable of lines such as an
+            open file.
+        format (str, optional): One of FORMATS. Defaults to the format given by
+            the file extension, or else guessed from the first entry.
+
+    Yields:
+        tuple: (line, value) pairs, where value is the URI or JSON line as read, or
+            a (name, uri) pair. They are checked by `parse_entries`.
+
+    Raises:
+        ValueError: If the format is unknown, or a JSON document is malformed.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        format = format or detect_format(os.fspath(source))
+        with open(source, newline="") as lines:
+            yield from _read_lines(lines, format)
+    else:
+        yield from _read_lines(source, format)
+
+
+def _read_lines(lines, format):
+    lines = iter(lines)
+    head = []
+    if format is None:
+        for line in lines:
+            head.append(line)
+            if line.strip() and not line.lstrip().startswith("#"):
+                format = _guess_format(line.strip())
+                break
+    if format not in FORMATS:
+        raise ValueError(f"Unknown import format {format!r}")
+    lines = itertools.chain(head, lines)
+
+    if format == "json":
+        yield from _read_json(json.loads("".join(lines)))
+    elif format == "csv":
+        yield from _read_csv(lines)
+    else:
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield number, line
+
+
+def _guess_format(line):
+    if line.startswith("otpauth:"):
+        return "uri"
+    if line.startswith("["):
+        return "json"
+    if line.startswith("{"):
+        try:
+            return "ndjson" if isinstance(json.loads(line), dict) else "json"
+        except ValueError:
+            return "json"
+    return "csv"
+
+
+def _read_json(document):
+    if isinstance(document, dict):
+        items = document.items()
+    elif isinstance(document, list):
+        items = (
+            (
+                (entry.get("name"), entry.get("uri"))
+                if isinstance(entry, dict)
+                else (None, entry)
+            )
+            for entry in document
+        )
+    else:
+        raise ValueError("A JSON import must be an object or a list")
+    for position, (name, uri) in enumerate(items, 1):
+        yield position, (name, uri)
+
+
+def _read_csv(lines):
+    reader = csv.reader(lines)
+    columns = None
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if columns is None:
+            header = [cell.strip().lower() for cell in row]
+            if "uri" in header:
+                columns = (
+                    header.index("name") if "name" in header else None,
+                    header.index("uri"),
+                )
+                continue
+            columns = (0, 1) if len(row) > 1 else (None, 0)
+        name_column, uri_column = columns
+        name = (
+            row[name_column]
+            if name_column is not None and name_column < len(row)
+            else None
+        )
+        uri = row[uri_column] if uri_column < len(row) else None
+        yield reader.line_num, (name, uri)
+
+
+def parse_entry(value):
+    """
+    Validates and normalizes one entry read by `read_entries`.
+
+    Surrounding whitespace is stripped, and an entry without a name is named
+    after the label of its URI.
+
+    Args:
+        value: The entry: a URI, a JSON object line, or a (name, uri) pair.
+
+    Returns:
+        tuple: The (name, Service) of the entry.
+
+    Raises:
+        ValueError: If the entry is invalid.
+    """
+    if isinstance(value, tuple):
+        name, uri = value
+    elif value.startswith("{"):
+        entry = json.loads(value)
+        if not isinstance(entry, dict):
+            raise ValueError("Expected a JSON object")
+        name, uri = entry.get("name"), entry.get("uri")
+    else:
+        name, uri = None, value
+    if not isinstance(uri, str) or not uri.strip():
+        raise ValueError("No URI found")
+    if name is not None:
+        if not isinstance(name, str):
+            raise ValueError("The name must be a string")
+        name = name.strip()
+    service = Service.from_uri(uri.strip(), name)
+    if not name:
+        name = service.label
+    if not name:
+        raise ValueError("No name given and the URI has no label")
+    return name, service
+
+
+def _parse_chunk(chunk):
+    results = []
+    for line, value in chunk:
+        try:
+            name, service = parse_entry(value)
+        except ValueError as error:
+            results.append((line, None, None, str(error)))
+        else:
+            results.append((line, name, service, None))
+    return results
+
+
+def parse_entries(entries, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Validates a stream of entries, in parallel if there is more than one chunk.
+
+    Entries are consumed in chunks, and at most two chunks per process are in
+    flight, so memory stays flat whatever the length of the input. Results come
+    back in input order.
+
+    Args:
+        entries (iterable): (line, value) pairs from `read_entries`.
+        processes (int, optional): The size of the process pool. Defaults to the
+            number of CPUs; 1 validates in this process.
+        chunk_size (int): The number of entries handed to a process at once.
+
+    Yields:
+        tuple: (line, name, service, error) for each entry, where either service
+            or the error message is None.
+    """
+    entries = iter(entries)
+    chunks = iter(lambda: list(itertools.islice(entries, chunk_size)), [])
+    head = list(itertools.islice(chunks, 2))
+    processes = processes or os.cpu_count() or 1
+    if len(head) < 2 or processes == 1:
+        for chunk in itertools.chain(head, chunks):
+            yield from _parse_chunk(chunk)
+        return
+    with ProcessPoolExecutor(processes) as pool:
+        running = deque()
+        for chunk in itertools.chain(head, chunks):
+            running.append(pool.submit(_parse_chunk, chunk))
+            if len(running) >= 2 * processes:
+                yield from running.popleft().result()
+        while running:
+            yield from running.popleft().result()
+
+
+def format_entries(services, format):
+    """
+    Serializes services for an export.
+
+    The uri format only keeps the URIs, so services are named after their labels
+    when the file is imported again. The json format is the layout of a vault file.
+
+    Args:
+        services (iterable): The (name, uri) pairs to export.
+        format (str): One of FORMATS.
+
+    Yields:
+        str: The text of the export, in pieces.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if format == "uri":
+        for _, uri in services:
+            yield uri + "\n"
+    elif format == "ndjson":
+        for name, uri in services:
+            yield json.dumps({"name": name, "uri": uri}) + "\n"
+    elif format == "json":
+        separator = "{\n"
+        for name, uri in services:
+            yield f"{separator}    {json.dumps(name)}: {json.dumps(uri)}"
+            separator = ",\n"
+        yield "{}\n" if separator == "{\n" else "\n}\n"
+    elif format == "csv":
+        # csv writers return what the file's write returns, here the row itself.
+        writer = csv.writer(_Echo(), lineterminator="\n")
+        yield writer.writerow(("name", "uri"))
+        for row in services:
+            yield writer.writerow(row)
+    else:
+        raise ValueError(f"Unknown export format {format!r}")
+
+
+def write_entries(services, target, format=None):
+    """
+    Writes an export to a file path, atomically, or to an open text file.
+
+    Args:
+        services (iterable): The (name, uri) pairs to export.
+        target (str or file): The path or the file.
+        format (str, optional): One of FORMATS. Defaults to the format given by
+            the file extension, or ndjson.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        format = format or detect_format(os.fspath(target)) or "ndjson"
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format {format!r}")
+        write_atomic(target, format_entries(services, format))
+    else:
+        target.writelines(format_entries(services, format or "ndjson"))
+
+
+class _Echo:
+    def write(self, text):
+        return text
@@ -0,0 +1,73 @@
+import queue
+import threading
+
+
+class Worker:
+    """
+    Runs jobs on a background thread, one at a time and in submission order, and
+    queues their results for the thread that submitted them.
+
+    The GUI submits code computations and vault mutations here, then drains the
+    results from the Tk main loop, so neither ever blocks it. Because jobs run in
+    order, a job submitted after a mutation always sees the mutated vault.
+
+    Attributes:
+        pending (int): The number of submitted jobs whose results have not been
+            drained yet.
+    """
+
+    def __init__(self, name="auth-manager-worker"):
+        self.pending = 0
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, job, callback=None, error_callback=None):
+        """
+        Queues a job.
+
+        Args:
+            job (callable): The function to run, without arguments.
+            callback (callable, optional): Called by `drain` with the job's result.
+            error_callback (callable, optional): Called by `drain` with the exception
+                if the job raised one.
+        """
+        self.pending += 1
+        self._jobs.put((job, callback, error_callback))
+
+    def drain(self):
+        """
+        Runs the callbacks of every finished job, on the calling thread.
+
+        Returns:
+            int: The number of results handled.
+        """
+        handled = 0
+        while True:
+            try:
+                callback, value = self._results.get_nowait()
+            except queue.Empty:
+                return handled
+            self.pending -= 1
+            handled += 1
+            if callback is not None:
+                callback(value)
+
+    def stop(self):
+        """
+        Waits for the queued jobs to finish and stops the thread.
+        """
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                return
+            job, callback, error_callback = item
+            try:
+                self._results.put((callback, job()))
+            except Exception as error:
+                self._results.put((error_callback, error))
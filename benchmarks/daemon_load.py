@@ -0,0 +1,121 @@
+"""
+Load test for the auth-manager daemon.
+
+Starts the daemon in a subprocess on a synthetic vault, measures the round-trip
+latency of single requests, then the throughput of many concurrent asyncio
+clients pipelining requests.
+
+Usage:
+    python benchmarks/daemon_load.py [--services 1000] [--clients 32]
+        [--depth 16] [--duration 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from auth_manager.client import AsyncClient, Client  # noqa: E402
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+def start_daemon(directory, services):
+    vault = os.path.join(directory, "services.json")
+    with open(vault, "w") as file:
+        json.dump(
+            {f"service-{index}": URI.format(index) for index in range(services)}, file
+        )
+    path = os.path.join(directory, "daemon.sock")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "auth_manager",
+            "--vault",
+            vault,
+            "serve",
+            "--socket",
+            path,
+        ],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+    )
+    deadline = time.monotonic() + 10
+    while not os.path.exists(path):
+        if time.monotonic() > deadline or process.poll() is not None:
+            process.kill()
+            raise RuntimeError("The daemon did not start")
+        time.sleep(0.01)
+    return process, path
+
+
+def measure_latency(path, names, requests=5000):
+    samples = []
+    with Client(path) as client:
+        for index in range(requests):
+            start = time.perf_counter()
+            client.code(names[index % len(names)])
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50_us": round(statistics.median(samples) * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+    }
+
+
+async def measure_throughput(path, names, clients, depth, duration):
+    deadline = time.monotonic() + duration
+    counts = []
+
+    async def run_client(offset):
+        client = await AsyncClient.connect(path)
+        count = 0
+        try:
+            while time.monotonic() < deadline:
+                batch = [names[(offset + count + i) % len(names)] for i in range(depth)]
+                await asyncio.gather(*(client.code(name) for name in batch))
+                count += depth
+        finally:
+            await client.close()
+        counts.append(count)
+
+    start = time.monotonic()
+    await asyncio.gather(*(run_client(index * 7919) for index in range(clients)))
+    return round(sum(counts) / (time.monotonic() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--depth", type=int, default=16, help="Pipelined requests.")
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    names = [f"service-{index}" for index in range(args.services)]
+    with tempfile.TemporaryDirectory() as directory:
+        process, path = start_daemon(directory, args.services)
+        try:
+            latency = measure_latency(path, names)
+            throughput = asyncio.run(
+                measure_throughput(path, names, args.clients, args.depth, args.duration)
+            )
+        finally:
+            process.terminate()
+            process.wait()
+    print(
+        f"services={args.services} clients={args.clients} depth={args.depth}\n"
+        f"latency: p50 {latency['p50_us']} us, p99 {latency['p99_us']} us\n"
+        f"throughput: {throughput} requests/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Unlock time and per-edit cost of the encrypted vault, against a plaintext JSON vault.
+
+For each vault size, reports the time to open the vault with a cold key (the
+scrypt derivation included) and with the key cached for the session, the time to
+the first code, and the median cost of editing one service, which includes the
+write to disk.
+
+Usage:
+    python benchmarks/encryption.py [--sizes 1000 10000 100000] [--edits 200]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from auth_manager.encrypted import EncryptedStorage, forget_keys  # noqa: E402
+from auth_manager.manager import OTPManager  # noqa: E402
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+PASSPHRASE = "correct horse battery staple"
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def edit_cost(manager, size, edits):
+    costs = []
+    for index in range(edits):
+        name = f"service-{index * 7919 % size}"
+        _, seconds = timed(
+            lambda: manager.edit_service(name, name, URI.format(f"edited-{index}"))
+        )
+        costs.append(seconds)
+    return statistics.median(costs)
+
+
+def measure(directory, size, edits):
+    services = {f"service-{index}": URI.format(index) for index in range(size)}
+    path = os.path.join(directory, f"{size}.vault")
+    manager = OTPManager(storage=EncryptedStorage(path, PASSPHRASE))
+    manager.add_services(services)
+    manager.close()
+
+    forget_keys()
+    manager, cold = timed(
+        lambda: OTPManager(storage=EncryptedStorage(path, PASSPHRASE))
+    )
+    _, first_code = timed(lambda: manager.get_code("service-0"))
+    manager.close()
+    manager, warm = timed(
+        lambda: OTPManager(storage=EncryptedStorage(path, PASSPHRASE))
+    )
+    encrypted_edit = edit_cost(manager, size, edits)
+    manager.close()
+
+    plain = OTPManager(data_file=os.path.join(directory, f"{size}.json"))
+    plain.add_services(services)
+    plain_edit = edit_cost(plain, size, edits)
+    plain.close()
+    return {
+        "services": size,
+        "unlock_cold_ms": round(cold * 1000, 1),
+        "unlock_warm_ms": round(warm * 1000, 1),
+        "first_code_ms": round(first_code * 1000, 3),
+        "encrypted_edit_ms": round(encrypted_edit * 1000, 3),
+        "plaintext_json_edit_ms": round(plain_edit * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--edits", type=int, default=200)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        results = [measure(directory, size, args.edits) for size in args.sizes]
+    finally:
+        shutil.rmtree(directory)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
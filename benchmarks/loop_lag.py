@@ -0,0 +1,92 @@
+"""
+Event loop lag during a bulk import, sync OTPManager versus AsyncOTPManager.
+
+A ticker coroutine sleeps 1 ms in a loop and records how late it wakes up while
+services are imported in chunks, each chunk written to disk.
+
+Usage:
+    python benchmarks/loop_lag.py [--services 20000] [--chunk 500]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from auth_manager.aio import AsyncOTPManager  # noqa: E402
+from auth_manager.manager import OTPManager  # noqa: E402
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+async def measure(import_chunks):
+    lags = []
+
+    async def tick():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await import_chunks()
+    elapsed = time.perf_counter() - start
+    ticker.cancel()
+    lags.sort()
+    return {
+        "seconds": round(elapsed, 2),
+        "ticks": len(lags),
+        "p50_ms": round(statistics.median(lags) * 1000, 2),
+        "p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 2),
+        "max_ms": round(lags[-1] * 1000, 2),
+    }
+
+
+def chunks(services, size):
+    items = list(services.items())
+    return [dict(items[start : start + size]) for start in range(0, len(items), size)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=500)
+    args = parser.parse_args()
+    services = {f"service-{index}": URI.format(index) for index in range(args.services)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = OTPManager(data_file=os.path.join(directory, "sync.json"))
+
+        async def import_sync():
+            for chunk in chunks(services, args.chunk):
+                manager.add_services(chunk)
+                await asyncio.sleep(0)
+
+        sync = await measure(import_sync)
+        manager.close()
+
+        async_manager = await AsyncOTPManager.open(
+            os.path.join(directory, "async.json")
+        )
+
+        async def import_async():
+            for chunk in chunks(services, args.chunk):
+                await async_manager.add_services(chunk)
+
+        asynchronous = await measure(import_async)
+        await async_manager.close()
+
+    print(f"{args.services} services in chunks of {args.chunk}")
+    for label, result in (("OTPManager", sync), ("AsyncOTPManager", asynchronous)):
+        print(f"{label:>16}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Memory per service: a {name: uri} dict plus compiled generators, versus records.
+
+Builds the in-memory vault both ways with tracemalloc running and reports the
+bytes allocated per entry. The names are built before measuring, since both
+layouts share them.
+
+Usage:
+    python benchmarks/memory.py [--services 1000000]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from auth_manager.service import ServiceURIs  # noqa: E402
+from auth_manager.totp import CompiledTOTP  # noqa: E402
+
+
+def vault(count):
+    uris = {}
+    for index in range(count):
+        name = f"service-{index:07d}"
+        secret = base64.b32encode(index.to_bytes(10, "big")).decode()
+        uris[name] = f"otpauth://totp/{name}?secret={secret}&issuer=Example"
+    return uris
+
+
+def measure(build, uris):
+    tracemalloc.start()
+    built = build(uris)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del built
+    return size
+
+
+def uris_and_generators(uris):
+    services = {name: "".join(uri) for name, uri in uris.items()}
+    generators = {name: CompiledTOTP.from_uri(uri) for name, uri in services.items()}
+    return services, generators
+
+
+def records(uris):
+    return ServiceURIs(uris)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    uris = vault(args.services)
+    before = measure(uris_and_generators, uris)
+    after = measure(records, uris)
+    print(
+        json.dumps(
+            {
+                "services": args.services,
+                "uris_and_generators_bytes_per_service": round(before / args.services),
+                "records_bytes_per_service": round(after / args.services),
+                "saved": f"{1 - after / before:.0%}",
+            },
+            indent=4,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
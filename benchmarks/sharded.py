@@ -0,0 +1,100 @@
+"""
+Cold start and per-edit cost of a sharded vault, against a single JSON file.
+
+For each vault size, reports the time to open the vault (OTPManager.__init__, which
+loads and compiles every service) with one process and with a pool of --processes,
+and the median cost of editing one service, which includes the write to disk.
+
+Usage:
+    python benchmarks/sharded.py [--sizes 10000 100000] [--shards 16]
+        [--processes 4] [--edits 50]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from suite import synthetic_vault  # noqa: E402
+
+from auth_manager.manager import OTPManager  # noqa: E402
+from auth_manager.storage import ShardedStorage  # noqa: E402
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def edit_cost(manager, size, edits):
+    costs = []
+    for index in range(edits):
+        name = f"service-{index * 7919 % size}"
+        _, seconds = timed(
+            lambda: manager.edit_service(name, name, URI.format(f"edited-{index}"))
+        )
+        costs.append(seconds)
+    return statistics.median(costs)
+
+
+def measure(directory, size, shards, processes, edits):
+    services = synthetic_vault(size)
+    json_path = os.path.join(directory, f"{size}.json")
+    manager = OTPManager(data_file=json_path)
+    manager.add_services(services)
+    manager.close()
+    sharded_path = os.path.join(directory, f"{size}.shards")
+    ShardedStorage(sharded_path, shards=shards).save(services)
+
+    manager, json_load = timed(lambda: OTPManager(data_file=json_path))
+    json_edit = edit_cost(manager, size, edits)
+    manager.close()
+    manager, sharded_load = timed(
+        lambda: OTPManager(storage=ShardedStorage(sharded_path, processes=1))
+    )
+    manager.close()
+    manager, parallel_load = timed(
+        lambda: OTPManager(storage=ShardedStorage(sharded_path, processes=processes))
+    )
+    sharded_edit = edit_cost(manager, size, edits)
+    manager.close()
+    return {
+        "services": size,
+        "json_load_ms": round(json_load * 1000, 1),
+        "sharded_load_ms": round(sharded_load * 1000, 1),
+        f"sharded_load_{processes}_processes_ms": round(parallel_load * 1000, 1),
+        "json_edit_ms": round(json_edit * 1000, 3),
+        "sharded_edit_ms": round(sharded_edit * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--edits", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        results = [
+            measure(directory, size, args.shards, args.processes, args.edits)
+            for size in args.sizes
+        ]
+    finally:
+        shutil.rmtree(directory)
+    print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
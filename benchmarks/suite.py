@@ -0,0 +1,370 @@
+"""
+Benchmark suite for the manager and GUI hot paths across vault sizes.
+
+For every size, a synthetic vault is generated and the following are timed:
+loading (OTPManager.__init__ and load_services), save_services, add_service,
+edit_service and delete_service (each including its write), get_code with an
+empty and a warm cache, a search per keystroke, and the GUI's refresh_service_list
+and refresh_all_codes.
+The GUI runs under $DISPLAY, or under an Xvfb server started for the run; it is
+skipped when neither tkinter nor a display is available.
+
+Each benchmark repeats its operation within a run until the run lasts long enough
+to time reliably, and reports the median and the minimum of its runs, in seconds
+per operation. The results are written as JSON and, given a baseline produced by an
+earlier run, compared against it: a benchmark that grew slower by more than the
+threshold is a regression, and the exit status is 1. The minimum is compared by
+default, as it is the least affected by other load on the machine.
+
+Usage:
+    python benchmarks/suite.py [--sizes 10 1000 100000] [--repeat 5]
+        [--storage json] [--output results.json]
+        [--baseline benchmarks/baseline.json] [--threshold 0.25]
+        [--statistic min] [--save-baseline]
+"""
+
+import argparse
+import base64
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from auth_manager.manager import OTPManager  # noqa: E402
+from auth_manager.storage import JournalStorage, SQLiteStorage  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# get_code is timed over this many services, at this time.
+CODE_SAMPLE = 1000
+START_TIME = 1_700_000_000
+
+# Each run repeats its operation until it has taken at least this long, in seconds,
+# so that fast operations are not lost in the timer's noise.
+MIN_RUN_TIME = 0.05
+
+# Every fourth service has non-default parameters, so the vault exercises the
+# algorithms, digit counts and periods a real one mixes.
+VARIANTS = ("", "&algorithm=SHA256", "&digits=8", "&period=60")
+
+# Searches as typed into the GUI's search box, one keystroke each. Every keystroke
+# should be answered within a 16 ms frame.
+SEARCH_QUERIES = ("s", "se", "ser", "serv", "service-4", "x", "", "svc1", "vc9")
+
+
+def synthetic_vault(size):
+    """
+    Returns a {name: uri} vault of `size` services with distinct secrets.
+    """
+    services = {}
+    for index in range(size):
+        secret = base64.b32encode(index.to_bytes(10, "big")).decode()
+        services[f"service-{index}"] = (
+            f"otpauth://totp/Example:user{index}?secret={secret}&issuer=Example"
+            + VARIANTS[index % len(VARIANTS)]
+        )
+    return services
+
+
+def open_manager(path, storage):
+    if storage == "journal":
+        return OTPManager(storage=JournalStorage(path))
+    if storage == "sqlite":
+        return OTPManager(storage=SQLiteStorage(path))
+    return OTPManager(data_file=path)
+
+
+def write_vault(path, storage, services):
+    manager = open_manager(path, storage)
+    manager.add_services(services)
+    manager.close()
+
+
+def measure(operation, repeat, setup=None):
+    """
+    Times an operation, repeated within each run until the run has taken at least
+    MIN_RUN_TIME, and returns the median and minimum of the runs in seconds per
+    operation.
+
+    Args:
+        operation (callable): The operation, called without arguments.
+        repeat (int): The number of runs.
+        setup (callable, optional): Called untimed before each run with the number
+            of operations the run will make.
+    """
+    number = 1
+    while True:
+        elapsed = _run(operation, number, setup)
+        if elapsed >= MIN_RUN_TIME:
+            break
+        number *= 10
+    runs = [_run(operation, number, setup) / number for _ in range(repeat)]
+    return {
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "runs": repeat,
+        "number": number,
+    }
+
+
+def _run(operation, number, setup):
+    if setup is not None:
+        setup(number)
+    start = time.perf_counter()
+    for _ in range(number):
+        operation()
+    return time.perf_counter() - start
+
+
+def manager_benchmarks(directory, size, repeat, storage):
+    extension = "db" if storage == "sqlite" else "json"
+    path = os.path.join(directory, f"vault-{size}.{extension}")
+    write_vault(path, storage, synthetic_vault(size))
+    sample = [
+        f"service-{index}" for index in range(0, size, max(1, size // CODE_SAMPLE))
+    ]
+    uri = "otpauth://totp/Bench?secret=JBSWY3DPEHPK3PXP"
+    counter = itertools.count()
+    results = {}
+
+    results["init"] = measure(lambda: open_manager(path, storage).close(), repeat)
+
+    manager = open_manager(path, storage)
+    results["load_services"] = measure(manager.load_services, repeat)
+    results["save_services"] = measure(manager.save_services, repeat)
+    # Services added by a run are deleted before the next, so the vault keeps its
+    # size.
+    added = []
+
+    def add():
+        added.append(f"bench-{next(counter)}")
+        manager.add_service(added[-1], uri)
+
+    def remove_added(number):
+        manager.delete_services(added)
+        added.clear()
+
+    results["add_service"] = measure(add, repeat, setup=remove_added)
+    remove_added(0)
+    manager.add_service("bench-edit", uri)
+    results["edit_service"] = measure(
+        lambda: manager.edit_service(
+            "bench-edit", "bench-edit", f"{uri}&digits={6 + next(counter) % 3}"
+        ),
+        repeat,
+    )
+    doomed = []
+
+    def add_doomed(number):
+        doomed[:] = [f"doomed-{next(counter)}" for _ in range(number)]
+        manager.add_services({name: uri for name in doomed})
+
+    results["delete_service"] = measure(
+        lambda: manager.delete_service(doomed.pop()), repeat, setup=add_doomed
+    )
+
+    # Every call asks for a time step not computed before, so the cache misses.
+    step = itertools.count()
+    results["get_code_cold"] = measure(
+        lambda: manager.get_code(
+            sample[next(step) % len(sample)], at=START_TIME + 60 * next(counter)
+        ),
+        repeat,
+    )
+    for name in sample:
+        manager.get_code(name, at=START_TIME)
+    results["get_code_warm"] = measure(
+        lambda: manager.get_code(sample[next(step) % len(sample)], at=START_TIME),
+        repeat,
+    )
+    queries = itertools.cycle(SEARCH_QUERIES)
+    results["search"] = measure(lambda: manager.search(next(queries)), repeat)
+    manager.close()
+
+    results.update(gui_benchmarks(path, storage, repeat))
+    return {f"{name}/{size}": result for name, result in results.items()}
+
+
+def gui_benchmarks(path, storage, repeat):
+    try:
+        from auth_manager.gui import OTPApp
+    except ImportError as error:
+        return {"gui": {"skipped": f"tkinter is not available: {error}"}}
+    if not os.environ.get("DISPLAY"):
+        return {"gui": {"skipped": "no display, and Xvfb is not installed"}}
+
+    app = OTPApp(manager=open_manager(path, storage))
+    try:
+        app.update()
+
+        def refresh_list():
+            app.refresh_service_list()
+            app.update_idletasks()
+
+        def refresh_codes():
+            app.refresh_all_codes()
+            app.update_idletasks()
+
+        return {
+            "gui_refresh_service_list": measure(refresh_list, repeat),
+            "gui_refresh_all_codes": measure(refresh_codes, repeat),
+        }
+    finally:
+        app.on_close()
+
+
+def start_virtual_display():
+    """
+    Starts an Xvfb server if there is no display and Xvfb is installed.
+
+    Returns:
+        subprocess.Popen: The server, or None if none was started.
+    """
+    if os.environ.get("DISPLAY") or not shutil.which("Xvfb"):
+        return None
+    display = f":{100 + os.getpid() % 1000}"
+    server = subprocess.Popen(
+        ["Xvfb", display, "-screen", "0", "1024x768x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    socket = f"/tmp/.X11-unix/X{display[1:]}"
+    deadline = time.monotonic() + 5
+    while not os.path.exists(socket) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    os.environ["DISPLAY"] = display
+    return server
+
+
+def compare(results, baseline, threshold, statistic="min"):
+    """
+    Compares results against a baseline.
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of the baseline run.
+        threshold (float): The relative slowdown tolerated, e.g. 0.25 for 25%.
+        statistic (str): "min" or "median". The minimum is the least sensitive to
+            other load on the machine.
+
+    Returns:
+        list: (name, baseline time, time, relative change, regressed) for the
+            benchmarks present in both.
+    """
+    rows = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if statistic not in result or not before or statistic not in before:
+            continue
+        change = result[statistic] / before[statistic] - 1
+        rows.append(
+            (name, before[statistic], result[statistic], change, change > threshold)
+        )
+    return rows
+
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--storage", choices=("json", "journal", "sqlite"), default="json"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--baseline", default=BASELINE, help="The results to compare against."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="The slowdown over the baseline reported as a regression (default 0.25).",
+    )
+    parser.add_argument(
+        "--statistic",
+        choices=("min", "median"),
+        default="min",
+        help="The statistic compared with the baseline (default min).",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing.",
+    )
+    args = parser.parse_args()
+
+    server = start_virtual_display()
+    directory = tempfile.mkdtemp()
+    try:
+        results = {}
+        for size in args.sizes:
+            results.update(
+                manager_benchmarks(directory, size, args.repeat, args.storage)
+            )
+    finally:
+        shutil.rmtree(directory)
+        if server is not None:
+            server.terminate()
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=4)
+        print(f"Saved the baseline to {args.baseline}")
+
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:34} skipped: {result['skipped']}")
+    if args.save_baseline or not os.path.exists(args.baseline):
+        for name, result in results.items():
+            if args.statistic in result:
+                print(f"{name:34} {format_seconds(result[args.statistic]):>10}")
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline["meta"].get("storage") != args.storage:
+        print(f"The baseline was measured on {baseline['meta'].get('storage')} storage")
+    regressions = 0
+    for name, before, after, change, regressed in compare(
+        results, baseline["results"], args.threshold, args.statistic
+    ):
+        regressions += regressed
+        print(
+            f"{name:34} {format_seconds(before):>10} -> {format_seconds(after):>10} "
+            f"{change:+7.1%}{'  REGRESSION' if regressed else ''}"
+        )
+    print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
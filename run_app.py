@@ -1,5 +1,4 @@
-from auth_manager.gui import OTPApp
+from auth_manager.gui import main
 
 if __name__ == "__main__":
-    app = OTPApp()
-    app.mainloop()
+    main()
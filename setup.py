@@ -12,12 +12,17 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     package_data={"": ["data/services.json"]},
-    install_requires=[
-        "pyotp>=2.9.0",
-    ],
+    install_requires=[],
+    extras_require={
+        "batch": ["numpy>=1.24"],
+        "encryption": ["cryptography>=41"],
+    },
     entry_points={
         "console_scripts": [
-            "auth-manager = auth_manager.gui:OTPApp",
+            "auth-manager = auth_manager.cli:main",
+        ],
+        "gui_scripts": [
+            "auth-manager-gui = auth_manager.gui:main",
         ],
     },
     license="MIT",
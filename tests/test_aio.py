@@ -0,0 +1,75 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from auth_manager.aio import AsyncOTPManager
+from auth_manager.manager import OTPManager
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+class TestAsyncOTPManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """Open an async manager on a temporary vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.json")
+        self.manager = await AsyncOTPManager.open(self.path)
+
+    async def asyncTearDown(self):
+        """Close the manager and remove the temporary directory."""
+        await self.manager.close()
+        shutil.rmtree(self.directory)
+
+    async def test_mirrors_sync_api(self):
+        """Test add, edit, delete, get_code and load_services as coroutines."""
+        await self.manager.add_service("A", URI.format("A"))
+        await self.manager.add_service("B", URI.format("B"))
+        await self.manager.edit_service("A", "C", URI.format("C"))
+        await self.manager.delete_service("B")
+        self.assertEqual(len(await self.manager.get_code("C")), 6)
+        self.assertIsNone(await self.manager.get_code("A"))
+        # Each mutation is on disk once it returns.
+        self.assertEqual(
+            OTPManager(data_file=self.path).services, {"C": URI.format("C")}
+        )
+        await self.manager.load_services()
+        self.assertEqual(self.manager.services, {"C": URI.format("C")})
+
+    async def test_concurrent_mutations_share_writes(self):
+        """Test that concurrent mutations are merged into a few writes."""
+        writes = self.manager.manager.writes
+        await asyncio.gather(
+            *(
+                self.manager.add_service(f"S{index}", URI.format(index))
+                for index in range(100)
+            )
+        )
+        self.assertLessEqual(self.manager.manager.writes - writes, 2)
+        self.assertEqual(len(OTPManager(data_file=self.path).services), 100)
+
+    async def test_loop_stays_responsive(self):
+        """Test that the event loop keeps ticking during a bulk import."""
+        services = {f"S{index}": URI.format(index) for index in range(5000)}
+        lags = []
+
+        async def tick():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - start - 0.001)
+
+        ticker = asyncio.create_task(tick())
+        for start in range(0, len(services), 500):
+            chunk = dict(list(services.items())[start : start + 500])
+            await self.manager.add_services(chunk)
+        ticker.cancel()
+        self.assertGreater(len(lags), 10)
+        self.assertLess(max(lags), 0.1)
+        self.assertEqual(len(self.manager.services), 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
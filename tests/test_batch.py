@@ -0,0 +1,72 @@
+import os
+import unittest
+
+from auth_manager.manager import OTPManager
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is an optional extra
+    np = None
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestGenerateBatch(unittest.TestCase):
+    def setUp(self):
+        """Set up a manager with services of every kind of generator."""
+        self.test_file = os.path.join(
+            os.path.dirname(__file__), "../data/test_batch_services.json"
+        )
+        self.manager = OTPManager(data_file=self.test_file)
+        secrets = ["JBSWY3DPEHPK3PXP", "GEZDGNBVGY3TQOJQ", "MFRGGZDFMZTWQ2LK"]
+        services = {
+            f"{index}-{algorithm}-{digits}-{period}": (
+                f"otpauth://totp/S?secret={secret}&algorithm={algorithm}"
+                f"&digits={digits}&period={period}"
+            )
+            for index, secret in enumerate(secrets)
+            for algorithm in ("SHA1", "SHA256", "SHA512")
+            for digits, period in ((6, 30), (8, 60), (7, 15))
+        }
+        for index, secret in enumerate(secrets):
+            services[f"{index}-steam"] = (
+                f"otpauth://totp/S?secret={secret}&encoder=steam"
+            )
+        self.manager.add_services(services)
+        self.names = list(self.manager.services)
+
+    def tearDown(self):
+        """Clean up the test JSON file after each test."""
+        for path in (self.test_file, self.test_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_batch_matches_get_code_for_times(self):
+        """Test that batch codes for Unix times match the scalar get_code path."""
+        times = np.arange(1_700_000_000, 1_700_000_000 + 200 * 13, 13)
+        codes = self.manager.generate_batch(self.names, times=times)
+        self.assertEqual(codes.shape, (len(self.names), len(times)))
+        for row, name in enumerate(self.names):
+            for column, at in enumerate(times.tolist()):
+                self.assertEqual(codes[row, column], self.manager.get_code(name, at=at))
+
+    def test_batch_matches_get_code_for_counters(self):
+        """Test that batch codes for raw counters match each generator."""
+        counters = [0, 1, 59, 56_666_666, 2**40]
+        codes = self.manager.generate_batch(self.names, counters=counters)
+        for row, name in enumerate(self.names):
+            generator = self.manager.get_generator(name)
+            for column, counter in enumerate(counters):
+                self.assertEqual(codes[row, column], generator.code(counter))
+
+    def test_batch_rejects_unknown_service_and_bad_arguments(self):
+        """Test argument validation of the batch engine."""
+        with self.assertRaises(KeyError):
+            self.manager.generate_batch(["Missing"], counters=[1])
+        with self.assertRaises(ValueError):
+            self.manager.generate_batch(self.names, counters=[1], times=[1])
+        with self.assertRaises(ValueError):
+            self.manager.generate_batch(self.names, counters=[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
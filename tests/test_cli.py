@@ -0,0 +1,149 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from auth_manager.cli import main
+from auth_manager.totp import CompiledTOTP
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary vault with one service."""
+        self.directory = tempfile.mkdtemp()
+        self.vault = os.path.join(self.directory, "services.json")
+        self.run_cli("add", "GitHub", URI.format("GitHub"))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+
+    def run_cli(self, *args, vault=None):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = main(["--vault", vault or self.vault, *args])
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_code(self):
+        """Test printing the current and next code of a service."""
+        generator = CompiledTOTP.from_uri(URI.format("GitHub"))
+        status, output, _ = self.run_cli("code", "GitHub")
+        self.assertEqual(status, 0)
+        self.assertIn(
+            output.strip(), {generator.now(), generator.code(generator.counter() + 1)}
+        )
+        status, output, _ = self.run_cli("code", "--next", "GitHub")
+        self.assertEqual(len(output.strip()), 6)
+
+    def test_list_add_rm(self):
+        """Test that added and removed services are persisted to the vault."""
+        self.run_cli("add", "Google", URI.format("Google"))
+        self.assertEqual(self.run_cli("list")[1].split(), ["GitHub", "Google"])
+        self.assertEqual(self.run_cli("list", "goo")[1].split(), ["Google"])
+        self.assertEqual(self.run_cli("rm", "GitHub")[0], 0)
+        self.assertEqual(self.run_cli("list")[1].split(), ["Google"])
+
+    def test_verify(self):
+        """Test that verify exits with 0 for a valid code and 1 otherwise."""
+        code = CompiledTOTP.from_uri(URI.format("GitHub")).now()
+        self.assertEqual(self.run_cli("verify", "GitHub", code)[0], 0)
+        wrong = str((int(code) + 1) % 10**6).zfill(6)
+        self.assertEqual(self.run_cli("verify", "--window", "0", "GitHub", wrong)[0], 1)
+        self.assertEqual(self.run_cli("verify", "GitHub", "12345é")[0], 1)
+
+    def test_errors(self):
+        """Test the exit status for a missing service and an invalid URI."""
+        status, _, error = self.run_cli("code", "Missing")
+        self.assertEqual(status, 1)
+        self.assertIn("Missing", error)
+        self.assertEqual(self.run_cli("rm", "Missing")[0], 1)
+        self.assertEqual(
+            self.run_cli("add", "Bad", "otpauth://hotp/Bad?secret=A")[0], 2
+        )
+
+    def test_missing_vault_directory(self):
+        """Test that a vault in a missing directory lists as empty and rejects writes."""
+        vault = os.path.join(self.directory, "missing", "services.json")
+        self.assertEqual(self.run_cli("list", vault=vault), (0, "", ""))
+        status, _, error = self.run_cli(
+            "add", "Google", URI.format("Google"), vault=vault
+        )
+        self.assertEqual(status, 2)
+        self.assertIn("No such file or directory", error)
+
+    def test_import_export(self):
+        """Test importing a CSV file and exporting the vault to another one."""
+        source = os.path.join(self.directory, "import.csv")
+        with open(source, "w") as file:
+            file.write(f"name,uri\nGoogle,{URI.format('Google')}\nBad,not a uri\n")
+        status, output, error = self.run_cli("import", source)
+        self.assertEqual(status, 1)
+        self.assertEqual(output.strip(), "imported 1 services")
+        self.assertIn("import.csv:3: Not an otpauth URI", error)
+
+        target = os.path.join(self.directory, "export.csv")
+        self.assertEqual(self.run_cli("export", target)[0], 0)
+        with open(target) as file:
+            self.assertEqual(len(file.read().splitlines()), 3)
+        self.assertEqual(self.run_cli("import", "missing.csv")[0], 2)
+
+    def test_sqlite_vault(self):
+        """Test that a .db vault is opened with the SQLite backend."""
+        vault = os.path.join(self.directory, "services.db")
+        self.run_cli("add", "GitHub", URI.format("GitHub"), vault=vault)
+        self.assertEqual(self.run_cli("list", vault=vault)[1].split(), ["GitHub"])
+
+    def test_sharded_vault(self):
+        """Test that a .shards directory is opened as a sharded vault."""
+        vault = os.path.join(self.directory, "team.shards")
+        self.run_cli("import", self.vault, vault=vault)
+        self.assertTrue(os.path.exists(os.path.join(vault, "manifest.json")))
+        self.assertEqual(self.run_cli("list", vault=vault)[1].split(), ["GitHub"])
+
+    def test_sync(self):
+        """Test listing the differences with another vault, then syncing them."""
+        other = os.path.join(self.directory, "other.json")
+        self.run_cli("add", "Google", URI.format("Google"), vault=other)
+        status, output, _ = self.run_cli("sync", other, "--dry-run")
+        self.assertEqual((status, output), (0, "< GitHub\n> Google\n"))
+        status, output, _ = self.run_cli("sync", other)
+        self.assertEqual((status, output), (0, "sent 1, received 1 services\n"))
+        self.assertEqual(self.run_cli("sync", other, "--dry-run")[1], "")
+        self.assertEqual(
+            self.run_cli("list", vault=other)[1].split(), ["Google", "GitHub"]
+        )
+
+    def test_cold_start(self):
+        """Test that a command starts fast and never imports the heavy modules."""
+        script = (
+            "import sys\n"
+            "from auth_manager.cli import main\n"
+            f"main(['--vault', {self.vault!r}, 'code', 'GitHub'])\n"
+            "for module in ('tkinter', 'pyotp', 'multiprocessing'):\n"
+            "    print(module in sys.modules)\n"
+        )
+
+        def run(code):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True
+            )
+            return time.perf_counter() - start, result.stdout.split()
+
+        baseline = min(run("pass")[0] for _ in range(3))
+        elapsed, output = min(run(script) for _ in range(3))
+        self.assertEqual(output[-3:], ["False", "False", "False"])
+        # Budget on top of bare interpreter startup.
+        self.assertLess(elapsed - baseline, 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from auth_manager.manager import OTPManager
+from auth_manager.totp import CompiledTOTP
+
+SECRETS = ["JBSWY3DPEHPK3PXP", "KRSXG5CTMVRXEZLU"]
+URI = "otpauth://totp/{}?secret={}"
+
+
+class TestConcurrentAccess(unittest.TestCase):
+    def setUp(self):
+        """Set up a manager on a temporary vault with a set of stable services."""
+        self.directory = tempfile.mkdtemp()
+        self.manager = OTPManager(data_file=os.path.join(self.directory, "vault.json"))
+        self.names = [f"Stable{index}" for index in range(50)]
+        self.manager.add_services(
+            {name: URI.format(name, SECRETS[0]) for name in self.names}
+        )
+        # Every stable service always has one of these two codes at time 0.
+        self.valid = {
+            CompiledTOTP.from_uri(URI.format("x", secret)).code(0) for secret in SECRETS
+        }
+
+    def tearDown(self):
+        """Close the manager and remove the temporary directory."""
+        self.manager.close()
+        shutil.rmtree(self.directory)
+
+    def run_threads(self, targets, duration):
+        stop = threading.Event()
+        threads = [threading.Thread(target=target, args=(stop,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    def test_readers_see_consistent_snapshots(self):
+        """Test that readers never see a service half edited while writers churn."""
+        errors = []
+        reads = [0]
+
+        def read(stop):
+            while not stop.is_set():
+                for name in self.names:
+                    code = self.manager.get_code(name, at=0)
+                    if code not in self.valid:
+                        errors.append((name, code))
+                    if name not in self.manager.services:
+                        errors.append((name, "missing"))
+                reads[0] += len(self.names)
+
+        def edit(stop):
+            index = 0
+            while not stop.is_set():
+                name = self.names[index % len(self.names)]
+                secret = SECRETS[index % 2]
+                self.manager.edit_service(name, name, URI.format(name, secret))
+                index += 1
+
+        def churn(stop):
+            index = 0
+            while not stop.is_set():
+                self.manager.add_service(f"Temp{index}", URI.format("Temp", SECRETS[0]))
+                self.manager.delete_service(f"Temp{index - 1}")
+                index += 1
+
+        self.run_threads([read] * 4 + [edit, edit, churn], duration=1.0)
+        self.assertEqual(errors, [])
+        self.assertGreater(reads[0], 0)
+        # Every write reached the disk and nothing was lost on the way.
+        reloaded = OTPManager(data_file=self.manager.data_file)
+        self.assertEqual(reloaded.services, self.manager.services)
+
+    def test_read_throughput_scales(self):
+        """Test that adding reader threads does not reduce total read throughput."""
+
+        def throughput(readers):
+            counts = [0] * readers
+
+            def read(stop, slot):
+                while not stop.is_set():
+                    for name in self.names:
+                        self.manager.get_code(name)
+                    counts[slot] += len(self.names)
+
+            def write(stop):
+                while not stop.is_set():
+                    self.manager.edit_service(
+                        "Stable0", "Stable0", URI.format("x", SECRETS[1])
+                    )
+                    time.sleep(0.001)
+
+            targets = [
+                lambda stop, slot=slot: read(stop, slot) for slot in range(readers)
+            ]
+            self.run_threads(targets + [write], duration=0.5)
+            return sum(counts) / 0.5
+
+        single, several = throughput(1), throughput(4)
+        # With the GIL the total cannot grow much, but lock-free readers must not
+        # lose throughput to contention as threads are added.
+        self.assertGreater(several, single * 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import shutil
+import stat
+import statistics
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from auth_manager.client import AsyncClient, Client
+from auth_manager.daemon import CodeServer
+from auth_manager.manager import OTPManager
+from auth_manager.metrics import registry
+from auth_manager.totp import CompiledTOTP
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        """Start a daemon on a temporary vault in a background event loop."""
+        self.directory = tempfile.mkdtemp()
+        self.manager = OTPManager(data_file=os.path.join(self.directory, "vault.json"))
+        self.manager.add_services(
+            {name: URI.format(name) for name in ["GitHub", "Google"]}
+        )
+        self.path = os.path.join(self.directory, "daemon.sock")
+        self.server = CodeServer(self.manager, self.path)
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.server.start())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the daemon and remove the temporary directory."""
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.manager.close()
+        shutil.rmtree(self.directory)
+
+    def test_commands(self):
+        """Test the code, next, verify and list commands through the sync client."""
+        generator = CompiledTOTP.from_uri(URI.format("GitHub"))
+        with Client(self.path) as client:
+            self.assertEqual(client.code("GitHub", at=0), generator.code(0))
+            self.assertEqual(len(client.next_code("GitHub")), 6)
+            self.assertIsNone(client.code("Missing"))
+            self.assertEqual(client.list(), ["GitHub", "Google"])
+            self.assertEqual(client.list("hub"), ["GitHub"])
+            code = self.manager.get_code("Google")
+            self.assertTrue(client.verify("Google", code))
+            self.assertFalse(client.verify("Google", code))
+
+    def test_errors(self):
+        """Test that bad requests get an error reply and the connection stays usable."""
+        with Client(self.path) as client:
+            with self.assertRaises(ValueError):
+                client.request("bogus")
+            with self.assertRaises(ValueError):
+                client.request("next")
+            with self.assertRaises(ValueError):
+                client.code("GitHub", at="soon")
+            self.assertEqual(client.request("ping"), "pong")
+
+    def test_bad_arguments(self):
+        """Test that bad arguments get an error reply naming the problem."""
+        requests = [
+            (("ping", "extra"), "wrong number of arguments for ping"),
+            (("sync-nodes", 2, 1), "wrong number of arguments for sync-nodes"),
+            (("sync-nodes", 2, 1, "x"), "invalid literal"),
+            (("sync-nodes", 2, 1, 99), "out of range"),
+            (("sync-leaves", "two", 0), "invalid literal"),
+            (("sync-put", "GitHub"), "name and URI pairs"),
+            (("sync-put", "Bad", "not a uri"), "Not an otpauth URI"),
+        ]
+        with Client(self.path) as client:
+            for fields, message in requests:
+                with self.subTest(fields=fields):
+                    with self.assertRaisesRegex(ValueError, message):
+                        client.request(*fields)
+            self.assertEqual(client.request("ping"), "pong")
+
+    def test_writes_run_off_the_loop(self):
+        """Test that writes and reloads run on the executor, in request order."""
+        threads = {}
+
+        def record(name, method):
+            def wrapper(*args):
+                threads[name] = threading.current_thread()
+                return method(*args)
+
+            return wrapper
+
+        peer = self.server._peer
+        with patch.object(
+            peer, "put_entries", record("put", peer.put_entries)
+        ), patch.object(
+            self.manager,
+            "reload_if_changed",
+            record("reload", self.manager.reload_if_changed),
+        ):
+            with Client(self.path) as client:
+                replies = client.pipeline(
+                    [("list",), ("sync-put", "AWS", URI.format("AWS")), ("list",)]
+                )
+            deadline = time.monotonic() + 5
+            while "reload" not in threads and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.assertEqual(replies, ["GitHub\tGoogle", "1", "GitHub\tGoogle\tAWS"])
+        self.assertIn("AWS", OTPManager(data_file=self.manager.data_file).services)
+        self.assertNotEqual(threads["put"], self.thread)
+        self.assertNotEqual(threads["reload"], self.thread)
+
+    def test_metrics(self):
+        """Test that the metrics command returns the daemon's metrics."""
+        registry.reset()
+        registry.enable()
+        try:
+            with Client(self.path) as client:
+                client.code("GitHub")
+                client.code("Google")
+                metrics = client.metrics()
+        finally:
+            registry.disable()
+            registry.reset()
+        self.assertEqual(metrics["counters"]["daemon.requests"], 3)
+        self.assertEqual(metrics["counters"]["manager.get_code"], 2)
+
+    def test_pipeline(self):
+        """Test that pipelined requests are answered in order."""
+        names = ["GitHub", "Google"] * 500
+        with Client(self.path) as client:
+            codes = client.pipeline(("code", name, 0) for name in names)
+        self.assertEqual(codes, [self.manager.get_code(name, at=0) for name in names])
+
+    def test_async_clients(self):
+        """Test many concurrent async clients, each pipelining concurrent requests."""
+
+        async def run_client():
+            client = await AsyncClient.connect(self.path)
+            try:
+                return await asyncio.gather(
+                    *(client.code(name, at=0) for name in ["GitHub", "Google"] * 50)
+                )
+            finally:
+                await client.close()
+
+        async def run_clients():
+            return await asyncio.gather(*(run_client() for _ in range(20)))
+
+        expected = [self.manager.get_code(name, at=0) for name in ["GitHub", "Google"]]
+        for codes in asyncio.run(run_clients()):
+            self.assertEqual(codes, expected * 50)
+
+    def test_socket_is_private(self):
+        """Test that only the owner can connect to the socket."""
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode) & 0o077, 0)
+
+    def test_warm_latency(self):
+        """Test that a warm request round trip takes well under a millisecond."""
+        with Client(self.path) as client:
+            client.code("GitHub")
+            samples = []
+            for _ in range(200):
+                start = time.perf_counter()
+                client.code("GitHub")
+                samples.append(time.perf_counter() - start)
+        self.assertLess(statistics.median(samples), 0.001)
+
+
+if __name__ == "__main__":
+    unittest.main()
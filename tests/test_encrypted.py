@@ -0,0 +1,144 @@
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from auth_manager.cli import main
+from auth_manager.manager import OTPManager
+from auth_manager.storage import SQLiteStorage
+
+try:
+    from auth_manager.encrypted import EncryptedStorage, forget_keys
+except ImportError:  # pragma: no cover - cryptography is an optional extra
+    EncryptedStorage = None
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+@unittest.skipIf(EncryptedStorage is None, "cryptography is not installed")
+class TestEncryptedStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary directory for the vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.vault")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+
+    def open_manager(self, passphrase="correct horse"):
+        return OTPManager(storage=EncryptedStorage(self.path, passphrase))
+
+    def rows(self):
+        with contextlib.closing(sqlite3.connect(self.path)) as connection:
+            return dict(connection.execute("SELECT name, uri FROM services"))
+
+    def test_round_trip_without_plaintext_on_disk(self):
+        """Test that services survive a reopen and their URIs are never in clear."""
+        manager = self.open_manager()
+        manager.add_service("GitHub", URI.format("Octocat"))
+        code = manager.get_code("GitHub", at=59)
+        manager.close()
+
+        manager = self.open_manager()
+        self.assertEqual(manager.get_code("GitHub", at=59), code)
+        self.assertEqual(manager.services["GitHub"], URI.format("Octocat"))
+        manager.close()
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name), "rb") as file:
+                data = file.read()
+            self.assertNotIn(b"JBSWY3DPEHPK3PXP", data)
+            self.assertNotIn(b"Octocat", data)
+
+    def test_wrong_passphrase(self):
+        """Test that a wrong passphrase is rejected before anything is read."""
+        self.open_manager().close()
+        with self.assertRaisesRegex(ValueError, "Wrong passphrase"):
+            EncryptedStorage(self.path, "wrong")
+
+    def test_key_is_derived_once_per_session(self):
+        """Test that reopening the vault reuses the key derived the first time."""
+        forget_keys()
+        with patch("hashlib.scrypt", wraps=hashlib.scrypt) as scrypt:
+            self.open_manager().close()
+            self.open_manager().close()
+            self.assertEqual(scrypt.call_count, 1)
+            forget_keys()
+            self.open_manager().close()
+            self.assertEqual(scrypt.call_count, 2)
+
+    def test_startup_decrypts_only_what_is_used(self):
+        """Test that opening a vault and reading one code decrypts one record."""
+        manager = self.open_manager()
+        manager.add_services({f"S{index}": URI.format(index) for index in range(100)})
+        manager.close()
+
+        with patch.object(
+            EncryptedStorage,
+            "_decode",
+            autospec=True,
+            side_effect=EncryptedStorage._decode,
+        ) as decode:
+            manager = self.open_manager()
+            self.assertEqual(manager.search("S42"), ["S42"])
+            manager.get_code("S42")
+            self.assertEqual(decode.call_count, 1)
+            manager.close()
+
+    def test_edit_reseals_one_record(self):
+        """Test that editing a service rewrites only its own sealed record."""
+        manager = self.open_manager()
+        manager.add_services({name: URI.format(name) for name in ("A", "B", "C")})
+        before = self.rows()
+        manager.edit_service("B", "B", URI.format("B2"))
+        after = self.rows()
+        manager.close()
+        self.assertEqual({name for name in after if after[name] != before[name]}, {"B"})
+
+    def test_records_are_bound_to_their_names(self):
+        """Test that a sealed record moved to another name fails to decrypt."""
+        manager = self.open_manager()
+        manager.add_services({"A": URI.format("A"), "B": URI.format("B")})
+        manager.close()
+        rows = self.rows()
+        with contextlib.closing(sqlite3.connect(self.path)) as connection:
+            with connection:
+                connection.execute(
+                    "UPDATE services SET uri = ? WHERE name = 'A'", (rows["B"],)
+                )
+        manager = self.open_manager()
+        with self.assertRaisesRegex(ValueError, "tampered"):
+            manager.get_code("A")
+        self.assertEqual(len(manager.get_code("B")), 6)
+        manager.close()
+
+    def test_plaintext_vault_is_refused(self):
+        """Test that an unencrypted SQLite vault is not opened as an encrypted one."""
+        storage = SQLiteStorage(self.path)
+        storage.save({"A": URI.format("A")})
+        storage.close()
+        with self.assertRaisesRegex(ValueError, "not an encrypted vault"):
+            EncryptedStorage(self.path, "passphrase")
+
+    def test_cli(self):
+        """Test that the CLI opens a .vault file with the passphrase from the env."""
+        with patch.dict(os.environ, {"AUTH_MANAGER_PASSPHRASE": "secret"}):
+            self.assertEqual(
+                main(["--vault", self.path, "add", "A", URI.format("A")]), 0
+            )
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(main(["--vault", self.path, "code", "A"]), 0)
+            self.assertEqual(len(output.getvalue().strip()), 6)
+        with patch.dict(os.environ, {"AUTH_MANAGER_PASSPHRASE": "wrong"}):
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(main(["--vault", self.path, "list"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
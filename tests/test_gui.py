@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from auth_manager.manager import OTPManager
+
+try:
+    import tkinter
+except ImportError:  # pragma: no cover - tkinter is not always installed
+    tkinter = None
+else:
+    from auth_manager.gui import CARD_HEIGHT, OTPApp, ServiceCard
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+@unittest.skipIf(
+    tkinter is None or not os.environ.get("DISPLAY"), "tkinter needs a display"
+)
+class GUITestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary vault directory; the apps are opened by the tests."""
+        self.directory = tempfile.mkdtemp()
+        self.apps = []
+
+    def tearDown(self):
+        """Close the apps and remove the temporary directory."""
+        for app in self.apps:
+            app.on_close()
+        shutil.rmtree(self.directory)
+
+    def open_app(self, services):
+        path = os.path.join(self.directory, f"services-{len(self.apps)}.json")
+        manager = OTPManager(data_file=path)
+        manager.add_services(services)
+        app = OTPApp(manager)
+        app.update()
+        self.apps.append(app)
+        return app
+
+
+class TestServiceList(GUITestCase):
+    def test_card_pool_does_not_grow_with_the_vault(self):
+        """Test that only the cards fitting in the window are created."""
+        small = self.open_app({f"S{index}": URI.format(index) for index in range(20)})
+        large = self.open_app({f"S{index}": URI.format(index) for index in range(5000)})
+        self.assertEqual(len(large.service_cards), len(small.service_cards))
+        height = large.services_frame.winfo_height()
+        self.assertLessEqual(len(large.service_cards), height // CARD_HEIGHT + 2)
+
+        large.on_scroll("moveto", "1.0")
+        self.assertEqual(len(large.service_cards), len(small.service_cards))
+        self.assertIn("S4999", large.card_index)
+        self.assertEqual(large.card_index["S4999"].name_label.cget("text"), "S4999")
+
+    def test_edit_touches_one_row(self):
+        """Test that an edit rebinds only its own card and keeps the countdown."""
+        app = self.open_app({f"S{index}": URI.format(index) for index in range(50)})
+        countdown_id = app.countdown_id
+        rows = {card.name: card.y for card in app.service_cards}
+        with patch.object(
+            ServiceCard, "show", autospec=True, side_effect=ServiceCard.show
+        ) as show, patch.object(app, "layout_cards") as layout_cards:
+            app.save_service(Mock(), "Renamed", URI.format("Renamed"), "S1")
+        show.assert_called_once()
+        layout_cards.assert_not_called()
+        self.assertEqual(app.countdown_id, countdown_id)
+        card = app.card_index["Renamed"]
+        self.assertNotIn("S1", app.card_index)
+        self.assertEqual(card.name_label.cget("text"), "Renamed")
+        self.assertEqual(card.y, rows.pop("S1"))
+        self.assertEqual(
+            {card.name: card.y for card in app.service_cards if card.name != "Renamed"},
+            rows,
+        )
+
+
+class TestCountdown(GUITestCase):
+    def test_tick_follows_each_period(self):
+        """Test that each code is redrawn on its own period's boundary."""
+        app = self.open_app(
+            {"Half": URI.format("Half"), "Minute": URI.format("Minute") + "&period=60"}
+        )
+        app.after_cancel(app.countdown_id)
+        # Five seconds into a minute, so also into a 30 s step.
+        start = 1_700_000_040 + 5
+        codes = {}
+        for name in ("Half", "Minute"):
+            for at in (start, start + 26, start + 56):
+                codes[name, at] = app.manager.get_code(name, at=at)
+        with patch("time.time", return_value=start):
+            app.refresh_all_codes()
+        half, minute = app.card_index["Half"], app.card_index["Minute"]
+        self.assertEqual((half.period, minute.period), (30, 60))
+
+        # A 30 s boundary has passed, but not a minute one.
+        with patch("time.time", return_value=start + 26), patch.object(
+            minute, "set_code", wraps=minute.set_code
+        ) as set_code:
+            app.tick()
+        set_code.assert_not_called()
+        self.assertEqual(half.code, codes["Half", start + 26])
+        self.assertEqual(minute.code, codes["Minute", start])
+        self.assertEqual((half.remaining, minute.remaining), (29, 29))
+
+        with patch("time.time", return_value=start + 56):
+            app.tick()
+        self.assertEqual(minute.code, codes["Minute", start + 56])
+        self.assertEqual((half.remaining, minute.remaining), (29, 59))
+        self.assertIsNotNone(app.countdown_id)
+
+    def test_next_tick_is_after_the_next_second(self):
+        """Test that the next tick wakes just after the next whole second."""
+        app = self.open_app({"Half": URI.format("Half")})
+        for now in (1_700_000_045.0, 1_700_000_045.25, 1_700_000_045.999):
+            with self.subTest(now=now):
+                wake = now + app.next_tick_delay(now) / 1000
+                self.assertGreaterEqual(wake, 1_700_000_046)
+                self.assertLess(wake, 1_700_000_046.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
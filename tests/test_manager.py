@@ -1,8 +1,13 @@
 import os
+import time
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import patch
+
+import pyotp
 
 from auth_manager.manager import OTPManager
+from auth_manager.storage import JournalStorage
+from auth_manager.totp import CodeCache, CompiledTOTP
 
 
 class TestOTPManager(unittest.TestCase):
@@ -17,8 +22,13 @@ class TestOTPManager(unittest.TestCase):
 
     def tearDown(self):
         """Clean up the test JSON file after each test."""
-        if os.path.exists(self.test_file):
-            os.remove(self.test_file)
+        for path in (
+            self.test_file,
+            self.test_file + ".lock",
+            self.test_file + ".journal",
+        ):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_add_service(self):
         """Test adding a new service and verifying its existence."""
@@ -63,18 +73,277 @@ class TestOTPManager(unittest.TestCase):
         # Deleting a non-existent service should simply do nothing
         self.assertNotIn("NonExistentService", self.manager.services)
 
-    @patch("auth_manager.manager.pyotp.TOTP")
-    def test_code_generation_timing(self, mock_totp):
-        """Test that the code generation uses the correct timing intervals."""
-        # Mock TOTP instance and method
-        mock_totp_instance = Mock()
-        mock_totp.return_value = mock_totp_instance
-        mock_totp_instance.now.return_value = "123456"
-
-        # Generate code and check if the mocked code is returned
+    @patch("pyotp.parse_uri")
+    def test_code_generation_timing(self, mock_parse_uri):
+        """Test that codes come from the compiled generator, not a re-parsed URI."""
+        expected = pyotp.TOTP("JBSWY3DPEHPK3PXP").now()
         code = self.manager.get_code("TestService")
-        mock_totp_instance.now.assert_called_once()
-        self.assertEqual(code, "123456")
+        mock_parse_uri.assert_not_called()
+        self.assertEqual(code, expected)
+
+    def test_compiled_generator_matches_pyotp(self):
+        """Test that compiled generators agree with pyotp for non-default parameters."""
+        uris = [
+            self.test_uri,
+            "otpauth://totp/A?secret=JBSWY3DPEHPK3PXP&algorithm=SHA256&digits=8",
+            "otpauth://totp/B?secret=JBSWY3DPEHPK3PXP&algorithm=SHA512&period=60",
+            "otpauth://totp/Steam:c?secret=JBSWY3DPEHPK3PXP&issuer=Steam&encoder=steam",
+        ]
+        for uri in uris:
+            generator = CompiledTOTP.from_uri(uri)
+            totp = pyotp.parse_uri(uri)
+            for for_time in (0, 59, 1_700_000_000, 2_000_000_123):
+                self.assertEqual(
+                    generator.code(generator.counter(for_time)), totp.at(for_time)
+                )
+
+    def test_generator_registry_follows_mutations(self):
+        """Test that add, edit and delete keep the generator registry in sync."""
+        self.assertIn("TestService", self.manager.generators)
+        uri = "otpauth://totp/Other?secret=GEZDGNBVGY3TQOJQ&digits=8"
+        self.manager.edit_service("TestService", "Other", uri)
+        self.assertNotIn("TestService", self.manager.generators)
+        self.assertEqual(self.manager.generators["Other"].digits, 8)
+        self.assertEqual(len(self.manager.get_code("Other")), 8)
+        self.manager.delete_service("Other")
+        self.assertNotIn("Other", self.manager.generators)
+
+    def test_add_invalid_uri(self):
+        """Test that an invalid URI is rejected before anything is saved."""
+        with self.assertRaises(ValueError):
+            self.manager.add_service("Broken", "https://example.com")
+        self.assertNotIn("Broken", self.manager.services)
+        self.assertNotIn("Broken", OTPManager(data_file=self.test_file).services)
+
+    def test_get_code_at(self):
+        """Test generating codes for explicit times, including the next time step."""
+        totp = pyotp.TOTP("JBSWY3DPEHPK3PXP")
+        at = 1_700_000_010
+        self.assertEqual(self.manager.get_code("TestService", at=at), totp.at(at))
+        with patch("auth_manager.totp.time.time", return_value=at):
+            next_code = self.manager.get_next_code("TestService")
+        self.assertEqual(next_code, totp.at(at + 30))
+        self.assertIsNone(self.manager.get_next_code("NonExistentService"))
+
+    def test_code_cache_reuses_codes(self):
+        """Test that codes are memoized per time step and dropped on edit."""
+        at = 1_700_000_010
+        with patch.object(
+            CompiledTOTP, "code", autospec=True, return_value="1"
+        ) as code:
+            self.manager.get_code("TestService", at=at)
+            self.manager.get_code("TestService", at=at + 5)
+            self.assertEqual(code.call_count, 1)
+            self.manager.get_code("TestService", at=at + 30)
+            self.assertEqual(code.call_count, 2)
+            self.manager.edit_service("TestService", "TestService", self.test_uri)
+            self.manager.get_code("TestService", at=at)
+            self.assertEqual(code.call_count, 3)
+
+    def test_code_cache_is_bounded(self):
+        """Test that the code cache evicts the least recently used codes."""
+        manager = OTPManager(data_file=self.test_file, cache_size=8)
+        for counter in range(20):
+            manager.get_code("TestService", at=counter * 30)
+        self.assertEqual(len(manager.code_cache), 8)
+        self.assertIn(("TestService", 19), manager.code_cache)
+        self.assertNotIn(("TestService", 0), manager.code_cache)
+
+    def test_code_cache_discard(self):
+        """Test that discarding a service drops its codes, also after evictions."""
+        cache = CodeCache(maxsize=4)
+        for counter in range(3):
+            cache.put(("A", counter), counter)
+        cache.put(("B", 0), 0)
+        cache.put(("B", 1), 1)
+        self.assertNotIn(("A", 0), cache)
+        cache.discard("A")
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn(("A", 2), cache)
+        self.assertIn(("B", 1), cache)
+        cache.discard("A")
+        cache.discard("B")
+        self.assertEqual(len(cache), 0)
+
+    def test_bulk_add_with_warm_cache(self):
+        """Test that adding many services to a warm cache stays fast."""
+        self.manager.add_services(
+            {f"S{index}": self.test_uri for index in range(20000)}
+        )
+        for name in self.manager.services:
+            self.manager.get_code(name, at=0)
+        self.manager.prefetch_next(0)
+        start = time.perf_counter()
+        self.manager.add_services(
+            {f"New{index}": self.test_uri for index in range(2000)}
+        )
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_prefetch_next(self):
+        """Test that prefetching makes the next time step a cache lookup."""
+        at = 1_700_000_010
+        self.assertEqual(self.manager.prefetch_next(at), 1)
+        self.assertEqual(self.manager.prefetch_next(at), 0)
+        with patch.object(CompiledTOTP, "code", autospec=True) as code:
+            self.manager.get_code("TestService", at=at + 30)
+            code.assert_not_called()
+
+    def test_background_prefetch(self):
+        """Test that the prefetch thread fills in the next time step on start."""
+        manager = OTPManager(data_file=self.test_file, prefetch=True)
+        try:
+            for _ in range(100):
+                if len(manager.code_cache):
+                    break
+                time.sleep(0.01)
+            counter = manager.get_generator("TestService").counter()
+            self.assertTrue(
+                ("TestService", counter + 1) in manager.code_cache
+                or ("TestService", counter + 2) in manager.code_cache
+            )
+        finally:
+            manager.stop_prefetch()
+
+    def test_verify(self):
+        """Test verifying codes within the drift window."""
+        totp = pyotp.TOTP("JBSWY3DPEHPK3PXP")
+        at = 1_700_000_010
+        self.assertTrue(self.manager.verify("TestService", totp.at(at), at=at))
+        self.assertTrue(self.manager.verify("TestService", totp.at(at + 30), at=at))
+        self.assertFalse(self.manager.verify("TestService", totp.at(at + 60), at=at))
+        self.assertTrue(
+            self.manager.verify("TestService", totp.at(at + 60), window=2, at=at)
+        )
+        self.assertFalse(self.manager.verify("TestService", "000000x", at=at))
+        self.assertFalse(self.manager.verify("NonExistentService", "123456", at=at))
+
+    def test_verify_non_ascii_code(self):
+        """Test that a code with non-ASCII characters is rejected, not an error."""
+        at = 1_700_000_010
+        self.assertFalse(self.manager.verify("TestService", "１２３４５６", at=at))
+        self.assertFalse(self.manager.verify("TestService", "12345é", at=at))
+
+    def test_verify_rejects_replay(self):
+        """Test that a code cannot be used twice within its time step."""
+        totp = pyotp.TOTP("JBSWY3DPEHPK3PXP")
+        at = 1_700_000_010
+        code = totp.at(at)
+        self.assertTrue(self.manager.verify("TestService", code, at=at))
+        self.assertFalse(self.manager.verify("TestService", code, at=at + 5))
+        # Used steps expire once they leave the window.
+        self.manager.verify("TestService", totp.at(at + 120), at=at + 120)
+        self.assertEqual(len(self.manager.replay_cache), 1)
+
+    def test_verify_many(self):
+        """Test verifying a batch of codes, including a replay inside the batch."""
+        totp = pyotp.TOTP("JBSWY3DPEHPK3PXP")
+        at = 1_700_000_010
+        code = totp.at(at)
+        results = self.manager.verify_many(
+            [("TestService", code), ("TestService", code), ("Missing", code)], at=at
+        )
+        self.assertEqual(results, [True, False, False])
+
+    def test_batch_persists_once(self):
+        """Test that mutations inside a batch are written to storage once."""
+        writes = self.manager.writes
+        with self.manager.batch():
+            self.manager.add_service("A", self.test_uri)
+            with self.manager.batch():
+                self.manager.edit_service("A", "B", self.test_uri)
+            self.manager.delete_service("TestService")
+            self.assertEqual(self.manager.writes, writes)
+        self.assertEqual(self.manager.writes, writes + 1)
+        self.assertEqual(
+            OTPManager(data_file=self.test_file).services, {"B": self.test_uri}
+        )
+
+    def test_bulk_methods(self):
+        """Test adding and deleting many services with one write each."""
+        writes = self.manager.writes
+        self.manager.add_services({f"S{index}": self.test_uri for index in range(50)})
+        self.assertEqual(self.manager.writes, writes + 1)
+        self.manager.delete_services([f"S{index}" for index in range(50)] + ["Missing"])
+        self.assertEqual(self.manager.writes, writes + 2)
+        self.assertEqual(
+            list(OTPManager(data_file=self.test_file).services), ["TestService"]
+        )
+
+    def test_bulk_add_rejects_invalid_uri(self):
+        """Test that one invalid URI aborts the whole bulk add."""
+        with self.assertRaises(ValueError):
+            self.manager.add_services({"A": self.test_uri, "B": "not a uri"})
+        self.assertNotIn("A", self.manager.services)
+
+    def test_debounced_autosave(self):
+        """Test that rapid edits are merged into one write after a quiet interval."""
+        manager = OTPManager(data_file=self.test_file, autosave_delay=0.05)
+        for index in range(10):
+            manager.add_service(f"S{index}", self.test_uri)
+        self.assertEqual(manager.writes, 0)
+        time.sleep(0.2)
+        self.assertEqual(manager.writes, 1)
+        self.assertIn("S9", OTPManager(data_file=self.test_file).services)
+        manager.close()
+
+    def test_autosave_flushes_on_close(self):
+        """Test that closing the manager writes pending autosave changes."""
+        manager = OTPManager(data_file=self.test_file, autosave_delay=60)
+        manager.add_service("Pending", self.test_uri)
+        self.assertNotIn("Pending", OTPManager(data_file=self.test_file).services)
+        manager.close()
+        self.assertEqual(manager.writes, 1)
+        self.assertIn("Pending", OTPManager(data_file=self.test_file).services)
+
+    def test_failed_flush_keeps_changes(self):
+        """Test that a flush retried after a failed write writes every edit."""
+        storage = JournalStorage(self.test_file, fsync=False)
+        manager = OTPManager(storage=storage, autosave_delay=60)
+        manager.add_service("A", self.test_uri)
+        manager.delete_service("TestService")
+        apply = storage.apply
+        with patch.object(storage, "apply", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                manager.flush()
+        manager.add_service("B", self.test_uri)
+        with patch.object(storage, "apply", wraps=apply) as retried:
+            manager.flush()
+        retried.assert_called_once()
+        self.assertEqual(
+            [name for name, uri in retried.call_args.args[1]], ["A", "TestService", "B"]
+        )
+        manager.close()
+        loaded = OTPManager(storage=JournalStorage(self.test_file)).services
+        self.assertEqual(sorted(loaded), ["A", "B"])
+
+    def test_failed_autosave_is_reported(self):
+        """Test that a failed delayed write is handed to on_save_error."""
+        errors = []
+        manager = OTPManager(
+            data_file=self.test_file, autosave_delay=0.01, on_save_error=errors.append
+        )
+        with patch.object(manager.storage, "apply", side_effect=OSError("disk full")):
+            manager.add_service("A", self.test_uri)
+            time.sleep(0.2)
+        self.assertEqual([str(error) for error in errors], ["disk full"])
+        self.assertIs(manager.save_error, errors[0])
+        self.assertNotIn("A", OTPManager(data_file=self.test_file).services)
+
+        manager.flush()
+        self.assertIsNone(manager.save_error)
+        self.assertIn("A", OTPManager(data_file=self.test_file).services)
+        manager.close()
+
+    def test_peek_code(self):
+        """Test that peeking only answers from the cache."""
+        at = 1_700_000_010
+        self.assertIsNone(self.manager.peek_code("TestService", at=at))
+        code = self.manager.get_code("TestService", at=at)
+        generator = self.manager.generators["TestService"]
+        self.assertEqual(
+            self.manager.peek_code("TestService", at=at), (generator, code)
+        )
+        self.assertIsNone(self.manager.peek_code("NonExistentService", at=at))
 
 
 if __name__ == "__main__":
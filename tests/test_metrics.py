@@ -0,0 +1,183 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from auth_manager.cli import main
+from auth_manager.manager import OTPManager
+from auth_manager.metrics import Registry, registry, timed, to_prometheus
+from auth_manager.storage import SQLiteStorage
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+class TestRegistry(unittest.TestCase):
+    def test_disabled_records_nothing(self):
+        """Test that counters, timings and hooks are ignored while disabled."""
+        metrics = Registry()
+        calls = []
+        metrics.add_hook(lambda name, seconds: calls.append(name))
+        metrics.count("calls")
+        metrics.observe("latency", 0.1)
+        self.assertEqual(metrics.snapshot(), {"counters": {}, "histograms": {}})
+        self.assertEqual(calls, [])
+
+    def test_counters_and_histograms(self):
+        """Test that counts add up and latencies land in cumulative buckets."""
+        metrics = Registry()
+        metrics.enable()
+        metrics.count("calls")
+        metrics.count("calls", 2)
+        for seconds in (0.0000005, 0.002, 0.002, 10.0):
+            metrics.observe("latency", seconds)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"], {"calls": 3})
+        histogram = snapshot["histograms"]["latency"]
+        self.assertEqual(histogram["count"], 4)
+        self.assertAlmostEqual(histogram["sum"], 10.0040005)
+        self.assertEqual(histogram["buckets"]["1e-06"], 1)
+        self.assertEqual(histogram["buckets"]["0.001"], 1)
+        self.assertEqual(histogram["buckets"]["0.005"], 3)
+        self.assertEqual(histogram["buckets"]["5.0"], 3)
+        self.assertEqual(histogram["buckets"]["+Inf"], 4)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {"counters": {}, "histograms": {}})
+
+    def test_hooks(self):
+        """Test that hooks see every timed operation until they are removed."""
+        metrics = Registry()
+        metrics.enable()
+        calls = []
+
+        def hook(name, seconds):
+            calls.append((name, seconds))
+
+        metrics.add_hook(hook)
+        metrics.observe("latency", 0.5)
+        metrics.remove_hook(hook)
+        metrics.observe("latency", 0.5)
+        self.assertEqual(calls, [("latency", 0.5)])
+
+    def test_prometheus_format(self):
+        """Test the names, types and buckets of the Prometheus text output."""
+        metrics = Registry()
+        metrics.enable()
+        metrics.count("storage.bytes_written", 42)
+        metrics.observe("manager.load_services", 0.003)
+        lines = to_prometheus(metrics.snapshot()).splitlines()
+        self.assertIn("# TYPE auth_manager_storage_bytes_written_total counter", lines)
+        self.assertIn("auth_manager_storage_bytes_written_total 42", lines)
+        self.assertIn(
+            "# TYPE auth_manager_manager_load_services_seconds histogram", lines
+        )
+        self.assertIn(
+            'auth_manager_manager_load_services_seconds_bucket{le="0.001"} 0', lines
+        )
+        self.assertIn(
+            'auth_manager_manager_load_services_seconds_bucket{le="+Inf"} 1', lines
+        )
+        self.assertIn("auth_manager_manager_load_services_seconds_count 1", lines)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary directory and a clean, enabled registry."""
+        self.directory = tempfile.mkdtemp()
+        registry.reset()
+        registry.enable()
+
+    def tearDown(self):
+        """Disable the registry and remove the temporary directory."""
+        registry.disable()
+        registry.reset()
+        shutil.rmtree(self.directory)
+
+    def test_timed(self):
+        """Test that a timed function is observed, also when it raises."""
+
+        @timed("failing")
+        def failing():
+            raise KeyError
+
+        with self.assertRaises(KeyError):
+            failing()
+        self.assertEqual(registry.snapshot()["histograms"]["failing"]["count"], 1)
+
+    def test_manager(self):
+        """Test the load, save and get_code metrics and the bytes written."""
+        path = os.path.join(self.directory, "services.json")
+        manager = OTPManager(data_file=path)
+        manager.add_service("GitHub", URI.format("GitHub"))
+        manager.save_services()
+        manager.get_code("GitHub", at=0)
+        manager.get_code("GitHub", at=0)
+        manager.close()
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["counters"]["manager.get_code"], 2)
+        self.assertEqual(snapshot["counters"]["manager.code_cache_misses"], 1)
+        self.assertEqual(snapshot["histograms"]["manager.load_services"]["count"], 1)
+        self.assertEqual(snapshot["histograms"]["manager.save_services"]["count"], 1)
+        writes = snapshot["histograms"]["storage.write"]["count"]
+        self.assertEqual(
+            snapshot["counters"]["storage.bytes_written"],
+            writes * os.path.getsize(path),
+        )
+
+    def test_lazy_storage_parses_on_first_use(self):
+        """Test that URIs compiled by get_code are timed, once per service."""
+        storage = SQLiteStorage(os.path.join(self.directory, "services.db"))
+        storage.save({"GitHub": URI.format("GitHub")})
+        manager = OTPManager(storage=storage)
+        manager.get_code("GitHub", at=0)
+        manager.get_code("GitHub", at=30)
+        manager.close()
+        histograms = registry.snapshot()["histograms"]
+        self.assertEqual(histograms["manager.parse_uri"]["count"], 1)
+        self.assertEqual(histograms["storage.commit"]["count"], 1)
+
+    def test_dump(self):
+        """Test that dumps pick their format from the extension."""
+        registry.count("calls")
+        registry.dump(os.path.join(self.directory, "metrics.json"))
+        registry.dump(os.path.join(self.directory, "metrics.prom"))
+        with open(os.path.join(self.directory, "metrics.json")) as file:
+            self.assertEqual(json.load(file)["counters"], {"calls": 1})
+        with open(os.path.join(self.directory, "metrics.prom")) as file:
+            self.assertIn("auth_manager_calls_total 1\n", file.read())
+
+    def test_cli_option(self):
+        """Test that --metrics writes the metrics of the command to a file."""
+        vault = os.path.join(self.directory, "services.json")
+        output = os.path.join(self.directory, "metrics.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(["--vault", vault, "add", "GitHub", URI.format("GitHub")])
+            main(["--vault", vault, "--metrics", output, "code", "GitHub"])
+        with open(output) as file:
+            snapshot = json.load(file)
+        self.assertEqual(snapshot["counters"]["manager.get_code"], 1)
+        self.assertIn("manager.load_services", snapshot["histograms"])
+
+    def test_environment_variable(self):
+        """Test that $AUTH_MANAGER_METRICS records a process and dumps it at exit."""
+        vault = os.path.join(self.directory, "services.json")
+        output = os.path.join(self.directory, "metrics.prom")
+        environment = dict(os.environ, PYTHONPATH=ROOT, AUTH_MANAGER_METRICS=output)
+        for args in (["add", "GitHub", URI.format("GitHub")], ["code", "GitHub"]):
+            subprocess.run(
+                [sys.executable, "-m", "auth_manager.cli", "--vault", vault, *args],
+                env=environment,
+                check=True,
+                capture_output=True,
+            )
+        with open(output) as file:
+            self.assertIn("auth_manager_manager_get_code_total 1\n", file.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import time
+import unittest
+
+from auth_manager.manager import OTPManager
+from auth_manager.search import NameIndex, matches
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up an index over a few service names."""
+        self.index = NameIndex(["GitLab", "Digital Ocean", "GitHub", "Google", "Okta"])
+
+    def test_ranking(self):
+        """Test that prefix matches rank before substring and fuzzy matches."""
+        self.assertEqual(
+            self.index.search("git"), ["GitLab", "GitHub", "Digital Ocean"]
+        )
+        self.assertEqual(self.index.search("gh"), ["GitHub"])
+        self.assertEqual(self.index.search("GOO"), ["Google"])
+
+    def test_empty_query_and_limit(self):
+        """Test that an empty query matches every name and the limit is applied."""
+        self.assertEqual(len(self.index.search("")), 5)
+        self.assertEqual(self.index.search("g", limit=2), ["GitLab", "GitHub"])
+
+    def test_incremental_updates(self):
+        """Test that added and removed names show up in later searches."""
+        self.index.search("g")
+        self.index.search("gi")
+        self.index.add("Gitea")
+        self.index.remove("GitLab")
+        self.assertEqual(self.index.search("git"), ["GitHub", "Gitea", "Digital Ocean"])
+        self.assertEqual(
+            self.index.search("g"), ["GitHub", "Google", "Gitea", "Digital Ocean"]
+        )
+        self.assertNotIn("GitLab", self.index)
+        self.assertEqual(len(self.index), 5)
+
+    def test_compaction_keeps_results(self):
+        """Test that compacting removed slots does not change the results."""
+        for name in ["GitLab", "Digital Ocean", "Okta"]:
+            self.index.remove(name)
+        self.assertEqual(self.index.search("g"), ["GitHub", "Google"])
+
+    def test_special_characters(self):
+        """Test that regex metacharacters in a query are matched literally."""
+        self.index.add("a.b [prod]")
+        self.assertEqual(self.index.search("[p"), ["a.b [prod]"])
+        self.assertTrue(matches("a.b [prod]", ".]"))
+        self.assertFalse(matches("GitHub", "hg"))
+        self.index.add("two\nlines")
+        self.assertEqual(self.index.search("wn"), ["two\nlines"])
+        self.assertEqual(self.index.search("ok"), ["Okta"])
+
+    def test_keystroke_latency(self):
+        """Test that each keystroke over 50k names beats a linear scan by far."""
+        names = [f"service-{number} example.com" for number in range(50000)]
+        queries = ["s", "se", "ser", "serv", "service-4", "x", "", "svc1", "vc9"]
+        latencies = dict.fromkeys(queries, float("inf"))
+        # The best of a few runs, each on a fresh index, leaves out scheduling noise.
+        for _ in range(3):
+            index = NameIndex(names)
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query)
+                latencies[query] = min(latencies[query], time.perf_counter() - start)
+        # Compared with a scan on the same machine rather than a fixed budget, so a
+        # slow machine does not fail it. The index is 20 times faster or more; the
+        # margin only catches losing its shortcuts. The absolute latency is timed
+        # by benchmarks/suite.py.
+        for query, latency in latencies.items():
+            start = time.perf_counter()
+            [name for name in names if matches(name, query)]
+            scan = time.perf_counter() - start
+            with self.subTest(query=query):
+                self.assertLess(latency * 5, scan)
+
+
+class TestManagerSearch(unittest.TestCase):
+    def setUp(self):
+        """Set up a manager with a few services."""
+        self.test_file = os.path.join(
+            os.path.dirname(__file__), "../data/test_services.json"
+        )
+        self.manager = OTPManager(data_file=self.test_file)
+        for name in ["GitHub", "Google", "AWS"]:
+            self.manager.add_service(name, URI.format(name))
+
+    def tearDown(self):
+        """Clean up the test JSON file."""
+        for path in (self.test_file, self.test_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_index_follows_mutations(self):
+        """Test that add, edit and delete keep the search index up to date."""
+        self.manager.edit_service("Google", "Gmail", URI.format("Gmail"))
+        self.manager.delete_service("AWS")
+        self.manager.add_service("GitLab", URI.format("GitLab"))
+        self.assertEqual(self.manager.search("g"), ["GitHub", "Gmail", "GitLab"])
+        self.assertEqual(self.manager.search("aws"), [])
+
+    def test_index_is_loaded(self):
+        """Test that the index is built from the vault on load."""
+        manager = OTPManager(data_file=self.test_file)
+        self.assertEqual(manager.search("gg"), ["Google"])
+
+
+if __name__ == "__main__":
+    unittest.main()
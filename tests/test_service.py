@@ -0,0 +1,150 @@
+import json
+import os
+import unittest
+
+from auth_manager.manager import OTPManager
+from auth_manager.service import Service, ServiceURIs
+from auth_manager.totp import Algorithm, CompiledTOTP
+
+
+class TestService(unittest.TestCase):
+    def test_canonical_uri_round_trips_without_copy(self):
+        """Test that a canonical URI is rebuilt exactly from its record alone."""
+        uri = (
+            "otpauth://totp/ACME%20Co:alice@example.com?secret=JBSWY3DPEHPK3PXP"
+            "&issuer=ACME%20Co&algorithm=SHA256&digits=8&period=60"
+        )
+        service = Service.from_uri(uri)
+        self.assertIsNone(service._uri)
+        self.assertEqual(service.uri, uri)
+        self.assertEqual(service.label, "ACME Co:alice@example.com")
+        self.assertEqual(service.issuer, "ACME Co")
+        self.assertEqual(service.key, b"Hello!\xde\xad\xbe\xef")
+        self.assertIs(service.algorithm, Algorithm.SHA256)
+        self.assertEqual((service.digits, service.period), (8, 60))
+
+    def test_other_uris_are_kept_verbatim(self):
+        """Test that URIs the record would spell differently are saved unchanged."""
+        for uri in (
+            "otpauth://totp/Test?secret=jbswy3dpehpk3pxp",
+            "otpauth://totp/Test?secret=JBSWY3DPEHPK3PXP&image=https://x/y.png",
+            "otpauth://totp/Test?digits=6&secret=JBSWY3DPEHPK3PXP",
+        ):
+            with self.subTest(uri=uri):
+                self.assertEqual(Service.from_uri(uri).uri, uri)
+
+    def test_steam_uri_round_trips(self):
+        """Test that a Steam URI gives Steam Guard codes and is rebuilt exactly."""
+        uri = "otpauth://totp/Steam:alice?secret=JBSWY3DPEHPK3PXP&encoder=steam"
+        service = Service.from_uri(uri)
+        self.assertEqual(service.uri, uri)
+        self.assertIsNone(service._uri)
+        self.assertEqual((service.encoder, service.digits), ("steam", 5))
+        self.assertEqual(service.code(0), "VH8YJ")
+        with self.assertRaisesRegex(ValueError, "encoder"):
+            Service.from_uri(uri.replace("steam", "yandex"))
+
+    def test_issuer_must_match_label(self):
+        """Test that the issuer parameter must agree with the label's prefix."""
+        uri = "otpauth://totp/ACME:alice?secret=JBSWY3DPEHPK3PXP&issuer={}"
+        self.assertEqual(Service.from_uri(uri.format("ACME")).issuer, "ACME")
+        unprefixed = "otpauth://totp/alice?secret=JBSWY3DPEHPK3PXP&issuer=Other"
+        self.assertEqual(Service.from_uri(unprefixed).issuer, "Other")
+        with self.assertRaisesRegex(ValueError, "issuer"):
+            Service.from_uri(uri.format("Other"))
+
+    def test_codes_match_compiled_totp(self):
+        """Test that a record generates the same codes as a plain generator."""
+        uri = "otpauth://totp/Test?secret=JBSWY3DPEHPK3PXP&algorithm=SHA512&digits=7"
+        service, generator = Service.from_uri(uri), CompiledTOTP.from_uri(uri)
+        for counter in (0, 1, 56666666):
+            self.assertEqual(service.code(counter), generator.code(counter))
+
+    def test_label_shares_the_name(self):
+        """Test that a label equal to the service name is the name's string."""
+        name = "".join(["Git", "Hub"])
+        service = Service.from_uri(
+            "otpauth://totp/GitHub?secret=JBSWY3DPEHPK3PXP", name
+        )
+        self.assertIs(service.label, name)
+
+    def test_records_have_no_dict(self):
+        """Test that records are slotted."""
+        service = Service.from_uri("otpauth://totp/Test?secret=JBSWY3DPEHPK3PXP")
+        self.assertFalse(hasattr(service, "__dict__"))
+
+
+class TestServiceURIs(unittest.TestCase):
+    def test_mapping(self):
+        """Test that the view stores records and keeps broken URIs as strings."""
+        uris = ServiceURIs(
+            {"A": "otpauth://totp/A?secret=JBSWY3DPEHPK3PXP", "B": "not a uri"}
+        )
+        self.assertEqual(
+            dict(uris),
+            {"A": "otpauth://totp/A?secret=JBSWY3DPEHPK3PXP", "B": "not a uri"},
+        )
+        self.assertEqual(list(uris.records), ["A"])
+        self.assertEqual(uris.invalid, {"B": "not a uri"})
+
+        uris["B"] = "otpauth://totp/B?secret=JBSWY3DPEHPK3PXP"
+        self.assertEqual(uris.invalid, {})
+        del uris["A"]
+        self.assertNotIn("A", uris)
+        self.assertEqual(len(uris), 1)
+        with self.assertRaises(KeyError):
+            del uris["A"]
+
+    def test_copy_is_independent(self):
+        """Test that changing a copy leaves the original untouched."""
+        uris = ServiceURIs({"A": "otpauth://totp/A?secret=JBSWY3DPEHPK3PXP"})
+        copy = uris.copy()
+        del copy["A"]
+        self.assertIn("A", uris)
+        self.assertIs(uris.copy().records["A"], uris.records["A"])
+
+
+class TestManagerRecords(unittest.TestCase):
+    def setUp(self):
+        """Set up a vault file with canonical, non-canonical and broken URIs."""
+        self.test_file = os.path.join(
+            os.path.dirname(__file__), "../data/test_service_services.json"
+        )
+        self.vault = {
+            "GitHub": "otpauth://totp/GitHub?secret=JBSWY3DPEHPK3PXP",
+            "Lower": "otpauth://totp/x?secret=jbswy3dpehpk3pxp&period=60",
+            "Broken": "otpauth://hotp/x?secret=JBSWY3DPEHPK3PXP",
+        }
+        with open(self.test_file, "w") as file:
+            json.dump(self.vault, file)
+
+    def tearDown(self):
+        """Clean up the test JSON file after each test."""
+        for path in (self.test_file, self.test_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_vault_is_saved_as_it_was_read(self):
+        """Test that loading and saving a vault writes back the same URIs."""
+        manager = OTPManager(data_file=self.test_file)
+        self.assertIsInstance(manager.generators["GitHub"], Service)
+        self.assertEqual(manager.services, self.vault)
+        manager.save_services()
+        with open(self.test_file) as file:
+            self.assertEqual(json.load(file), self.vault)
+        with self.assertRaises(ValueError):
+            manager.get_code("Broken")
+
+    def test_replacing_a_broken_uri(self):
+        """Test that adding a valid URI over a broken one replaces it."""
+        manager = OTPManager(data_file=self.test_file)
+        manager.add_service("Broken", "otpauth://totp/x?secret=JBSWY3DPEHPK3PXP")
+        self.assertEqual(len(manager.services), 3)
+        self.assertEqual(
+            manager.services["Broken"], "otpauth://totp/x?secret=JBSWY3DPEHPK3PXP"
+        )
+        self.assertEqual(len(manager.get_code("Broken")), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
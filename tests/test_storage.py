@@ -0,0 +1,456 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from auth_manager.manager import OTPManager
+from auth_manager.storage import (
+    FileLock,
+    JournalStorage,
+    JSONStorage,
+    ShardedStorage,
+    SQLiteStorage,
+    fcntl,
+    write_atomic,
+)
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+class TestJSONStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary directory for the vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.json")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+
+    def test_save_is_atomic(self):
+        """Test that saving replaces the file without leaving temporary files."""
+        storage = JSONStorage(self.path)
+        storage.save({"A": URI.format("A")})
+        storage.save({"B": URI.format("B")})
+        self.assertEqual(storage.load(), {"B": URI.format("B")})
+        self.assertEqual(
+            sorted(os.listdir(self.directory)), ["services.json", "services.json.lock"]
+        )
+
+    def test_load_corrupt_file(self):
+        """Test that a corrupt vault loads as empty."""
+        with open(self.path, "w") as file:
+            file.write("{not json")
+        self.assertEqual(JSONStorage(self.path).load(), {})
+
+    def test_missing_directory(self):
+        """Test that a vault in a missing directory loads as empty."""
+        storage = JSONStorage(os.path.join(self.directory, "missing", "services.json"))
+        self.assertEqual(storage.load(), {})
+        self.assertFalse(storage.changed())
+        with self.assertRaises(OSError):
+            storage.save({"A": URI.format("A")})
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @unittest.skipIf(os.geteuid() == 0, "root can write to read-only directories")
+    def test_read_only_directory(self):
+        """Test that a vault in a read-only directory can still be read."""
+        JSONStorage(self.path).save({"A": URI.format("A")})
+        for lock_file in (True, False):
+            if not lock_file:
+                os.remove(self.path + ".lock")
+            os.chmod(self.directory, 0o555)
+            try:
+                storage = JSONStorage(self.path)
+                self.assertEqual(storage.load(), {"A": URI.format("A")})
+            finally:
+                os.chmod(self.directory, 0o755)
+
+
+class TestJournalStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary directory holding a plain JSON vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.json")
+        with open(self.path, "w") as file:
+            json.dump({"Legacy": URI.format("Legacy")}, file, indent=4)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+
+    def manager(self, **kwargs):
+        return OTPManager(storage=JournalStorage(self.path, **kwargs))
+
+    def test_loads_existing_json_vault(self):
+        """Test that a vault written by the plain JSON backend loads unchanged."""
+        manager = self.manager()
+        self.assertEqual(manager.services, {"Legacy": URI.format("Legacy")})
+        self.assertEqual(manager.data_file, self.path)
+
+    def test_mutations_append_to_journal(self):
+        """Test that mutations are appended instead of rewriting the snapshot."""
+        manager = self.manager()
+        snapshot_mtime = os.stat(self.path).st_mtime_ns
+        manager.add_service("A", URI.format("A"))
+        manager.edit_service("A", "B", URI.format("B"))
+        manager.delete_service("Legacy")
+        manager.close()
+        self.assertEqual(os.stat(self.path).st_mtime_ns, snapshot_mtime)
+        with open(self.path + ".journal") as file:
+            self.assertEqual(len(file.readlines()), 4)
+        self.assertEqual(self.manager().services, {"B": URI.format("B")})
+
+    def test_recovery_skips_torn_record(self):
+        """Test that a record torn by a crash is ignored and later ones still apply."""
+        manager = self.manager()
+        manager.add_service("A", URI.format("A"))
+        manager.close()
+        with open(self.path + ".journal", "a") as file:
+            file.write('{"name": "Torn", "ur')
+        manager = self.manager()
+        self.assertNotIn("Torn", manager.services)
+        manager.add_service("C", URI.format("C"))
+        manager.close()
+        self.assertEqual(set(self.manager().services), {"Legacy", "A", "C"})
+
+    def test_background_compaction(self):
+        """Test that the journal is folded into the snapshot once it grows."""
+        manager = self.manager(compact_every=5)
+        for index in range(12):
+            manager.add_service(f"S{index}", URI.format(index))
+        manager.close()
+        with open(self.path) as file:
+            snapshot = json.load(file)
+        self.assertGreaterEqual(len(snapshot), 6)
+        self.assertFalse(
+            [name for name in os.listdir(self.directory) if ".journal." in name]
+        )
+        self.assertEqual(len(self.manager().services), 13)
+
+    def test_compaction_is_not_an_external_change(self):
+        """Test that a finished compaction does not make the vault look changed."""
+        manager = self.manager(compact_every=5)
+        for index in range(5):
+            manager.add_service(f"S{index}", URI.format(index))
+        manager.storage.wait_for_compaction()
+        self.assertFalse(manager.storage.changed())
+        with patch.object(manager.storage, "load") as load:
+            self.assertEqual(manager.reload_if_changed(), set())
+            load.assert_not_called()
+        manager.close()
+
+    def test_recovery_replays_rotated_journal(self):
+        """Test that a journal rotated before a crashed compaction is replayed."""
+        manager = self.manager()
+        manager.add_service("A", URI.format("A"))
+        manager.close()
+        os.replace(self.path + ".journal", self.path + ".journal.0")
+        self.manager().add_service("B", URI.format("B"))
+        self.assertEqual(set(self.manager().services), {"Legacy", "A", "B"})
+
+    def test_save_folds_journal(self):
+        """Test that a full save writes a snapshot and drops the journals."""
+        manager = self.manager()
+        manager.add_service("A", URI.format("A"))
+        manager.save_services()
+        manager.close()
+        self.assertEqual(
+            sorted(os.listdir(self.directory)), ["services.json", "services.json.lock"]
+        )
+        with open(self.path) as file:
+            self.assertEqual(set(json.load(file)), {"Legacy", "A"})
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a manager on a temporary SQLite vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.db")
+        self.manager = OTPManager(storage=SQLiteStorage(self.path))
+        self.manager.add_service("A", URI.format("A"))
+        self.manager.add_service("B", URI.format("B"))
+
+    def tearDown(self):
+        """Close the manager and remove the temporary directory."""
+        self.manager.close()
+        shutil.rmtree(self.directory)
+
+    def test_mapping_view(self):
+        """Test that the lazy view supports the dict API the manager relies on."""
+        services = self.manager.services
+        self.assertIn("A", services)
+        self.assertNotIn("Missing", services)
+        self.assertEqual(services["A"], URI.format("A"))
+        self.assertIsNone(services.get("Missing"))
+        self.assertEqual(list(services), ["A", "B"])
+        self.assertEqual(len(services), 2)
+        with self.assertRaises(KeyError):
+            del services["Missing"]
+
+    def test_services_are_loaded_lazily(self):
+        """Test that reopening the vault compiles only the services used."""
+        self.manager.close()
+        self.manager = OTPManager(storage=SQLiteStorage(self.path))
+        self.assertEqual(self.manager.generators, {})
+        self.assertEqual(len(self.manager.get_code("B")), 6)
+        self.assertEqual(list(self.manager.generators), ["B"])
+
+    def test_names_are_read_on_first_search(self):
+        """Test that reopening the vault does not read its names until a search."""
+        self.manager.close()
+        with patch("auth_manager.manager.NameIndex") as index:
+            self.manager = OTPManager(storage=SQLiteStorage(self.path))
+            self.manager.get_code("A")
+            index.assert_not_called()
+        self.assertIsNone(self.manager.search_index)
+        self.assertEqual(self.manager.search("b"), ["B"])
+        self.manager.add_service("Bank", URI.format("Bank"))
+        self.assertEqual(self.manager.search("b"), ["B", "Bank"])
+
+    def test_mutations_persist(self):
+        """Test that add, edit and delete are committed to the database."""
+        self.manager.edit_service("A", "C", URI.format("C"))
+        self.manager.delete_service("B")
+        self.manager.close()
+        self.manager = OTPManager(storage=SQLiteStorage(self.path))
+        self.assertEqual(dict(self.manager.services), {"C": URI.format("C")})
+
+    def test_wal_mode_and_name_index(self):
+        """Test that the database runs in WAL mode with an index on names."""
+        storage = self.manager.storage
+        self.assertEqual(storage.execute("PRAGMA journal_mode")[0][0], "wal")
+        plan = storage.execute(
+            "EXPLAIN QUERY PLAN SELECT uri FROM services WHERE name = ?", ("A",)
+        )
+        self.assertIn("services_name", plan[0][-1])
+
+    def test_migrate_from_json(self):
+        """Test importing an existing JSON vault into SQLite."""
+        json_path = os.path.join(self.directory, "services.json")
+        with open(json_path, "w") as file:
+            json.dump({"Legacy": URI.format("Legacy")}, file)
+        self.manager.storage.save(JSONStorage(json_path).load())
+        self.assertEqual(dict(self.manager.services), {"Legacy": URI.format("Legacy")})
+
+
+class TestShardedStorage(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary directory for the vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "team.shards")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+
+    def read_shards(self):
+        shards = {}
+        for name in os.listdir(self.path):
+            if name.startswith("shard-"):
+                with open(os.path.join(self.path, name)) as file:
+                    shards[name] = json.load(file)
+        return shards
+
+    def test_services_are_spread_by_name(self):
+        """Test the manifest and that each service is stored in its own shard."""
+        storage = ShardedStorage(self.path, shards=4)
+        manager = OTPManager(storage=storage)
+        manager.add_services({f"S{index}": URI.format(index) for index in range(50)})
+        with open(os.path.join(self.path, "manifest.json")) as file:
+            self.assertEqual(json.load(file), {"version": 1, "shards": 4})
+        shards = self.read_shards()
+        self.assertEqual(sum(map(len, shards.values())), 50)
+        for index in range(4):
+            for name in shards[f"shard-{index:03d}.json"]:
+                self.assertEqual(storage.shard_of(name), index)
+        code = manager.get_code("S7", at=0)
+        manager.close()
+
+        manager = OTPManager(storage=ShardedStorage(self.path, shards=8))
+        self.assertEqual(manager.storage.shards, 4)
+        self.assertEqual(len(manager.services), 50)
+        self.assertEqual(manager.get_code("S7", at=0), code)
+        manager.close()
+
+    def test_edit_rewrites_one_shard(self):
+        """Test that editing a service rewrites only the shard holding it."""
+        manager = OTPManager(storage=ShardedStorage(self.path, shards=4))
+        manager.add_services({f"S{index}": URI.format(index) for index in range(50)})
+        before = self.read_shards()
+        with patch("auth_manager.storage.write_atomic", wraps=write_atomic) as write:
+            manager.edit_service("S7", "S7", URI.format("S7b"))
+            self.assertEqual(write.call_count, 1)
+        after = self.read_shards()
+        manager.close()
+        changed = {name for name in after if after[name] != before[name]}
+        self.assertEqual(changed, {f"shard-{manager.storage.shard_of('S7'):03d}.json"})
+
+    def test_parallel_load(self):
+        """Test that shards compiled in worker processes load the same vault."""
+        services = {f"S{index}": URI.format(index) for index in range(50)}
+        services["Broken"] = "otpauth://totp/Broken"
+        ShardedStorage(self.path, shards=4).save(services)
+        with patch("auth_manager.storage.PARALLEL_LOAD_SIZE", 0):
+            manager = OTPManager(storage=ShardedStorage(self.path, processes=2))
+        self.assertEqual(dict(manager.services), services)
+        self.assertEqual(
+            manager.get_code("S3", at=0), manager.get_generator("S3").code(0)
+        )
+        manager.close()
+
+
+class TestSharedJSONVault(unittest.TestCase):
+    """Two managers standing in for two processes sharing one vault."""
+
+    def setUp(self):
+        """Set up two managers on the same temporary vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.json")
+        self.first = self.manager()
+        self.first.add_services({"A": URI.format("A"), "B": URI.format("B")})
+        self.second = self.manager()
+
+    def tearDown(self):
+        """Close the managers and remove the temporary directory."""
+        self.first.close()
+        self.second.close()
+        shutil.rmtree(self.directory)
+
+    def manager(self, **kwargs):
+        return OTPManager(storage=JSONStorage(self.path), **kwargs)
+
+    def test_no_lost_updates(self):
+        """Test that concurrent writers each keep the other's changes."""
+        self.first.add_service("C", URI.format("C"))
+        self.second.add_service("D", URI.format("D"))
+        self.second.delete_service("A")
+        self.first.add_service("E", URI.format("E"))
+        expected = {"B", "C", "D", "E"}
+        self.assertEqual(set(self.manager().services), expected)
+        self.assertEqual(set(self.first.services), expected)
+
+    def test_reload_only_changed_entries(self):
+        """Test that a reload reports and recompiles only the changed services."""
+        untouched = self.first.get_generator("B")
+        self.second.edit_service("A", "A", URI.format("A").replace("JBSW", "KRSX"))
+        self.second.add_service("C", URI.format("C"))
+        self.assertEqual(self.first.reload_if_changed(), {"A", "C"})
+        self.assertIs(self.first.get_generator("B"), untouched)
+        self.assertEqual(
+            self.first.get_code("A", at=0), self.second.get_code("A", at=0)
+        )
+        self.assertEqual(self.first.search("c"), ["C"])
+        self.assertEqual(self.first.reload_if_changed(), set())
+
+    def test_unchanged_vault_is_not_read(self):
+        """Test that polling an unchanged vault does not read it."""
+        with patch.object(self.first.storage, "load") as load:
+            self.assertEqual(self.first.reload_if_changed(), set())
+            load.assert_not_called()
+
+    def test_pending_changes_survive_reload(self):
+        """Test that changes waiting for autosave win over a reload."""
+        manager = self.manager(autosave_delay=60)
+        manager.add_service("Local", URI.format("Local"))
+        self.second.delete_service("B")
+        self.assertEqual(manager.reload_if_changed(), {"B"})
+        self.assertEqual(set(manager.services), {"A", "Local"})
+        manager.close()
+        self.assertEqual(set(self.manager().services), {"A", "Local"})
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_lock_excludes_other_processes(self):
+        """Test that the vault lock is an advisory lock on the lock file."""
+        with self.first.storage.lock():
+            with open(self.path + ".lock") as file:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        other = FileLock(self.path + ".lock")
+        self.assertTrue(other.acquire(blocking=False))
+        other.release()
+
+
+class TestSharedJournalVault(TestSharedJSONVault):
+    def manager(self, **kwargs):
+        return OTPManager(storage=JournalStorage(self.path, compact_every=3), **kwargs)
+
+    def test_rotation_by_other_process(self):
+        """Test that records are not appended to a journal another process rotated."""
+        for index in range(4):
+            self.second.add_service(f"S{index}", URI.format(index))
+        self.first.add_service("C", URI.format("C"))
+        self.first.close()
+        self.second.close()
+        self.assertEqual(
+            set(self.manager().services), {"A", "B", "C", "S0", "S1", "S2", "S3"}
+        )
+
+
+class TestSharedSQLiteVault(TestSharedJSONVault):
+    def setUp(self):
+        """Set up two managers on the same temporary SQLite vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "services.db")
+        self.first = self.manager()
+        self.first.add_services({"A": URI.format("A"), "B": URI.format("B")})
+        self.second = self.manager()
+
+    def manager(self, **kwargs):
+        return OTPManager(storage=SQLiteStorage(self.path), **kwargs)
+
+    def test_reload_only_changed_entries(self):
+        """Test that names added elsewhere are reported once a search read the names."""
+        self.first.search("")
+        super().test_reload_only_changed_entries()
+
+    def test_reload_before_any_search(self):
+        """Test that a reload without the names reports only the compiled services."""
+        self.first.get_generator("B")
+        self.second.edit_service("B", "B", URI.format("B").replace("JBSW", "KRSX"))
+        self.second.add_service("C", URI.format("C"))
+        self.assertEqual(self.first.reload_if_changed(), {"B"})
+        self.assertIsNone(self.first.search_index)
+        self.assertEqual(self.first.search("c"), ["C"])
+
+    @unittest.skip("SQLite locks the database itself")
+    def test_lock_excludes_other_processes(self):
+        """Test that the vault lock is an advisory lock on the lock file."""
+
+    def test_pending_changes_survive_reload(self):
+        """Test that changes waiting for autosave are kept by a reload."""
+        manager = self.manager(autosave_delay=60)
+        manager.add_service("Local", URI.format("Local"))
+        manager.flush()
+        manager.search("")
+        self.second.delete_service("B")
+        self.assertEqual(manager.reload_if_changed(), {"B"})
+        self.assertEqual(set(manager.services), {"A", "Local"})
+        manager.close()
+
+
+class TestSharedShardedVault(TestSharedJSONVault):
+    def setUp(self):
+        """Set up two managers on the same temporary sharded vault."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "team.shards")
+        self.first = self.manager()
+        self.first.add_services({"A": URI.format("A"), "B": URI.format("B")})
+        self.second = self.manager()
+
+    def manager(self, **kwargs):
+        return OTPManager(storage=ShardedStorage(self.path, shards=4), **kwargs)
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_lock_excludes_other_processes(self):
+        """Test that one lock file in the directory covers all the shards."""
+        with self.first.storage.lock():
+            with open(os.path.join(self.path, "vault.lock")) as file:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+if __name__ == "__main__":
+    unittest.main()
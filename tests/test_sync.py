@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from auth_manager.client import Client
+from auth_manager.daemon import CodeServer
+from auth_manager.manager import OTPManager
+from auth_manager.sync import LocalPeer, SocketPeer, tree_depth
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+class CountingPeer(LocalPeer):
+    """A local peer counting the hashes and records it hands out or takes in."""
+
+    def __init__(self, manager):
+        super().__init__(manager)
+        self.hashes = 0
+        self.records = 0
+
+    def node_hashes(self, depth, level, indices):
+        self.hashes += len(indices)
+        return super().node_hashes(depth, level, indices)
+
+    def leaf_entries(self, depth, indices):
+        entries = super().leaf_entries(depth, indices)
+        self.hashes += len(entries)
+        return entries
+
+    def get_entries(self, names):
+        self.records += len(names)
+        return super().get_entries(names)
+
+    def put_entries(self, entries):
+        self.records += len(entries)
+        super().put_entries(entries)
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        """Set up two vaults sharing services A and B."""
+        self.directory = tempfile.mkdtemp()
+        self.here = self.manager("here.json")
+        self.there = self.manager("there.json")
+        for manager in (self.here, self.there):
+            manager.add_services({name: URI.format(name) for name in ("A", "B")})
+
+    def tearDown(self):
+        """Close the managers and remove the temporary directory."""
+        self.here.close()
+        self.there.close()
+        shutil.rmtree(self.directory)
+
+    def manager(self, name):
+        return OTPManager(data_file=os.path.join(self.directory, name))
+
+    def make_differences(self):
+        self.here.add_service("Mine", URI.format("Mine"))
+        self.there.add_service("Theirs", URI.format("Theirs"))
+        self.here.edit_service("B", "B", URI.format("B-here"))
+        self.there.edit_service("B", "B", URI.format("B-there"))
+
+    def test_diff(self):
+        """Test that diff finds entries on one side and entries that differ."""
+        self.assertFalse(self.here.diff(self.there))
+        self.make_differences()
+        diff = self.here.diff(self.there)
+        self.assertEqual(diff.only_here, ["Mine"])
+        self.assertEqual(diff.only_there, ["Theirs"])
+        self.assertEqual(diff.different, ["B"])
+
+    def test_conflicts_are_reported(self):
+        """Test that by default conflicting entries are listed and left unchanged."""
+        self.make_differences()
+        report = self.here.sync(self.there)
+        self.assertEqual((report.sent, report.received), (["Mine"], ["Theirs"]))
+        self.assertEqual(report.conflicts, ["B"])
+        self.assertEqual(set(self.here.services), {"A", "B", "Mine", "Theirs"})
+        self.assertEqual(self.here.services["B"], URI.format("B-here"))
+        self.assertEqual(self.there.services["B"], URI.format("B-there"))
+        self.assertEqual(self.here.diff(self.there).different, ["B"])
+
+    def test_conflict_policies(self):
+        """Test that ours, theirs and newest settle conflicts on both sides."""
+        self.make_differences()
+        self.here.sync(self.there, conflicts="theirs")
+        self.assertEqual(self.here.services["B"], URI.format("B-there"))
+        self.assertFalse(self.here.diff(self.there))
+
+        self.here.edit_service("B", "B", URI.format("B-here"))
+        self.here.sync(self.there, conflicts="ours")
+        self.assertEqual(self.there.services["B"], URI.format("B-here"))
+
+        self.here.edit_service("B", "B", URI.format("B-old"))
+        self.there.edit_service("B", "B", URI.format("B-new"))
+        os.utime(self.here.data_file, (0, 0))
+        self.here.sync(self.there, conflicts="newest")
+        self.assertEqual(self.here.services["B"], URI.format("B-new"))
+
+        with self.assertRaises(ValueError):
+            self.here.sync(self.there, conflicts="mine")
+
+    def test_sync_with_path(self):
+        """Test that a JSON vault given by its path is synced and written."""
+        self.make_differences()
+        path = os.path.join(self.directory, "there.json")
+        self.there.close()
+        report = self.here.sync(path, conflicts="ours")
+        self.assertEqual(report.received, ["Theirs"])
+        with open(path) as file:
+            self.assertEqual(set(json.load(file)), {"A", "B", "Mine", "Theirs"})
+
+    def test_large_vaults_move_only_the_differences(self):
+        """Test that two 100k vaults with ten differences exchange ten records."""
+        services = {}
+        for index in range(100_000):
+            secret = base64.b32encode(index.to_bytes(10, "big")).decode()
+            services[f"S{index}"] = f"otpauth://totp/S{index}?secret={secret}"
+        theirs = dict(services)
+        for index in range(0, 100_000, 20_000):
+            theirs[f"S{index}"] = URI.format(f"edited-{index}")
+            del services[f"S{index + 1}"]
+        for name, vault in (("big-here.json", services), ("big-there.json", theirs)):
+            with open(os.path.join(self.directory, name), "w") as file:
+                json.dump(vault, file)
+        here = self.manager("big-here.json")
+        there = CountingPeer(self.manager("big-there.json"))
+
+        report = here.sync(there, conflicts="theirs")
+        self.assertEqual(report.transferred, 10)
+        self.assertEqual(len(report.received), 10)
+        self.assertEqual(there.records, 10)
+        # Ten paths down the tree, each comparing one node's children per level
+        # and the few entries of one leaf.
+        depth = tree_depth(100_000)
+        self.assertLess(there.hashes, 10 * (16 * depth + 100))
+        self.assertFalse(here.diff(there.manager))
+        here.close()
+        there.manager.close()
+
+
+class TestSocketSync(unittest.TestCase):
+    def setUp(self):
+        """Serve one vault from a daemon and open another locally."""
+        self.directory = tempfile.mkdtemp()
+        self.served = OTPManager(data_file=os.path.join(self.directory, "served.json"))
+        self.served.add_services({"A": URI.format("A"), "Served": URI.format("S")})
+        self.local = OTPManager(data_file=os.path.join(self.directory, "local.json"))
+        self.local.add_services({"A": URI.format("A"), "Local": URI.format("L")})
+        self.path = os.path.join(self.directory, "daemon.sock")
+        self.server = CodeServer(self.served, self.path)
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.server.start())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the daemon and remove the temporary directory."""
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.served.close()
+        self.local.close()
+        shutil.rmtree(self.directory)
+
+    def test_sync_with_daemon(self):
+        """Test that a vault syncs with the one a daemon serves, over its socket."""
+        with Client(self.path) as client:
+            peer = SocketPeer(client)
+            diff = self.local.diff(peer)
+            self.assertEqual((diff.only_here, diff.only_there), (["Local"], ["Served"]))
+            report = self.local.sync(peer)
+            self.assertEqual((report.sent, report.received), (["Local"], ["Served"]))
+            self.assertFalse(self.local.diff(peer))
+        self.assertEqual(self.served.services["Local"], URI.format("L"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from auth_manager.manager import OTPManager
+from auth_manager.transfer import parse_entries, read_entries
+
+URI = "otpauth://totp/{}?secret=JBSWY3DPEHPK3PXP"
+
+
+class TestImportExport(unittest.TestCase):
+    def setUp(self):
+        """Set up an empty vault in a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+        self.manager = OTPManager(data_file=self.path("services.json"))
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.manager.close()
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_import_uris_reports_bad_lines(self):
+        """Test that valid URIs are imported in one write and bad lines reported."""
+        lines = [
+            "# exported services\n",
+            URI.format("GitHub") + "\n",
+            "\n",
+            "otpauth://hotp/Counter?secret=JBSWY3DPEHPK3PXP\n",
+            "  " + URI.format("Example:alice") + "  \n",
+            "otpauth://totp/?secret=JBSWY3DPEHPK3PXP\n",
+        ]
+        report = self.manager.import_stream(lines)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(
+            report.errors,
+            [
+                (4, "Only otpauth://totp/ URIs are supported"),
+                (6, "No name given and the URI has no label"),
+            ],
+        )
+        self.assertEqual(list(self.manager.services), ["GitHub", "Example:alice"])
+        self.assertEqual(self.manager.writes, 1)
+        self.assertEqual(self.manager.search("ali"), ["Example:alice"])
+
+    def test_import_formats(self):
+        """Test importing NDJSON, CSV and JSON documents, with guessed formats."""
+        ndjson = [
+            json.dumps({"name": "A", "uri": URI.format("a")}),
+            json.dumps({"uri": URI.format("B")}),
+            "{not json",
+        ]
+        report = self.manager.import_stream(ndjson)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([line for line, _ in report.errors], [3])
+
+        csv = ["Name,URI\n", f"C,{URI.format('c')}\n", '"D, Inc",' + URI.format("d")]
+        self.assertEqual(self.manager.import_stream(csv).imported, 2)
+
+        document = json.dumps({"E": URI.format("e"), "F": 42}, indent=4)
+        report = self.manager.import_stream(io.StringIO(document))
+        self.assertEqual((report.imported, report.errors), (1, [(2, "No URI found")]))
+        self.assertEqual(list(self.manager.services), ["A", "B", "C", "D, Inc", "E"])
+
+    def test_unknown_format(self):
+        """Test that an unknown format imports nothing."""
+        with self.assertRaises(ValueError):
+            self.manager.import_stream([URI.format("A")], format="xml")
+        self.assertEqual(len(self.manager.services), 0)
+
+    def test_round_trip(self):
+        """Test that every export format imports back to the same services."""
+        services = {
+            "GitHub": URI.format("GitHub"),
+            "Work, Inc": "otpauth://totp/Work:bob?secret=jbswy3dpehpk3pxp&digits=8",
+            'Quote "me"': URI.format("q") + "&issuer=Q%20Co",
+        }
+        self.manager.add_services(services)
+        for name in ("export.ndjson", "export.json", "export.csv"):
+            with self.subTest(name=name):
+                self.assertEqual(self.manager.export_stream(self.path(name)), 3)
+                other = OTPManager(data_file=self.path(f"{name}.vault.json"))
+                report = other.import_stream(self.path(name))
+                self.assertEqual(report.errors, [])
+                self.assertEqual(other.services, services)
+
+        with open(self.path("services.json")) as vault, open(
+            self.path("export.json")
+        ) as export:
+            self.assertEqual(json.load(export), json.load(vault))
+
+    def test_export_uris_to_a_file_object(self):
+        """Test exporting bare URIs to an open file."""
+        self.manager.add_service("GitHub", URI.format("GitHub"))
+        output = io.StringIO()
+        self.manager.export_stream(output, format="uri")
+        self.assertEqual(output.getvalue(), URI.format("GitHub") + "\n")
+
+
+class TestParseEntries(unittest.TestCase):
+    def test_process_pool_keeps_order(self):
+        """Test that validating across processes gives the inline results in order."""
+        lines = [URI.format(f"S{index}") for index in range(95)]
+        lines[40] = "not a uri"
+        entries = list(read_entries(lines))
+        inline = list(parse_entries(entries, processes=1))
+        pooled = list(parse_entries(entries, processes=2, chunk_size=10))
+        self.assertEqual(pooled, inline)
+        self.assertEqual(inline[40][3], "Not an otpauth URI")
+        self.assertEqual([line for line, *_ in pooled], list(range(1, 96)))
+
+
+if __name__ == "__main__":
+    unittest.main()
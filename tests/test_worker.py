@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+
+from auth_manager.worker import Worker
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        """Start a worker thread."""
+        self.worker = Worker()
+
+    def tearDown(self):
+        """Stop the worker thread."""
+        self.worker.stop()
+
+    def drain_all(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while self.worker.pending and time.monotonic() < deadline:
+            self.worker.drain()
+            time.sleep(0.001)
+
+    def test_jobs_run_in_order_off_the_calling_thread(self):
+        """Test that jobs run in submission order on the worker thread."""
+        results = []
+        for index in range(20):
+            self.worker.submit(
+                lambda index=index: (index, threading.current_thread().name),
+                results.append,
+            )
+        self.drain_all()
+        self.assertEqual([index for index, _ in results], list(range(20)))
+        self.assertTrue(all(name == "auth-manager-worker" for _, name in results))
+
+    def test_callbacks_run_on_the_draining_thread(self):
+        """Test that callbacks only run when the results are drained."""
+        threads = []
+        self.worker.submit(
+            lambda: None, lambda _: threads.append(threading.current_thread())
+        )
+        self.assertEqual(threads, [])
+        self.drain_all()
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(self.worker.pending, 0)
+
+    def test_errors_go_to_the_error_callback(self):
+        """Test that a failing job reports its exception and the worker keeps going."""
+        errors, results = [], []
+        self.worker.submit(lambda: 1 / 0, results.append, errors.append)
+        self.worker.submit(lambda: "ok", results.append)
+        self.drain_all()
+        self.assertIsInstance(errors[0], ZeroDivisionError)
+        self.assertEqual(results, ["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()